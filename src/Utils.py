@@ -1,3 +1,7 @@
+import os
+
+ASSET_MANIFEST_FILE = "manifest.json"  # Written next to the game data by apply_lol_update
+
 def translate(text: str) -> str:
         """stuff like CLASSIC to SUMMONER'S RIFT"""
         if text == "CLASSIC":
@@ -39,3 +43,29 @@ def translate(text: str) -> str:
         elif text == "Doom Bots":
             return "RUBY"
         return text
+
+def build_asset_manifest(gamedata_path: str, patch: str) -> dict:
+        """Index the installed Data Dragon images so card assets resolve without directory scans.
+
+        Returns {"patch": patch, "champion": {image type: {lowercased name: file}},
+        "item": [item ids], "profileicon": [icon ids]}.
+        """
+        def png_ids(folder):
+            path = os.path.join(gamedata_path, patch, "img", folder)
+            if not os.path.isdir(path):
+                return []
+            return sorted(name[:-len(".png")] for name in os.listdir(path) if name.endswith(".png"))
+
+        champions = {}
+        champion_path = os.path.join(gamedata_path, "img", "champion")
+        if os.path.isdir(champion_path):
+            for image_type in sorted(os.listdir(champion_path)):
+                type_path = os.path.join(champion_path, image_type)
+                if os.path.isdir(type_path):
+                    # Only the base skin (<Name>_0.jpg) is used by the cards
+                    champions[image_type] = {
+                        name[:-len("_0.jpg")].lower(): name
+                        for name in sorted(os.listdir(type_path)) if name.endswith("_0.jpg")
+                    }
+
+        return {"patch": patch, "champion": champions, "item": png_ids("item"), "profileicon": png_ids("profileicon")}
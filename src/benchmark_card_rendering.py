@@ -0,0 +1,93 @@
+"""
+Card rendering latency benchmark: the old launch-and-wait path against the pooled
+page + cardReady path, for every card template.
+
+Run inside the bot container (it needs Playwright's Chromium):
+    python -m src.benchmark_card_rendering --runs 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from types import SimpleNamespace
+import jinja2
+from playwright.async_api import async_playwright
+from .cogs.CardGenerator import ASSET_ORIGIN, BrowserPool, CardGenerator
+
+ASSETS_PATH = os.path.join(os.path.dirname(__file__), "assets")
+TEMPLATES_PATH = os.path.join(ASSETS_PATH, "templates")
+
+# (template, initial viewport, old path loaded the content twice)
+CARDS = [
+    ("player_card.html", {'width': 600, 'height': 100}, True),
+    ("champion_card.html", {'width': 600, 'height': 100}, True),
+    ("live_players_card.html", None, False),
+    ("finished_game_card.html", {'width': 1200, 'height': 1000}, False),
+    ("leaderboard_card.html", {'width': 1200, 'height': 850}, False),
+    ("overwatch_player_card.html", {'width': 1180, 'height': 760}, False),
+]
+
+def render_templates(cards: CardGenerator) -> dict:
+    """Render every card with a placeholder context and a real background image."""
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATES_PATH),
+        undefined=jinja2.ChainableUndefined,  # Missing card data renders as empty
+        autoescape=True
+    )
+    background_image = cards.background_url("CLASSIC")
+    theme = {
+        "primary": "rgb(86, 171, 47)",
+        "overlay_start": "rgba(35, 46, 32, 0.9)",
+        "overlay_end": "rgba(24, 31, 22, 0.95)"
+    }
+    return {
+        name: env.get_template(name).render(theme=theme, background_image=background_image)
+        for name, _, _ in CARDS
+    }
+
+async def old_render(cards: CardGenerator, html_content: str, viewport: dict, load_twice: bool) -> bytes:
+    """What every card did before the browser pool: launch, fixed waits, close."""
+    async with async_playwright() as p:
+        browser = await p.chromium.launch()
+        page = await browser.new_page(viewport=viewport) if viewport else await browser.new_page()
+        await page.route(f"{ASSET_ORIGIN}/**", cards.serve_asset)
+        for _ in range(2 if load_twice else 1):
+            await page.set_content(html_content)
+            await page.wait_for_load_state('networkidle')
+            await page.wait_for_timeout(500)
+        screenshot = await page.screenshot(type='png', full_page=True)
+        await browser.close()
+        return screenshot
+
+async def new_render(pool: BrowserPool, html_content: str, viewport: dict) -> bytes:
+    async with pool.page(viewport) as page:
+        await CardGenerator.load_card(page, html_content)
+        return await page.screenshot(type='png', full_page=True)
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+async def main(runs: int):
+    cards = CardGenerator(SimpleNamespace())
+    cards.assets_path = ASSETS_PATH
+    html = render_templates(cards)
+    pool = BrowserPool(1, runs + 1, routes={f"{ASSET_ORIGIN}/**": cards.serve_asset})
+    await pool.start()
+    try:
+        print(f"{'template':<28}{'old median':>12}{'new median':>12}{'old p95':>10}{'new p95':>10}")
+        for name, viewport, load_twice in CARDS:
+            old = [await timed(old_render(cards, html[name], viewport, load_twice)) for _ in range(runs)]
+            new = [await timed(new_render(pool, html[name], viewport)) for _ in range(runs)]
+            p95 = lambda samples: sorted(samples)[max(0, int(len(samples) * 0.95) - 1)]
+            print(f"{name:<28}{statistics.median(old):>10.0f}ms{statistics.median(new):>10.0f}ms"
+                  f"{p95(old):>8.0f}ms{p95(new):>8.0f}ms")
+    finally:
+        await pool.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Renders per template and path")
+    asyncio.run(main(parser.parse_args().runs))
@@ -0,0 +1,315 @@
+"""
+get_player_stats latency benchmark: the old query over participants x matches against the
+single-pass query over player_champion_mode_agg, on a synthetic database.
+
+The database (500k participants by default) is built on the first run and reused after:
+    python -m src.benchmark_player_stats --runs 20
+
+Before timing it checks that both queries return the same PlayerStats for every case.
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sqlite3
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+from .cogs.DatabaseOperations import DatabaseOperations
+from .models import DatabaseStructure
+from .models.models import PlayerStats
+
+PLAYER_NAME = "Benchmark Player"
+PLAYER_PUUID = "benchmark-player"
+PLAYER_SHARE = 0.4  # Share of the matches the benchmarked player is in
+OTHER_PLAYERS = 2000
+GAME_MODES = ["ARAM"] * 7 + ["CLASSIC"] * 2 + ["CHERRY"]
+CHAMPIONS = [
+    "Ahri", "Akali", "Ashe", "Brand", "Caitlyn", "Darius", "Draven", "Ezreal", "Fiora", "Garen",
+    "Graves", "Jax", "Jhin", "Jinx", "Kaisa", "Karthus", "Katarina", "Lux", "Malphite", "MissFortune",
+    "Morgana", "Nasus", "Orianna", "Pyke", "Riven", "Senna", "Sett", "Sona", "Teemo", "Thresh",
+    "Vayne", "Veigar", "Viego", "Xerath", "Yasuo", "Yone", "Zed", "Ziggs", "Zoe", "Zyra",
+]
+
+# (case, champion filter)
+CASES = [
+    ("all champions", None),
+    ("one champion", "Ahri"),
+]
+
+# get_player_stats before player_champion_mode_agg and the single-pass rewrite
+OLD_PLAYER_STATS_SQL = '''
+WITH base_data AS (
+    SELECT p.*, m.game_duration, m.game_creation
+    FROM participants p
+    JOIN matches m ON p.match_id = m.match_id
+    WHERE LOWER(p.riot_id_game_name) = LOWER(?)
+    AND LOWER(m.game_mode) = LOWER(?)
+    {champion_filter}
+),
+champion_stats AS (
+    SELECT
+        champion_name,
+        COUNT(*) as total_games,
+        ROUND(AVG(CASE WHEN wins = 1 THEN 100.0 ELSE 0 END), 1) as winrate,
+        ROUND(AVG(total_damage_to_champions / (game_duration / 60.0)), 0) as avg_damage_per_minute,
+        ROUND(AVG(CASE
+            WHEN deaths = 0 THEN kills + assists
+            ELSE CAST((kills + assists) AS FLOAT) / deaths
+        END), 2) as average_kda,
+        ROUND(AVG(CAST(kills AS FLOAT)), 1) as avg_kills,
+        ROUND(AVG(CAST(deaths AS FLOAT)), 1) as avg_deaths,
+        ROUND(AVG(CAST(assists AS FLOAT)), 1) as avg_assists,
+        SUM(triple_kills) as total_triples,
+        SUM(quadra_kills) as total_quadras,
+        SUM(penta_kills) as total_pentas,
+        ROUND(AVG(CAST(total_time_spent_dead AS FLOAT) / game_duration * 100), 1) as avg_time_dead_pct,
+        ROUND(AVG(vision_score), 1) as avg_vision_score,
+        ROUND(AVG(kill_participation * 100), 1) as avg_kill_participation,
+        ROUND(AVG(total_damage_taken / (game_duration / 60.0)), 0) as avg_damage_taken_per_min,
+        SUM(CASE WHEN first_blood_kill = 1 OR first_blood_assist = 1 THEN 1 ELSE 0 END) as total_first_bloods,
+        SUM(turret_takedowns + inhibitor_takedowns) as total_objectives,
+        ROUND(AVG(gold_earned / (game_duration / 60.0)), 0) as avg_gold_per_min,
+        ROUND(AVG(total_minions_killed / (game_duration / 60.0)), 1) as avg_cs_per_min,
+        MAX(largest_killing_spree) as max_killing_spree,
+        MAX(CASE
+            WHEN deaths = 0 THEN kills + assists
+            ELSE CAST((kills + assists) AS FLOAT) / deaths
+        END) as max_kda,
+        ROUND(AVG(CAST(placement AS FLOAT)), 2) as avg_placement,
+        SUM(CASE WHEN placement = 1 THEN 1 ELSE 0 END) as first_place_count
+    FROM base_data
+    GROUP BY champion_name
+    HAVING total_games >= ?
+),
+overall_stats AS (
+    SELECT
+        ROUND(AVG(kill_participation * 100), 1) as overall_kill_participation,
+        MAX(largest_killing_spree) as overall_max_killing_spree,
+        (SELECT p2.champion_name FROM base_data p2 WHERE p2.largest_killing_spree = (SELECT MAX(largest_killing_spree) FROM base_data)) as max_killing_spree_champion,
+        SUM(CASE WHEN first_blood_kill = 1 OR first_blood_assist = 1 THEN 1 ELSE 0 END) as overall_first_bloods,
+        SUM(turret_takedowns + inhibitor_takedowns) as overall_objectives,
+        ROUND(AVG(gold_earned / (game_duration / 60.0)), 0) as overall_gold_per_min,
+        ROUND(AVG(total_damage_taken / (game_duration / 60.0)), 0) as overall_damage_taken_per_min,
+        ROUND(AVG(total_minions_killed / (game_duration / 60.0)), 1) as overall_cs_per_min,
+        MAX(CASE
+            WHEN deaths = 0 THEN kills + assists
+            ELSE CAST((kills + assists) AS FLOAT) / deaths
+        END) as overall_max_kda,
+        (SELECT p2.champion_name FROM base_data p2 WHERE (CASE WHEN p2.deaths = 0 THEN p2.kills + p2.assists ELSE CAST((p2.kills + p2.assists) AS FLOAT) / p2.deaths END) =
+            (SELECT MAX(CASE WHEN deaths = 0 THEN kills + assists ELSE CAST((kills + assists) AS FLOAT) / deaths END) FROM base_data)) as max_kda_champion,
+        ROUND(AVG(vision_score), 1) as overall_vision_score,
+        (SELECT summoner_level FROM base_data ORDER BY game_creation DESC LIMIT 1) as latest_summoner_level,
+        (SELECT profile_icon FROM base_data ORDER BY game_creation DESC LIMIT 1) as latest_profile_icon
+    FROM base_data
+)
+SELECT
+    champion_name,
+    total_games as champion_games,
+    winrate,
+    avg_damage_per_minute,
+    average_kda,
+    (SELECT COUNT(*) FROM base_data) as total_games_overall,
+    (SELECT COUNT(DISTINCT champion_name) FROM base_data) as unique_champions_played,
+    ROUND(CAST((SELECT COUNT(DISTINCT champion_name) FROM base_data) AS FLOAT) /
+        (SELECT COUNT(*) FROM base_data) * 100, 1) as unique_champ_ratio,
+    (SELECT MIN(game_creation) FROM base_data) as oldest_game,
+    ROUND(CAST((SELECT SUM(game_duration) FROM base_data) AS FLOAT) / 3600, 1) as total_hours_played,
+    total_triples,
+    total_quadras,
+    total_pentas,
+    (SELECT SUM(penta_kills) FROM base_data) as total_pentas_overall,
+    (SELECT ROUND(AVG(CASE WHEN wins = 1 THEN 100.0 ELSE 0 END), 1) FROM base_data) as total_winrate,
+    avg_time_dead_pct,
+    (SELECT overall_vision_score FROM overall_stats) as avg_vision_score,
+    (SELECT overall_kill_participation FROM overall_stats) as avg_kill_participation,
+    (SELECT overall_damage_taken_per_min FROM overall_stats) as avg_damage_taken_per_min,
+    (SELECT overall_first_bloods FROM overall_stats) as total_first_bloods,
+    (SELECT overall_objectives FROM overall_stats) as total_objectives,
+    (SELECT overall_gold_per_min FROM overall_stats) as avg_gold_per_min,
+    avg_cs_per_min,
+    (SELECT overall_max_killing_spree FROM overall_stats) as max_killing_spree,
+    (SELECT overall_max_kda FROM overall_stats) as max_kda,
+    (SELECT max_killing_spree_champion FROM overall_stats) as max_killing_spree_champion,
+    (SELECT max_kda_champion FROM overall_stats) as max_kda_champion,
+    (SELECT latest_summoner_level FROM overall_stats) as summoner_level,
+    (SELECT latest_profile_icon FROM overall_stats) as profile_icon,
+    avg_placement,
+    first_place_count
+FROM champion_stats
+ORDER BY total_games DESC, champion_games DESC
+LIMIT ?;
+'''
+
+# Champions whose games reach the player's max spree / max KDA, the old query names any one of them
+OLD_MAX_CHAMPIONS_SQL = '''
+WITH base_data AS (
+    SELECT p.champion_name, p.largest_killing_spree,
+        CASE WHEN p.deaths = 0 THEN p.kills + p.assists ELSE CAST((p.kills + p.assists) AS FLOAT) / p.deaths END as kda
+    FROM participants p
+    JOIN matches m ON p.match_id = m.match_id
+    WHERE LOWER(p.riot_id_game_name) = LOWER(?)
+    AND LOWER(m.game_mode) = LOWER(?)
+    {champion_filter}
+)
+SELECT
+    champion_name,
+    MAX(largest_killing_spree) = (SELECT MAX(largest_killing_spree) FROM base_data),
+    MAX(kda) = (SELECT MAX(kda) FROM base_data)
+FROM base_data
+GROUP BY champion_name;
+'''
+
+OLD_LATEST_INFO_SQL = '''
+SELECT summoner_level, profile_icon
+FROM participants p
+JOIN matches m ON p.match_id = m.match_id
+WHERE LOWER(p.riot_id_game_name) = LOWER(?)
+ORDER BY m.game_creation DESC
+LIMIT 1;
+'''
+
+def make_participant(rng: random.Random, puuid: str, name: str, index: int, game_mode: str) -> dict:
+    kills, assists = rng.randint(0, 20), rng.randint(0, 30)
+    return {
+        "puuid": puuid, "participantId": index + 1, "teamId": 100 if index < 5 else 200,
+        "riotIdGameName": name, "riotIdTagline": "EUW", "win": index < 5,
+        "championName": rng.choice(CHAMPIONS), "championId": 1,
+        "kills": kills, "deaths": rng.randint(0, 15), "assists": assists,
+        "tripleKills": int(rng.random() < 0.05), "quadraKills": int(rng.random() < 0.01),
+        "pentaKills": int(rng.random() < 0.002), "largestKillingSpree": rng.randint(0, kills),
+        "firstBloodKill": rng.random() < 0.1, "firstBloodAssist": rng.random() < 0.1,
+        "totalDamageDealtToChampions": rng.randint(5000, 60000), "totalDamageTaken": rng.randint(5000, 50000),
+        "goldEarned": rng.randint(6000, 20000), "totalMinionsKilled": rng.randint(20, 300),
+        "totalTimeSpentDead": rng.randint(0, 400), "visionScore": rng.randint(0, 60),
+        "turretTakedowns": rng.randint(0, 5), "inhibitorTakedowns": rng.randint(0, 2),
+        "placement": rng.randint(1, 8) if game_mode == "CHERRY" else 0,
+        "summonerLevel": 100 + index, "profileIcon": index,
+        "challenges": {"killParticipation": rng.random()},
+    }
+
+def make_match(rng: random.Random, number: int, game_creation_ms: int) -> dict:
+    match_id = f"EUW1_{number}"
+    game_mode = rng.choice(GAME_MODES)
+    players = [(f"player-{i}", f"Player {i}") for i in rng.sample(range(OTHER_PLAYERS), 10)]
+    if rng.random() < PLAYER_SHARE:
+        players[rng.randrange(10)] = (PLAYER_PUUID, PLAYER_NAME)
+    return {
+        "metadata": {"matchId": match_id, "dataVersion": "2", "participants": [puuid for puuid, _ in players]},
+        "info": {
+            "gameMode": game_mode, "gameType": "MATCHED_GAME", "gameDuration": rng.randint(900, 2400),
+            "gameCreation": game_creation_ms, "gameStartTimestamp": game_creation_ms,
+            "gameEndTimestamp": game_creation_ms + 1800000, "queueId": 450,
+            "participants": [make_participant(rng, puuid, name, i, game_mode) for i, (puuid, name) in enumerate(players)],
+        },
+    }
+
+async def build_database(db: DatabaseOperations, matches: int):
+    """Create the schema from DatabaseStructure and insert the synthetic matches through insert_matches."""
+    conn = sqlite3.connect(db.db_path)
+    # The schema doc doesn't end every statement with a semicolon, run them one by one
+    for statement in re.split(r"(?=CREATE (?:TABLE|INDEX))", DatabaseStructure.__doc__):
+        if statement.strip():
+            conn.execute(statement.strip().rstrip(";"))
+    conn.execute(
+        "INSERT INTO users (username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active) VALUES (?, ?, ?, ?, ?, ?)",
+        ("benchmark", PLAYER_PUUID, PLAYER_NAME, "EUW", "0", "TRUE")
+    )
+    conn.commit()
+    conn.close()
+    await db.ensure_schema()
+    rng = random.Random(0)
+    start_ms = int(time.time() * 1000) - matches * 3600000
+    for first in range(0, matches, 1000):
+        batch = [make_match(rng, number, start_ms + number * 3600000) for number in range(first, min(first + 1000, matches))]
+        await db.insert_matches(batch)
+        print(f"🔨 {first + len(batch)}/{matches} matches")
+
+def champion_query(query: str, champion: str) -> tuple:
+    """The query and its parameters before min_games and limit, with the old champion filter if any."""
+    if champion:
+        return query.format(champion_filter="AND LOWER(p.champion_name) = LOWER(?)"), [PLAYER_NAME, "ARAM", champion]
+    return query.format(champion_filter=""), [PLAYER_NAME, "ARAM"]
+
+async def old_player_stats(conn: sqlite3.Connection, champion: str) -> list:
+    """What get_player_stats ran before: the raw participants x matches query plus the latest-info lookup."""
+    cursor = conn.cursor()
+    query, params = champion_query(OLD_PLAYER_STATS_SQL, champion)
+    cursor.execute(query, params + [1, 200])
+    results = cursor.fetchall()
+    # The column aliases are the PlayerStats fields, the summoner info came from the separate lookup
+    columns = [description[0] for description in cursor.description]
+    cursor.execute(OLD_LATEST_INFO_SQL, (PLAYER_NAME,))
+    latest_info = cursor.fetchone()
+    return [PlayerStats(**{**dict(zip(columns, row)), "summoner_level": latest_info[0] if latest_info else 0,
+                           "profile_icon": latest_info[1] if latest_info else 0})
+            for row in results]
+
+async def new_player_stats(db: DatabaseOperations, champion: str) -> list:
+    db.cache.clear()  # Time the query, not the cache
+    return await db.get_player_stats(PLAYER_NAME, "ARAM", champion=champion)
+
+def check_same_stats(case: str, old: list, new: list, conn: sqlite3.Connection, champion: str):
+    """
+    Raise unless old and new give the same PlayerStats field by field. The only allowed difference is
+    which champion is named for the max spree / max KDA when several champions reach that maximum.
+    """
+    old_by_champion = {stats.champion_name: vars(stats) for stats in old}
+    new_by_champion = {stats.champion_name: vars(stats) for stats in new}
+    if old_by_champion.keys() != new_by_champion.keys():
+        raise AssertionError(f"{case}: champions differ, old {sorted(old_by_champion)} new {sorted(new_by_champion)}")
+    query, params = champion_query(OLD_MAX_CHAMPIONS_SQL, champion)
+    rows = conn.execute(query, params).fetchall()
+    tied = {
+        "max_killing_spree_champion": {row[0] for row in rows if row[1]},
+        "max_kda_champion": {row[0] for row in rows if row[2]},
+    }
+    for champion_name, old_fields in old_by_champion.items():
+        for field, old_value in old_fields.items():
+            new_value = new_by_champion[champion_name][field]
+            # == so an int and a float max_kda of the same value still match
+            if old_value == new_value or (field in tied and {old_value, new_value} <= tied[field]):
+                continue
+            raise AssertionError(f"{case}: {champion_name}.{field} differs, old {old_value!r} new {new_value!r}")
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+async def main(runs: int, matches: int, db_path: str):
+    db = DatabaseOperations(SimpleNamespace())
+    db.db_path = db.writer.db_path = db.readers.db_path = db_path
+    conn = None
+    try:
+        if not os.path.exists(db_path):
+            print(f"🔨 Building {db_path} with {matches} matches ({matches * 10} participants)")
+            await build_database(db, matches)
+        await db.ensure_schema()
+        conn = sqlite3.connect(db_path)
+        # Only time queries that are proven to give the same PlayerStats
+        for name, champion in CASES:
+            check_same_stats(name, await old_player_stats(conn, champion), await new_player_stats(db, champion), conn, champion)
+            print(f"✅ {name}: old and new PlayerStats match")
+        print(f"{'case':<16}{'old median':>12}{'new median':>12}{'old p95':>10}{'new p95':>10}{'speedup':>9}")
+        for name, champion in CASES:
+            old = [await timed(old_player_stats(conn, champion)) for _ in range(runs)]
+            new = [await timed(new_player_stats(db, champion)) for _ in range(runs)]
+            p95 = lambda samples: sorted(samples)[max(0, int(len(samples) * 0.95) - 1)]
+            print(f"{name:<16}{statistics.median(old):>10.1f}ms{statistics.median(new):>10.1f}ms"
+                  f"{p95(old):>8.1f}ms{p95(new):>8.1f}ms{statistics.median(old) / statistics.median(new):>8.0f}x")
+    finally:
+        if conn:
+            conn.close()
+        db.cog_unload()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="Calls per case and path")
+    parser.add_argument("--matches", type=int, default=50000, help="Synthetic matches, 10 participants each")
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "benchmark_player_stats.db"),
+                        help="Database to build or reuse")
+    args = parser.parse_args()
+    asyncio.run(main(args.runs, args.matches, args.db))
@@ -1,16 +1,177 @@
 import disnake
 from disnake.ext import commands
 import os
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from datetime import datetime
 import math
 from playwright.async_api import async_playwright
 import jinja2
 import io
-import base64
-from typing import Any, Dict, List, Optional
+import json
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from urllib.parse import quote, unquote, urlparse
 from PIL import Image, ImageFilter, ImageDraw
 from ..models.models import PlayerStats
-from ..Utils import translate
+from ..Utils import ASSET_MANIFEST_FILE, build_asset_manifest, translate
+
+CARD_RENDER_CONCURRENCY = 3  # Pages rendering at once, override with CARD_RENDER_CONCURRENCY in .env
+CARD_PAGE_MAX_RENDERS = 50  # Renders before a page is replaced, override with CARD_PAGE_MAX_RENDERS in .env
+DEFAULT_VIEWPORT = {'width': 1280, 'height': 720}  # Playwright's default page size
+CARD_READY_TIMEOUT_MS = 10000  # Max wait for a template's cardReady signal (card_ready.html)
+ASSET_CACHE_MAX_BYTES = 128 * 1024 * 1024  # Image cache cap, override with ASSET_CACHE_MAX_BYTES in .env
+ASSET_CACHE_WARM_CHAMPIONS = 30  # Most-played champions preloaded at startup, override with ASSET_CACHE_WARM_CHAMPIONS in .env
+DEFAULT_PATCH = "15.1.1"  # Used when no game data folder is installed
+# Card pages load images from this made-up origin, page.route answers from the AssetCache.
+# URLs look like ASSET_ORIGIN/<kind>/<patch or ->/<id>, see CardGenerator.asset_url.
+ASSET_ORIGIN = "https://card.assets"
+ASSET_CONTENT_TYPES = {"champion": "image/jpeg"}  # Every other kind is PNG
+
+class AssetCache:
+    """Raw image bytes keyed by (kind, id, patch), LRU-evicted past max_bytes.
+
+    Missing files are cached as None too, so fallbacks don't probe the disk on every render.
+    Only used from the event loop thread, so it needs no locking.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Hashable, Optional[bytes]]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+        """Return the cached value for key, calling loader() to fill it on a miss."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def put(self, key: Hashable, value: Optional[bytes]):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key) or b"")
+        if len(value or b"") > self.max_bytes:
+            return
+        self.entries[key] = value
+        self.size += len(value or b"")
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted or b"")
+            self.evictions += 1
+
+    def invalidate(self):
+        """Drop everything, for when new game data is installed."""
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+class BrowserPool:
+    """One long-lived headless Chromium with a fixed number of warm pages.
+
+    page() hands out a pooled page, so the pool size is also the render concurrency cap.
+    Each page lives in its own context and is replaced after max_renders uses or when a
+    render on it fails, and the browser is relaunched if it disconnects.
+    routes maps URL patterns to page.route handlers installed on every context.
+    """
+
+    def __init__(self, size: int, max_renders: int, routes: Optional[Dict[str, Callable]] = None):
+        self.size = size
+        self.max_renders = max_renders
+        self.routes = routes or {}
+        self.playwright = None
+        self.browser = None
+        self.slots: Optional[asyncio.Queue] = None  # (page or None, renders)
+        self.lock = asyncio.Lock()
+
+    async def _ensure_browser(self):
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        if self.browser is None or not self.browser.is_connected():
+            self.browser = await self.playwright.chromium.launch()
+            print("🌐 Chromium launched for card rendering")
+
+    async def _new_page(self, viewport: dict):
+        async with self.lock:
+            await self._ensure_browser()
+            context = await self.browser.new_context(viewport=viewport)
+        for pattern, handler in self.routes.items():
+            await context.route(pattern, handler)
+        return await context.new_page()
+
+    @staticmethod
+    async def _discard(page):
+        if page is None:
+            return
+        try:
+            await page.context.close()
+        except Exception:
+            pass  # Already gone with a crashed page or a dead browser
+
+    async def start(self):
+        """Launch the browser and open the warm pages, safe to call more than once."""
+        if self.slots is not None:
+            return
+        slots = asyncio.Queue()
+        for _ in range(self.size):
+            slots.put_nowait((await self._new_page(DEFAULT_VIEWPORT), 0))
+        if self.slots is None:
+            self.slots = slots
+        else:
+            while not slots.empty():
+                await self._discard(slots.get_nowait()[0])
+
+    async def close(self):
+        async with self.lock:
+            slots, self.slots = self.slots, None
+            while slots is not None and not slots.empty():
+                await self._discard(slots.get_nowait()[0])
+            try:
+                if self.browser is not None:
+                    await self.browser.close()
+                if self.playwright is not None:
+                    await self.playwright.stop()
+            finally:
+                self.browser = None
+                self.playwright = None
+
+    @asynccontextmanager
+    async def page(self, viewport: Optional[dict] = None):
+        """Borrow a page sized to viewport, waiting while all pages are busy."""
+        if self.slots is None:
+            await self.start()
+        slots = self.slots
+        page, renders = await slots.get()
+        healthy = False
+        try:
+            if page is None or page.is_closed() or renders >= self.max_renders or not self.browser.is_connected():
+                await self._discard(page)
+                page, renders = None, 0
+                page = await self._new_page(viewport or DEFAULT_VIEWPORT)
+            else:
+                await page.set_viewport_size(viewport or DEFAULT_VIEWPORT)
+            yield page
+            healthy = not page.is_closed()
+        finally:
+            if not healthy:
+                # Don't hand a page that failed mid-render to the next card
+                await self._discard(page)
+                page, renders = None, 0
+            slots.put_nowait((page, renders + 1))
 
 
 class CardGenerator(commands.Cog):
@@ -18,8 +179,18 @@ class CardGenerator(commands.Cog):
         self.bot = bot
         self.template_path = "/app/src/assets/templates"
         self.assets_path = "/app/src/assets"
-        self._arena_augment_icon_cache = {}  # id -> base64
+        self._arena_augment_icon_cache: Dict[str, bytes] = {}  # id -> icon bytes
         self._ow_hero_portraits_cache: Dict[str, str] = {}
+        # Warm Chromium pages shared by every card, pool size caps concurrent renders
+        self.browser_pool = BrowserPool(
+            int(os.getenv("CARD_RENDER_CONCURRENCY", CARD_RENDER_CONCURRENCY)),
+            int(os.getenv("CARD_PAGE_MAX_RENDERS", CARD_PAGE_MAX_RENDERS)),
+            routes={f"{ASSET_ORIGIN}/**": self.serve_asset}
+        )
+        # Card images served to the pages by URL, filled on first use and warmed at startup
+        self.assets = AssetCache(int(os.getenv("ASSET_CACHE_MAX_BYTES", ASSET_CACHE_MAX_BYTES)))
+        self.asset_manifest: Optional[dict] = None  # See get_asset_manifest
+        self.warm_task: Optional[asyncio.Task] = None
         
         # Define gamemode color themes
         self.gamemode_themes = {
@@ -65,6 +236,175 @@ class CardGenerator(commands.Cog):
             loader=jinja2.FileSystemLoader(self.template_path),
             autoescape=True
         )
+
+    async def cog_load(self):
+        """Start the browser pool and warm the asset cache as soon as the cog is loaded."""
+        try:
+            await self.browser_pool.start()
+        except Exception as e:
+            # Cards still work, the pool retries on the first render
+            print(f"❌ Could not start the card browser pool: {e}")
+        self.warm_task = asyncio.ensure_future(self.warm_asset_cache())
+
+    def cog_unload(self):
+        """Close the browser pool when the cog is unloaded or reloaded."""
+        if self.warm_task is not None:
+            self.warm_task.cancel()
+        self.bot.loop.create_task(self.browser_pool.close())
+
+    def invalidate_assets(self):
+        """Forget every cached image and the asset manifest, then warm the cache again.
+
+        Called once apply_lol_update has installed new game data.
+        """
+        self.assets.invalidate()
+        self.asset_manifest = None
+        self._arena_augment_icon_cache.clear()
+        if self.warm_task is not None:
+            self.warm_task.cancel()
+        self.warm_task = asyncio.ensure_future(self.warm_asset_cache())
+
+    async def warm_asset_cache(self):
+        """Preload every gamemode background and the most-played champions' card images."""
+        await self.bot.wait_until_ready()
+        champions = []
+        db_ops = self.bot.get_cog("DatabaseOperations")
+        if db_ops:
+            try:
+                champions = await db_ops.get_most_played_champions(
+                    int(os.getenv("ASSET_CACHE_WARM_CHAMPIONS", ASSET_CACHE_WARM_CHAMPIONS))
+                )
+            except Exception as e:
+                print(f"Error loading most-played champions for the asset cache: {e}")
+
+        self.get_asset_manifest()  # Loaded here, not from the worker thread below
+        images_path = os.path.join(self.assets_path, "images")
+        keys = [
+            ("background", file_name[:-len(".png")], None)
+            for file_name in (os.listdir(images_path) if os.path.isdir(images_path) else [])
+            if file_name.endswith(".png")
+        ]
+        keys += [("champion", f"{image_type}/{champion}", None) for champion in champions for image_type in ("tiles", "centered")]
+
+        # Disk reads happen off the event loop, the cache is only filled back on it
+        loaded = await asyncio.to_thread(lambda: [(key, self._load_asset(key)) for key in keys])
+        for key, value in loaded:
+            self.assets.put(key, value)
+        print(f"🖼️ Asset cache warmed with {len(loaded)} images ({self.assets.size // 1024} KiB)")
+
+    @staticmethod
+    def _read_file(path: str) -> Optional[bytes]:
+        """Contents of the file at path, or None if it can't be read."""
+        try:
+            with open(path, "rb") as image_file:
+                return image_file.read()
+        except OSError:
+            return None
+
+    def _find_latest_patch(self) -> str:
+        gamedata_path = os.path.join(self.assets_path, "gamedata")
+        try:
+            patch_folders = [d for d in os.listdir(gamedata_path) if os.path.isdir(os.path.join(gamedata_path, d)) and d not in ['img']]
+        except OSError:
+            return DEFAULT_PATCH
+        try:
+            patch_folders.sort(key=lambda v: [int(x) for x in v.split('.')], reverse=True)
+        except ValueError:
+            patch_folders.sort()
+        return patch_folders[0] if patch_folders else DEFAULT_PATCH
+
+    def get_asset_manifest(self) -> dict:
+        """Index of the installed game data images, read once until the assets are invalidated.
+
+        apply_lol_update writes it (see build_asset_manifest). Game data installed before
+        manifests existed is indexed here instead, once. Id lists are turned into sets.
+        """
+        if self.asset_manifest is None:
+            gamedata_path = os.path.join(self.assets_path, "gamedata")
+            try:
+                with open(os.path.join(gamedata_path, ASSET_MANIFEST_FILE)) as manifest_file:
+                    manifest = json.load(manifest_file)
+            except (OSError, ValueError):
+                manifest = build_asset_manifest(gamedata_path, self._find_latest_patch())
+            self.asset_manifest = {
+                "patch": manifest["patch"],
+                "champion": manifest["champion"],
+                "item": set(manifest["item"]),
+                "profileicon": set(manifest["profileicon"]),
+            }
+        return self.asset_manifest
+
+    def get_latest_patch(self) -> str:
+        """Installed game data patch, from the asset manifest."""
+        return self.get_asset_manifest()["patch"]
+
+    def _gamedata_file(self, folder: str, asset_id: str, patch: str) -> Optional[str]:
+        """Path of <patch>/img/<folder>/<asset_id>.png, None if the manifest says it isn't installed."""
+        manifest = self.get_asset_manifest()
+        if patch == manifest["patch"] and asset_id not in manifest[folder]:
+            return None
+        return os.path.join(self.assets_path, "gamedata", patch, "img", folder, f"{asset_id}.png")
+
+    def _load_asset(self, key: tuple) -> Optional[bytes]:
+        """Read the image for an asset cache key, None if it doesn't exist."""
+        kind, asset_id, patch = key
+        if kind == "background":
+            return self._read_file(os.path.join(self.assets_path, "images", f"{asset_id}.png"))
+        if kind in ("profileicon", "item"):
+            path = self._gamedata_file(kind, asset_id, patch)
+            if kind == "profileicon" and path is None:
+                # Fall back to the default icon 0
+                path = self._gamedata_file(kind, "0", patch)
+            return self._read_file(path) if path else None
+        if kind == "champion":
+            image_type, champion_name = asset_id.split("/", 1)
+            try:
+                return self._find_champion_image(champion_name, image_type)
+            except ValueError:
+                return None
+        if kind == "augment":
+            return self._arena_augment_icon_cache.get(asset_id)
+        return None
+
+    def get_asset(self, key: tuple) -> Optional[bytes]:
+        return self.assets.get(key, lambda: self._load_asset(key))
+
+    def asset_url(self, kind: str, asset_id, patch: Optional[str] = None) -> Optional[str]:
+        """URL a card page loads an asset from, None if the asset doesn't exist."""
+        asset_id = str(asset_id)
+        if self.get_asset((kind, asset_id, patch)) is None:
+            return None
+        return f"{ASSET_ORIGIN}/{kind}/{patch or '-'}/{quote(asset_id, safe='')}"
+
+    async def serve_asset(self, route):
+        """page.route handler for ASSET_ORIGIN, answers straight from the asset cache."""
+        parts = urlparse(route.request.url).path.lstrip("/").split("/", 2)
+        body = None
+        if len(parts) == 3:
+            kind, patch, asset_id = parts
+            body = self.get_asset((kind, unquote(asset_id), None if patch == "-" else patch))
+        if body is None:
+            await route.fulfill(status=404)
+            return
+        await route.fulfill(status=200, body=body, content_type=ASSET_CONTENT_TYPES.get(kind, "image/png"))
+
+    def background_url(self, gamemode: str) -> Optional[str]:
+        """Background for a gamemode, None if there is no image for it."""
+        return self.asset_url("background", gamemode)
+
+    def profile_icon_url(self, icon_id, patch: Optional[str] = None) -> Optional[str]:
+        """Profile icon, falling back to icon 0, None if neither exists."""
+        return self.asset_url("profileicon", icon_id, patch or self.get_latest_patch())
+
+    def item_icon_url(self, item_id: int, patch: Optional[str] = None) -> Optional[str]:
+        """Item icon, None if it doesn't exist."""
+        return self.asset_url("item", item_id, patch or self.get_latest_patch())
+
+    @staticmethod
+    async def load_card(page, html_content: str):
+        """Set the card HTML and wait once for the template's fonts-and-images-ready signal."""
+        await page.set_content(html_content)
+        await page.wait_for_function("window.cardReady === true", timeout=CARD_READY_TIMEOUT_MS)
             
     def format_percentage(self, value: float) -> str:
         """Format percentage value, removing decimal if it ends in .0"""
@@ -126,42 +466,39 @@ class CardGenerator(commands.Cog):
         ]
         return list(set(variations))  # Remove duplicates
 
-    def load_champion_image(self, champion_name, image_type="tiles"):
+    def champion_image_url(self, champion_name, image_type="tiles"):
         """
-        Load champion image with support for different image types/paths
+        URL of a champion image with support for different image types/paths
         image_type can be: tiles, centered, splash
         """
         # If champion_name is None or empty, use Zed as default
         if not champion_name:
             champion_name = "Zed"
-            
+        url = self.asset_url("champion", f"{image_type}/{champion_name}")
+        if url is None:
+            raise ValueError(f"Could not find champion image for {champion_name} in {image_type} and fallback to Zed failed")
+        return url
+
+    def _find_champion_image(self, champion_name, image_type):
+        """Read a champion image, resolving its file through the asset manifest, then Zed."""
+        # The manifest keys files by lowercased champion name
+        files = self.get_asset_manifest()["champion"].get(image_type, {})
         name_variations = self.format_champion_name(translate(champion_name))
         
-        # Try to load the requested champion image
-        for name in name_variations:
-            try:
-                champion_image_path = os.path.join(self.assets_path, "gamedata", "img", "champion", image_type, f"{name}_0.jpg")
-                if os.path.exists(champion_image_path):
-                    with open(champion_image_path, "rb") as image_file:
-                        return base64.b64encode(image_file.read()).decode()
-            except Exception:
-                continue
-        
-        # If the requested champion image is not found, try to load Zed as fallback
-        try:
-            zed_image_path = os.path.join(self.assets_path, "gamedata", "img", "champion", image_type, "Zed_0.jpg")
-            if os.path.exists(zed_image_path):
-                with open(zed_image_path, "rb") as image_file:
-                    return base64.b64encode(image_file.read()).decode()
-        except Exception:
-            pass
+        # Try to load the requested champion image, then Zed as fallback
+        for name in name_variations + ["Zed"]:
+            file_name = files.get(name.lower())
+            if file_name:
+                image = self._read_file(os.path.join(self.assets_path, "gamedata", "img", "champion", image_type, file_name))
+                if image is not None:
+                    return image
             
         # If all else fails, raise an error
         raise ValueError(f"Could not find champion image for {champion_name} in {image_type} and fallback to Zed failed")
 
 
-    async def _load_arena_augment_icon(self, augment_id: int, latest_patch: str) -> str | None:
-        """Return base64 icon for an Arena augment id. Try local numeric icons first, then CommunityDragon mapping."""
+    async def _load_arena_augment_icon(self, augment_id: int, latest_patch: str) -> bytes | None:
+        """Return the icon for an Arena augment id. Try local numeric icons first, then CommunityDragon mapping."""
 
         # 2) CommunityDragon mapping
         riot_ops = self.bot.get_cog("RiotAPIOperations")
@@ -176,16 +513,13 @@ class CardGenerator(commands.Cog):
             return None
 
         # Build small icon URL
-        import aiohttp
         icon_name = icon_base
         icon_url = f"https://raw.communitydragon.org/latest/game/assets/ux/cherry/augments/icons/{icon_name}"
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(icon_url, timeout=10) as resp:
-                    if resp.status == 200:
-                        content = await resp.read()
-                        return base64.b64encode(content).decode("utf-8")
+            async with riot_ops.get_session().get(icon_url, timeout=10) as resp:
+                if resp.status == 200:
+                    return await resp.read()
         except Exception:
             return None
         return None
@@ -207,10 +541,10 @@ class CardGenerator(commands.Cog):
             winrate = stat.winrate
             kda = stat.average_kda
             
-            # Read and encode champion images with different types
-            encoded_champion_image = self.load_champion_image(stat.champion_name, "centered")
-            max_killing_spree_champion = self.load_champion_image(stat.max_killing_spree_champion, "centered")
-            max_kda_champion = self.load_champion_image(stat.max_kda_champion, "centered")
+            # Champion image URLs with different types
+            champion_image = self.champion_image_url(stat.champion_name, "centered")
+            max_killing_spree_champion = self.champion_image_url(stat.max_killing_spree_champion, "centered")
+            max_kda_champion = self.champion_image_url(stat.max_kda_champion, "centered")
             
             champions.append({
                 'name': stat.champion_name[:15],
@@ -222,7 +556,7 @@ class CardGenerator(commands.Cog):
                 'winrate_color': self.get_winrate_color(winrate),
                 'kda': f"{kda:.2f}",
                 'kda_color': self.get_kda_color(kda, theme),
-                'image': encoded_champion_image,
+                'image': champion_image,
                 'max_killing_spree': stat.max_killing_spree,
                 'max_kda': f"{stat.max_kda:.1f}",
                 'max_killing_spree_image': max_killing_spree_champion,
@@ -235,22 +569,11 @@ class CardGenerator(commands.Cog):
                 'avg_damage_taken_per_min': f"{stat.avg_damage_taken_per_min:.0f}"
             })
         
-        # Read and encode background image
-        bg_image_path = os.path.join(self.assets_path, "images", f"{gamemode}.png")
-        try:
-            with open(bg_image_path, "rb") as image_file:
-                encoded_image = base64.b64encode(image_file.read()).decode()
-        except FileNotFoundError:
-            encoded_image = None
+        # Background image URL
+        background_image = self.background_url(gamemode)
             
-        # Read and encode profile icon - find latest patch folder
-        gamedata_path = os.path.join(self.assets_path, "gamedata")
-        patch_folders = [d for d in os.listdir(gamedata_path) if os.path.isdir(os.path.join(gamedata_path, d)) and d not in ['img']]
-        latest_patch = sorted(patch_folders)[0] if patch_folders else "15.1.1"  # Fallback to 15.1.1 if no folders found
-        
-        profile_icon_path = os.path.join(self.assets_path, "gamedata", latest_patch, "img", "profileicon", f"{data[0].profile_icon}.png")
-        with open(profile_icon_path, "rb") as image_file:
-            encoded_profile_icon = base64.b64encode(image_file.read()).decode()
+        # Profile icon URL from the latest patch folder
+        profile_icon = self.profile_icon_url(data[0].profile_icon)
         
         # Render template
         template = self.jinja_env.get_template('player_card.html')
@@ -264,25 +587,15 @@ class CardGenerator(commands.Cog):
             total_winrate=total_winrate,
             total_winrate_color=self.get_winrate_color(total_winrate),
             champions=champions,
-            background_image=encoded_image,
-            profile_icon=encoded_profile_icon,
+            background_image=background_image,
+            profile_icon=profile_icon,
             summoner_level=data[0].summoner_level
         )
         
         # Use playwright to render HTML to image
-        async with async_playwright() as p:
-            browser = await p.chromium.launch()
-            page = await browser.new_page(viewport={'width': 600, 'height': 100})
-            await page.set_content(html_content)
-            await page.wait_for_load_state('networkidle')
-            
-            # Wait for background image and fonts to load
-            await page.wait_for_timeout(500)
-            
-            # Set content and wait for it to load
-            await page.set_content(html_content)
-            await page.wait_for_load_state('networkidle')
-            await page.wait_for_timeout(500)
+        async with self.browser_pool.page({'width': 600, 'height': 100}) as page:
+            # Set content and wait for fonts and images to be ready
+            await self.load_card(page, html_content)
 
             # Get page dimensions
             dimensions = await page.evaluate('''() => {
@@ -301,8 +614,6 @@ class CardGenerator(commands.Cog):
                 full_page=True
             )
 
-            await browser.close()
-
             # Convert bytes to BytesIO and process image
             img_byte_arr = io.BytesIO(screenshot)
             image = Image.open(img_byte_arr)
@@ -329,9 +640,7 @@ class CardGenerator(commands.Cog):
 
     async def generate_live_players_card(self, players: list) -> disnake.File:
         """Generate a card showing all currently active players."""
-        async with async_playwright() as p:
-            browser = await p.chromium.launch()
-            page = await browser.new_page()
+        async with self.browser_pool.page() as page:
 
             # Create Jinja2 environment
             env = jinja2.Environment(
@@ -353,42 +662,23 @@ class CardGenerator(commands.Cog):
             except Exception:
                 pass
 
-            # Find latest patch folder for profile icons
-            gamedata_path = os.path.join(self.assets_path, "gamedata")
-            patch_folders = [d for d in os.listdir(gamedata_path) if os.path.isdir(os.path.join(gamedata_path, d)) and d not in ['img']]
-            latest_patch = sorted(patch_folders)[0] if patch_folders else "15.1.1"
-
             # Prepare player data with champion icons and stats
             is_arena = gamemode in ['CHERRY', 'ARENA']
             for player in players:
                 # Load champion images
-                player['champion_icon'] = self.load_champion_image(player['champion'], "tiles")
+                player['champion_icon'] = self.champion_image_url(player['champion'], "tiles")
                 # Background image behind summoner info uses centered crop
-                player['champion_centered'] = self.load_champion_image(player['champion'], "centered")
+                player['champion_centered'] = self.champion_image_url(player['champion'], "centered")
                 # Background image behind summoner info uses centered crop
-                player['champion_splash'] = self.load_champion_image(player['champion'], "splash")
+                player['champion_splash'] = self.champion_image_url(player['champion'], "splash")
                 
                 stats = player['stats']
-                # Read and encode profile icon
+                # Profile icon URL
                 profile_icon_id = stats.profile_icon
                 
-                # Find latest patch folder for profile icons
-                gamedata_path = os.path.join(self.assets_path, "gamedata")
-                patch_folders = [d for d in os.listdir(gamedata_path) if os.path.isdir(os.path.join(gamedata_path, d)) and d not in ['img']]
-                latest_patch = sorted(patch_folders)[0] if patch_folders else "15.1.1"
-                
-                # Try to load the profile icon
-                profile_icon_path = os.path.join(self.assets_path, "gamedata", latest_patch, "img", "profileicon", f"{profile_icon_id}.png")
-                try:
-                    if os.path.exists(profile_icon_path):
-                        with open(profile_icon_path, "rb") as img_file:
-                            player['profile_icon'] = base64.b64encode(img_file.read()).decode('utf-8')
-                    else:
-                        # Try default profile icon 0
-                        default_icon_path = os.path.join(self.assets_path, "gamedata", latest_patch, "img", "profileicon", "0.png")
-                        with open(default_icon_path, "rb") as img_file:
-                            player['profile_icon'] = base64.b64encode(img_file.read()).decode('utf-8')
-                except FileNotFoundError:
+                # Try to load the profile icon, falling back to the default icon 0
+                player['profile_icon'] = self.profile_icon_url(profile_icon_id)
+                if player['profile_icon'] is None:
                     # If even default icon is missing, use an empty string
                     print(f"Warning: Could not find profile icon {profile_icon_id} or default icon")
                     player['profile_icon'] = ""
@@ -429,13 +719,8 @@ class CardGenerator(commands.Cog):
                     player['winrate_color'] = (128, 128, 128)  # Gray for N/A
                     player['kda_color'] = (128, 128, 128)  # Gray for N/A
 
-            # Read and encode background image
-            bg_image_path = os.path.join(self.assets_path, "images", f"{gamemode}.png")
-            try:
-                with open(bg_image_path, "rb") as image_file:
-                    background_image = base64.b64encode(image_file.read()).decode()
-            except FileNotFoundError:
-                background_image = None
+            # Background image URL
+            background_image = self.background_url(gamemode)
 
             # Render template
             is_doom_bots = gamemode == 'RUBY'
@@ -449,10 +734,8 @@ class CardGenerator(commands.Cog):
                 is_doom_bots=is_doom_bots
             )
 
-            # Set content and wait for it to load
-            await page.set_content(html_content)
-            await page.wait_for_load_state('networkidle')
-            await page.wait_for_timeout(500)
+            # Set content and wait for fonts and images to be ready
+            await self.load_card(page, html_content)
 
             # Get page dimensions
             dimensions = await page.evaluate('''() => {
@@ -471,8 +754,6 @@ class CardGenerator(commands.Cog):
                 full_page=True
             )
 
-            await browser.close()
-            
             # Return as discord file
             return disnake.File(fp=io.BytesIO(screenshot), filename='live_players.png')
 
@@ -840,12 +1121,8 @@ class CardGenerator(commands.Cog):
             top_heroes=top_heroes,
         )
 
-        async with async_playwright() as p:
-            browser = await p.chromium.launch()
-            page = await browser.new_page(viewport={"width": 1180, "height": 760})
-            await page.set_content(html_content)
-            await page.wait_for_load_state("networkidle")
-            await page.wait_for_timeout(500)
+        async with self.browser_pool.page({"width": 1180, "height": 760}) as page:
+            await self.load_card(page, html_content)
 
             dimensions = await page.evaluate("""() => ({
                 width: document.documentElement.scrollWidth,
@@ -854,12 +1131,19 @@ class CardGenerator(commands.Cog):
             await page.set_viewport_size(dimensions)
 
             screenshot = await page.screenshot(type="png", full_page=True)
-            await browser.close()
 
             return disnake.File(fp=io.BytesIO(screenshot), filename="overwatch_player_card.png")
 
     async def generate_finished_game_card(self, game_id):
         """Generate individual cards for each tracked player in a finished game."""
+        return [card async for card in self.iter_finished_game_cards(game_id)]
+
+    async def iter_finished_game_cards(self, game_id):
+        """Yield each tracked player's finished game card as soon as it is rendered.
+
+        The cards render concurrently on pooled pages, so the browser pool size
+        (CARD_RENDER_CONCURRENCY) bounds how many run at once.
+        """
         db_ops = self.bot.get_cog("DatabaseOperations")
         riot_ops = self.bot.get_cog("RiotAPIOperations")
         
@@ -900,36 +1184,21 @@ class CardGenerator(commands.Cog):
         
         # Process all participants for team stats
         for p in participants:
-            # Load champion icon using the load_champion_image method
+            # Load champion icon using the champion_image_url method
             champion = p.get('champion_name', 'Zed')
             try:
-                champion_icon = self.load_champion_image(champion, "tiles")
+                champion_icon = self.champion_image_url(champion, "tiles")
             except ValueError as e:
                 print(f"Warning: Could not load champion image for {champion}: {e}")
                 # Try with Zed as fallback
-                champion_icon = self.load_champion_image("Zed", "tiles")
+                champion_icon = self.champion_image_url("Zed", "tiles")
             
             # Load profile icon
             profile_icon_id = p.get('profile_icon', 0)
             
-            # Find latest patch folder for profile icons
-            gamedata_path = os.path.join(self.assets_path, "gamedata")
-            patch_folders = [d for d in os.listdir(gamedata_path) if os.path.isdir(os.path.join(gamedata_path, d)) and d not in ['img']]
-            latest_patch = sorted(patch_folders)[0] if patch_folders else "15.1.1"
-            
-            # Try to load the profile icon
-            profile_icon_path = os.path.join(self.assets_path, "gamedata", latest_patch, "img", "profileicon", f"{profile_icon_id}.png")
-            
-            try:
-                if os.path.exists(profile_icon_path):
-                    with open(profile_icon_path, "rb") as img_file:
-                        profile_icon_img = base64.b64encode(img_file.read()).decode('utf-8')
-                else:
-                    # Try default profile icon 0
-                    default_icon_path = os.path.join(self.assets_path, "gamedata", latest_patch, "img", "profileicon", "0.png")
-                    with open(default_icon_path, "rb") as img_file:
-                        profile_icon_img = base64.b64encode(img_file.read()).decode('utf-8')
-            except FileNotFoundError:
+            # Try to load the profile icon, falling back to the default icon 0
+            profile_icon_img = self.profile_icon_url(profile_icon_id)
+            if profile_icon_img is None:
                 # If even default icon is missing, use an empty string
                 print(f"Warning: Could not find profile icon {profile_icon_id} or default icon")
                 profile_icon_img = ""
@@ -960,63 +1229,46 @@ class CardGenerator(commands.Cog):
         tracked_players = []
         for p in participants:
             if p['puuid'] in tracked_summoner_ids:
-                # Load champion splash art for banner using the load_champion_image method
+                # Load champion splash art for banner using the champion_image_url method
                 champion = p.get('champion_name', 'Zed')
                 try:
-                    p['champion_splash'] = self.load_champion_image(champion, "centered")
+                    p['champion_splash'] = self.champion_image_url(champion, "centered")
                 except ValueError as e:
                     print(f"Warning: Could not load champion splash for {champion}: {e}")
                     # Try with Zed as fallback
-                    p['champion_splash'] = self.load_champion_image("Zed", "centered")
+                    p['champion_splash'] = self.champion_image_url("Zed", "centered")
 
                 # Load built item icons (including trinket) for banner display
-                try:
-                    gamedata_path = os.path.join(self.assets_path, "gamedata")
-                    patch_folders = [
-                        d for d in os.listdir(gamedata_path)
-                        if os.path.isdir(os.path.join(gamedata_path, d)) and d not in ['img']
-                    ]
-                    latest_patch = sorted(patch_folders)[0] if patch_folders else "15.1.1"
-                except Exception:
-                    latest_patch = "15.1.1"
-
-                items_b64 = []
+                latest_patch = self.get_latest_patch()
+                item_icons = []
                 # item0..item5 are inventory items; item6 is trinket (exclude)
                 for i in range(0, 6):
                     item_id = int(p.get(f'item{i}', 0) or 0)
                     if item_id <= 0:
                         continue
-                    item_path = os.path.join(
-                        self.assets_path, "gamedata", latest_patch, "img", "item", f"{item_id}.png"
-                    )
-                    try:
-                        if os.path.exists(item_path):
-                            with open(item_path, "rb") as img_file:
-                                items_b64.append(base64.b64encode(img_file.read()).decode('utf-8'))
-                    except Exception:
-                        continue
+                    item_icon = self.item_icon_url(item_id, latest_patch)
+                    if item_icon:
+                        item_icons.append(item_icon)
 
                 # Use key name that won't collide with dict.items() in Jinja
-                p['built_items'] = items_b64
+                p['built_items'] = item_icons
 
                 # Load Arena augments icons if present, show above items
-                augments_b64 = []
+                augment_icons = []
                 for i in range(1, 5):
                     aug_id = int(p.get(f'player_augment{i}', 0) or 0)
                     if aug_id <= 0:
                         continue
-                    # Cache per augment id across players in this render
-                    cache_hit = self._arena_augment_icon_cache.get(aug_id)
-                    if cache_hit:
-                        augments_b64.append(cache_hit)
-                        continue
-                    # Try local numeric, then CommunityDragon
-                    icon_b64 = await self._load_arena_augment_icon(aug_id, latest_patch)
-                    if icon_b64:
-                        self._arena_augment_icon_cache[aug_id] = icon_b64
-                        augments_b64.append(icon_b64)
-                if augments_b64:
-                    p['arena_augments'] = augments_b64
+                    # Cache per augment id, the card page loads it back through serve_asset
+                    if str(aug_id) not in self._arena_augment_icon_cache:
+                        # Try local numeric, then CommunityDragon
+                        icon = await self._load_arena_augment_icon(aug_id, latest_patch)
+                        if icon:
+                            self._arena_augment_icon_cache[str(aug_id)] = icon
+                    if str(aug_id) in self._arena_augment_icon_cache:
+                        augment_icons.append(self.asset_url("augment", aug_id))
+                if augment_icons:
+                    p['arena_augments'] = augment_icons
                 
                 # Get player stats for comparison
                 player_stats = await db_ops.get_player_stats(p['riot_id_game_name'], gamemode, champion)
@@ -1246,18 +1498,10 @@ class CardGenerator(commands.Cog):
         formatted_duration = f"{minutes}:{seconds:02d}"
     
         
-        # Default to Summoner's Rift if gamemode not found
-        background_file = gamemode+".png";
-        background_path = os.path.join(self.assets_path, "images", background_file)
-        
-        # Read and encode background image
-        try:
-            with open(background_path, "rb") as img_file:
-                background_image = base64.b64encode(img_file.read()).decode('utf-8')
-        except FileNotFoundError:
-            # If file not found, set background_image to None
+        # Background image URL
+        background_image = self.background_url(gamemode)
+        if background_image is None:
             print(f"Warning: Could not find background image for gamemode {gamemode}")
-            background_image = None
         
         # Prepare theme colors
         theme = self.gamemode_themes.get(gamemode, {
@@ -1275,75 +1519,78 @@ class CardGenerator(commands.Cog):
         except Exception:
             queue_name = None
 
-        # List to store individual player cards
-        player_cards = []
-        
         # Generate individual cards for each tracked player
-        async with async_playwright() as p:
-            browser = await p.chromium.launch()
+        # Load the template
+        template_loader = jinja2.FileSystemLoader(searchpath="src/assets/templates")
+        template_env = jinja2.Environment(
+            loader=template_loader,
+            undefined=jinja2.Undefined  # Use default behavior for undefined values
+        )
+        template = template_env.get_template("finished_game_card.html")
+        
+        async def render_player_card(player, html_content):
+            try:
+                async with self.browser_pool.page({"width": 1200, "height": 1000}) as page:
+                    # Set the content in the page
+                    await self.load_card(page, html_content)
+                    
+                    # Take a screenshot
+                    screenshot = await page.screenshot(full_page=True)
+            except Exception as e:
+                print(f"Error rendering finished game card for player {player['name']}: {e}")
+                return None
             
-            # Load the template
-            template_loader = jinja2.FileSystemLoader(searchpath="src/assets/templates")
-            template_env = jinja2.Environment(
-                loader=template_loader,
-                undefined=jinja2.Undefined  # Use default behavior for undefined values
+            # Create a Discord file for this player
+            player_name = player['name'].replace(' ', '_')
+            return disnake.File(
+                io.BytesIO(screenshot), 
+                filename=f"{player_name}_{player['champion']}_game.png"
             )
-            template = template_env.get_template("finished_game_card.html")
-            
-            for player in tracked_players:
-                # Create a page for this player's card
-                page = await browser.new_page(viewport={"width": 1200, "height": 1000})
-                
-                # Render the template with only this player's data
-                try:
-                    html_content = template.render(
-                        tracked_players=[player],  # Only include the current player
-                        team1=team1,
-                        team2=team2,
-                        team1_kills=team1_kills,
-                        team2_kills=team2_kills,
-                        team1_gold=team1_gold or 0,
-                        team2_gold=team2_gold or 0,
-                        team1_damage=team1_damage or 0,
-                        team2_damage=team2_damage or 0,
-                        gamemode=gamemode or "Unknown",
-                        gamemode_display=translate(gamemode or "Unknown"),
-                        queue_name=queue_name,
-                        game_duration=formatted_duration,
-                        background_image=background_image,
-                        theme=theme
-                    )
-                except Exception as e:
-                    print(f"Error rendering template for player {player['name']}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    continue
-                
-                # Set the content in the page
-                await page.set_content(html_content)
-                
-                # Take a screenshot
-                screenshot = await page.screenshot(full_page=True)
-                
-                # Create a Discord file for this player
-                player_name = player['name'].replace(' ', '_')
-                player_cards.append(disnake.File(
-                    io.BytesIO(screenshot), 
-                    filename=f"{player_name}_{player['champion']}_game.png"
-                ))
-                
-                # Close the page
-                await page.close()
-            
-            # Close the browser
-            await browser.close()
+        
+        renders = []
+        for player in tracked_players:
+            # Render the template with only this player's data
+            try:
+                html_content = template.render(
+                    tracked_players=[player],  # Only include the current player
+                    team1=team1,
+                    team2=team2,
+                    team1_kills=team1_kills,
+                    team2_kills=team2_kills,
+                    team1_gold=team1_gold or 0,
+                    team2_gold=team2_gold or 0,
+                    team1_damage=team1_damage or 0,
+                    team2_damage=team2_damage or 0,
+                    gamemode=gamemode or "Unknown",
+                    gamemode_display=translate(gamemode or "Unknown"),
+                    queue_name=queue_name,
+                    game_duration=formatted_duration,
+                    background_image=background_image,
+                    theme=theme
+                )
+            except Exception as e:
+                print(f"Error rendering template for player {player['name']}: {e}")
+                import traceback
+                traceback.print_exc()
+                continue
+            renders.append(asyncio.ensure_future(render_player_card(player, html_content)))
+        
+        # Hand out each card as soon as its render finishes
+        cards_generated = 0
+        try:
+            for render in asyncio.as_completed(renders):
+                card = await render
+                if card is not None:
+                    cards_generated += 1
+                    yield card
+        finally:
+            # The caller stopped early, don't leave renders holding pooled pages
+            for render in renders:
+                render.cancel()
         
         # If no cards were generated, raise an error
-        if not player_cards:
+        if not cards_generated:
             raise ValueError("No player cards could be generated")
-        
-        # Return the list of Discord files
-        return player_cards
 
     def _classify_stat(self, value, avg, threshold):
         """Classify a stat as highlight, positive, or negative based on comparison to average."""
@@ -1624,13 +1871,8 @@ class CardGenerator(commands.Cog):
             winrate = stat.winrate
             kda = stat.average_kda
             
-            # Read and encode profile icon
-            profile_icon_path = os.path.join(self.assets_path, "gamedata", self.bot.current_game_patch, "img", "profileicon", f"{stat.profile_icon}.png")
-            try:
-                with open(profile_icon_path, "rb") as image_file:
-                    encoded_profile_icon = base64.b64encode(image_file.read()).decode()
-            except FileNotFoundError:
-                encoded_profile_icon = None
+            # Profile icon URL
+            profile_icon = self.profile_icon_url(stat.profile_icon)
             
             players.append({
                 'name': stat.name,
@@ -1649,23 +1891,18 @@ class CardGenerator(commands.Cog):
                 'avg_kill_participation': f"{self.format_percentage(stat.avg_kill_participation)}",
                 'avg_gold_per_min': f"{stat.avg_gold_per_min:.0f}",
                 'avg_damage_taken_per_min': f"{stat.avg_damage_taken_per_min:.0f}",
-                'profile_icon': encoded_profile_icon
+                'profile_icon': profile_icon
             })
             
         if not players:
             raise ValueError(f"No players found with games on {champion_name} in {gamemode} mode")
             
-        # Read and encode champion images
-        champion_image = self.load_champion_image(champion_name, "tiles")
-        champion_loading = self.load_champion_image(champion_name, "loading")
+        # Champion image URLs
+        champion_image = self.champion_image_url(champion_name, "tiles")
+        champion_loading = self.champion_image_url(champion_name, "loading")
         
-        # Read and encode background image
-        bg_image_path = os.path.join(self.assets_path, "images", f"{gamemode}.png")
-        try:
-            with open(bg_image_path, "rb") as image_file:
-                encoded_image = base64.b64encode(image_file.read()).decode()
-        except FileNotFoundError:
-            encoded_image = None
+        # Background image URL
+        background_image = self.background_url(gamemode)
         
         # Calculate aggregate stats
         total_games = sum(stat.champion_games for stat in top_5_players)
@@ -1685,25 +1922,15 @@ class CardGenerator(commands.Cog):
             total_winrate=avg_winrate,
             total_winrate_color=self.get_winrate_color(avg_winrate),
             players=players,
-            background_image=encoded_image,
+            background_image=background_image,
             champion_image=champion_image,
             champion_loading=champion_loading
         )
         
         # Use playwright to render HTML to image
-        async with async_playwright() as p:
-            browser = await p.chromium.launch()
-            page = await browser.new_page(viewport={'width': 600, 'height': 100})
-            await page.set_content(html_content)
-            await page.wait_for_load_state('networkidle')
-            
-            # Wait for background image and fonts to load
-            await page.wait_for_timeout(500)
-            
-            # Set content and wait for it to load
-            await page.set_content(html_content)
-            await page.wait_for_load_state('networkidle')
-            await page.wait_for_timeout(500)
+        async with self.browser_pool.page({'width': 600, 'height': 100}) as page:
+            # Set content and wait for fonts and images to be ready
+            await self.load_card(page, html_content)
 
             # Get page dimensions
             dimensions = await page.evaluate('''() => {
@@ -1722,8 +1949,6 @@ class CardGenerator(commands.Cog):
                 full_page=True
             )
 
-            await browser.close()
-
             # Convert bytes to BytesIO and process image
             img_byte_arr = io.BytesIO(screenshot)
             image = Image.open(img_byte_arr)
@@ -1755,48 +1980,24 @@ class CardGenerator(commands.Cog):
         # Use the raw gamemode key for theme/image lookup
         gamemode_png_name = translate(gamemode)
         theme = self.gamemode_themes.get(gamemode, self.gamemode_themes["CLASSIC"])
-        bg_image_path = os.path.join(self.assets_path, "images", f"{gamemode_png_name}.png")
-        try:
-            with open(bg_image_path, "rb") as image_file:
-                background_image = base64.b64encode(image_file.read()).decode()
-        except FileNotFoundError:
+        background_image = self.background_url(gamemode_png_name)
+        if background_image is None:
             print(f"Warning: Could not find background image for gamemode {gamemode}")
-            background_image = None # Template can handle None
+            # Template can handle None
 
         # 2. Find latest patch for profile icons
-        gamedata_path = os.path.join(self.assets_path, "gamedata")
-        patch_folders = [d for d in os.listdir(gamedata_path) if os.path.isdir(os.path.join(gamedata_path, d)) and d not in ['img']]
-        # Sort folders numerically/lexicographically if possible, assuming version format like X.Y.Z
-        try:
-            # Attempt to sort by version numbers
-             patch_folders.sort(key=lambda v: [int(x) for x in v.split('.')], reverse=True)
-             latest_patch = patch_folders[0] if patch_folders else "15.1.1"
-        except ValueError:
-             # Fallback to simple sort if version format is unexpected
-             latest_patch = sorted(patch_folders, reverse=False)[0] if patch_folders else "15.1.1"
-             
-        print(f"Using latest patch folder for icons: {latest_patch}")
-        profile_icon_base_path = os.path.join(self.assets_path, "gamedata", latest_patch, "img", "profileicon")
+        latest_patch = self.get_latest_patch()
 
         # Helper function to load icon (modified to handle potential errors)
         def _load_icon(icon_id):
             if icon_id is None: # Handle cases where icon_id might be missing
                 icon_id = 0 # Default to 0
-                
-            profile_icon_path = os.path.join(profile_icon_base_path, f"{icon_id}.png")
-            default_icon_path = os.path.join(profile_icon_base_path, "0.png")
-            
-            try:
-                target_path = profile_icon_path if os.path.exists(profile_icon_path) else default_icon_path
-                if os.path.exists(target_path):
-                     with open(target_path, "rb") as img_file:
-                         return base64.b64encode(img_file.read()).decode('utf-8')
-                else:
-                     print(f"Warning: Profile icon {icon_id} and default icon 0 not found in {profile_icon_base_path}")
-                     return "" # Return empty string if neither found
-            except Exception as e:
-                print(f"Error loading profile icon {icon_id} (fallback 0): {e}")
-                return "" # Return empty string on error
+
+            icon = self.profile_icon_url(icon_id, latest_patch)
+            if icon is None:
+                print(f"Warning: Profile icon {icon_id} and default icon 0 not found for patch {latest_patch}")
+                return "" # Return empty string if neither found
+            return icon
 
         # 3. Process leaderboard data (add icons and colors)
         processed_kda = []
@@ -1855,26 +2056,19 @@ class CardGenerator(commands.Cog):
         )
 
         # 5. Use playwright to render HTML to image
-        async with async_playwright() as p:
-            browser = await p.chromium.launch()
-            # Increase initial viewport height significantly
-            page = await browser.new_page(viewport={'width': 1200, 'height': 850}) 
-            await page.set_content(html_content)
-
-            # Wait for network idle and a short timeout for rendering stability
+        # Increase initial viewport height significantly
+        async with self.browser_pool.page({'width': 1200, 'height': 850}) as page:
+            # Wait for the template's fonts-and-images-ready signal
             try:
-                await page.wait_for_load_state('networkidle', timeout=10000) 
-                await page.wait_for_timeout(500) # Extra buffer for rendering
+                await self.load_card(page, html_content)
             except Exception as e:
                  print(f"Playwright timeout or error during load state: {e}")
-                 await browser.close()
                  raise RuntimeError(f"Playwright failed during page load: {e}")
 
             # Find the main card element
             element_handle = await page.query_selector('.card')
             if not element_handle:
                  print("DEBUG: .card element NOT found in template.") # DEBUG
-                 await browser.close()
                  raise RuntimeError("Could not find .card element for screenshotting.")
             else:
                 print("DEBUG: .card element found. Attempting element screenshot...") # DEBUG
@@ -1887,8 +2081,6 @@ class CardGenerator(commands.Cog):
                     # Fallback to viewport screenshot if element screenshot fails
                     image_bytes = await page.screenshot(type='png')
 
-            await browser.close()
-
         # 6. Save to BytesIO and return Disnake File
         if not image_bytes:
              raise RuntimeError("Failed to generate leaderboard image bytes.")
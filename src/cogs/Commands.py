@@ -4,6 +4,7 @@ import asyncio
 from typing import List
 from ..models.models import User, PlayerStats, PlayerFriendStats
 from ..Utils import translate
+from .DatabaseOperations import PENDING_MATCH_MAX_ATTEMPTS
 
 class Commands(commands.Cog):
     def __init__(self, bot):
@@ -344,7 +345,8 @@ class Commands(commands.Cog):
     @commands.slash_command()
     async def update_database(
         self, 
-        inter: disnake.ApplicationCommandInteraction
+        inter: disnake.ApplicationCommandInteraction,
+        deep_resync: bool = commands.Param(default=False, description="Recheck the last 1000 matches of every player instead of only new ones")
     ):
         """
         Look for new matches for all players in the database and update the database
@@ -352,7 +354,7 @@ class Commands(commands.Cog):
         if not await self.bot.is_botlol_channel(inter):
             return
         await inter.response.defer()
-        total_matches = await self.bot.get_cog('RiotAPIOperations').update_database(inter=inter, announce=True)
+        total_matches = await self.bot.get_cog('RiotAPIOperations').update_database(inter=inter, announce=True, deep_resync=deep_resync)
         #await inter.edit_original_message(embed=disnake.Embed(title="Updated Database", description=f"Added {total_matches} new matches", color=disnake.Color.blue()))
         
     @commands.slash_command()
@@ -505,6 +507,63 @@ class Commands(commands.Cog):
                 except Exception as followup_e:
                      print(f"Failed to send error followup for apply_lol_update: {followup_e}")
 
+    @commands.slash_command()
+    async def reingest_matches(
+        self,
+        inter: disnake.ApplicationCommandInteraction
+    ):
+        """
+        Rebuild all match tables from the archived match payloads, no Riot API calls (requires admin permissions).
+        """
+        if not await self.bot.is_botlol_channel(inter):
+            return
+        if not inter.author.guild_permissions.administrator:
+             await inter.response.send_message("You need administrator permissions to run this command.", ephemeral=True)
+             return
+
+        await inter.response.defer()
+        try:
+            reingested, failed, missing = await self.bot.get_cog("DatabaseOperations").reingest_matches()
+            description = f"Re-ingested {reingested} matches from the archive."
+            if failed:
+                description += f"\n{failed} matches failed, check the bot logs."
+            if missing:
+                description += f"\n{missing} stored matches have no archived payload and were left untouched."
+            await inter.edit_original_message(embed=disnake.Embed(
+                title="Match Re-ingest Complete",
+                description=description,
+                color=disnake.Color.green() if not failed else disnake.Color.orange()
+            ))
+        except Exception as e:
+            print(f"Error re-ingesting matches: {e}")
+            await inter.edit_original_message(embed=disnake.Embed(title="Match Re-ingest Error", description=f"An unexpected error occurred: {str(e)}", color=disnake.Color.red()))
+
+    @commands.slash_command()
+    async def rebuild_player_stats(
+        self,
+        inter: disnake.ApplicationCommandInteraction
+    ):
+        """
+        Recompute the pre-aggregated player/champion/mode stats from the match tables (requires admin permissions).
+        """
+        if not await self.bot.is_botlol_channel(inter):
+            return
+        if not inter.author.guild_permissions.administrator:
+             await inter.response.send_message("You need administrator permissions to run this command.", ephemeral=True)
+             return
+
+        await inter.response.defer()
+        try:
+            rows = await self.bot.get_cog("DatabaseOperations").rebuild_player_aggregates()
+            await inter.edit_original_message(embed=disnake.Embed(
+                title="Player Stats Rebuild Complete",
+                description=f"Rebuilt {rows} player/champion/mode aggregate rows.",
+                color=disnake.Color.green()
+            ))
+        except Exception as e:
+            print(f"Error rebuilding player stats: {e}")
+            await inter.edit_original_message(embed=disnake.Embed(title="Player Stats Rebuild Error", description=f"An unexpected error occurred: {str(e)}", color=disnake.Color.red()))
+
     # --- Leaderboard Command (Combined) ---
     @commands.slash_command(name="generate_leaderboard")
     async def generate_leaderboard(
@@ -607,13 +666,13 @@ class Commands(commands.Cog):
                     
                     embed.add_field(
                         name=f"Match {match_id}",
-                        value=f"**Mode:** {game_mode}\n**Attempts:** {attempts}/10\n**Created:** {created_dt.strftime('%Y-%m-%d %H:%M:%S')}\n**Last Attempt:** {last_attempt_dt.strftime('%Y-%m-%d %H:%M:%S')}",
+                        value=f"**Mode:** {game_mode}\n**Attempts:** {attempts}/{PENDING_MATCH_MAX_ATTEMPTS}\n**Created:** {created_dt.strftime('%Y-%m-%d %H:%M:%S')}\n**Last Attempt:** {last_attempt_dt.strftime('%Y-%m-%d %H:%M:%S')}",
                         inline=True
                     )
                 except:
                     embed.add_field(
                         name=f"Match {match_id}",
-                        value=f"**Mode:** {game_mode}\n**Attempts:** {attempts}/10\n**Created:** {created_at}\n**Last Attempt:** {last_attempt}",
+                        value=f"**Mode:** {game_mode}\n**Attempts:** {attempts}/{PENDING_MATCH_MAX_ATTEMPTS}\n**Created:** {created_at}\n**Last Attempt:** {last_attempt}",
                         inline=True
                     )
             
@@ -659,25 +718,17 @@ class Commands(commands.Cog):
             
             match_id, game_mode, channel_id, message_id, attempts, created_at, last_attempt = match_found
             
-            # Try to fetch the match data from the API
-            match_data = await self.bot.get_cog("RiotAPIOperations").get_match_data(match_id)
-            
-            if match_data:
-                # Match data was successfully fetched
-                await self.bot.get_cog("DatabaseOperations").remove_pending_match(match_id)
-                
+            # Let the job worker run it now, it posts the card and keeps count of the attempts
+            if await self.bot.get_cog("DatabaseOperations").retry_pending_match_now(match_id):
                 await inter.followup.send(embed=disnake.Embed(
-                    title="✅ Match Processed Successfully",
-                    description=f"Match {match_id} has been successfully processed and removed from the pending queue.",
-                    color=disnake.Color.green()
+                    title="⏳ Match Retry Scheduled",
+                    description=f"Match {match_id} will be retried now (attempt {attempts + 1}/{PENDING_MATCH_MAX_ATTEMPTS}).\nIts card is posted as soon as the Riot API has the match.",
+                    color=disnake.Color.orange()
                 ))
             else:
-                # Match data still not available
-                await self.bot.get_cog("DatabaseOperations").update_pending_match_attempt(match_id)
-                
                 await inter.followup.send(embed=disnake.Embed(
-                    title="⏳ Match Still Pending",
-                    description=f"Match {match_id} is still not available in the Riot API.\nAttempt count increased to {attempts + 1}/10.",
+                    title="⏳ Match Already Retrying",
+                    description=f"Match {match_id} is being retried right now.",
                     color=disnake.Color.orange()
                 ))
                 
@@ -2,23 +2,840 @@ import sqlite3
 from datetime import datetime, date, timedelta
 from datetime import time as dt_time
 import os
+import re
+import sys
+import copy
+import json
+import zlib
+import asyncio
+import queue
+import threading
+import unicodedata
+import uuid
 from disnake.ext import commands
-import aiohttp
-from typing import List, Optional, Set, Tuple
-from ..models.models import Match, Participant, User, PlayerStats, PlayerFriendStats, UserStats
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from ..models.models import Match, Participant, User, PlayerStats, PlayerFriendStats, UserStats, ChampionRef, Job
 import time
 
 DB_PATH = "/app/data/lol_stats.db"
 
+PAYLOAD_COMPRESSION_LEVEL = 6  # zlib level for archived match payloads
+# Challenge keys whose snake_case form doesn't match the column name in the challenges table
+CHALLENGE_COLUMN_OVERRIDES = {
+    "12AssistStreakCount": "assists_streak_count_12",
+    "wardTakedownsBefore20M": "ward_takedowns_before_20m",
+}
+ARCHIVE_PAYLOAD_SQL = '''
+    INSERT OR REPLACE INTO match_payloads (match_id, compression, payload, fetched_at)
+    VALUES (?, 'zlib', ?, datetime('now'))
+'''
+
+DB_READ_POOL_SIZE = 4  # Default number of reader threads/connections, override with DB_READ_POOL_SIZE in .env
+
+# Durable job queue (jobs table). A claimed job's next_run_at moves to the end of its lease,
+# so a job whose worker died becomes due again by itself and "due" is one indexed range
+PENDING_MATCH_JOB = "pending_match"  # Post the cards of a match once match-v5 has it
+PENDING_MATCH_MAX_ATTEMPTS = 20
+PENDING_MATCH_FIRST_RUN_SECONDS = 10 * 60  # Matches are queued while still being played
+
+# QueryCache defaults, override with QUERY_CACHE_MAX_ENTRIES / QUERY_CACHE_MAX_BYTES / QUERY_CACHE_TTL_SECONDS in .env
+QUERY_CACHE_MAX_ENTRIES = 2048
+QUERY_CACHE_MAX_BYTES = 32 * 1024 * 1024
+QUERY_CACHE_TTL_SECONDS = 600
+
+
+def normalize_key(value) -> Optional[str]:
+    """Canonical form of a game name, game mode or champion name, stored in the *_norm columns.
+
+    Queries compare the *_norm columns to normalize_key(parameter), which unlike SQLite's
+    ASCII-only LOWER() also folds accented and full-width names.
+    """
+    if value is None:
+        return None
+    return unicodedata.normalize("NFKC", str(value)).strip().casefold()
+
+
+def add_normalized_columns(cursor):
+    """Migration step: add the *_norm shadow columns if missing and backfill them with normalize_key."""
+    for table, column in (
+        ("participants", "riot_id_game_name_norm"),
+        ("participants", "champion_name_norm"),
+        ("matches", "game_mode_norm"),
+    ):
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+    cursor.connection.create_function("normalize_key", 1, normalize_key, deterministic=True)
+    cursor.execute("UPDATE participants SET riot_id_game_name_norm = normalize_key(riot_id_game_name), champion_name_norm = normalize_key(champion_name)")
+    cursor.execute("UPDATE matches SET game_mode_norm = normalize_key(game_mode)")
+
+
+
+def move_pending_matches_to_jobs(cursor):
+    """Migration step: carry the rows of the old pending_matches table over as pending_match jobs."""
+    cursor.execute("SELECT match_id, game_mode, channel_id, message_id, attempts, created_at, last_attempt FROM pending_matches")
+    cursor.executemany("""
+        INSERT OR IGNORE INTO jobs (job_type, job_key, payload, attempts, max_attempts, next_run_at, created_at, last_attempt_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        (PENDING_MATCH_JOB, match_id,
+         json.dumps({"game_mode": game_mode, "channel_id": channel_id, "message_id": message_id}),
+         attempts or 0, PENDING_MATCH_MAX_ATTEMPTS, time.time(), created_at, last_attempt)
+        for match_id, game_mode, channel_id, message_id, attempts, created_at, last_attempt in cursor.fetchall()
+    ])
+
+# player_champion_mode_agg: running sums/counts/maxima per (name, mode, year, champion, puuid),
+# so get_player_stats reads a few rows instead of aggregating every participant row.
+# Averages keep a sum and a non-NULL count so they combine exactly like AVG() over the raw rows.
+# These describe the table as the latest migration left it; changing the columns needs a new migration.
+PLAYER_AGG_KEY = "riot_name, game_mode, year, champion_name, champion_name_norm, puuid"
+PLAYER_AGG_SUMS = [
+    "games", "wins", "duration_sum", "triples", "quadras", "pentas", "first_bloods", "objectives", "first_places",
+    "dpm_sum", "dpm_n", "kda_sum", "kda_n", "time_dead_pct_sum", "time_dead_pct_n", "vision_sum", "vision_n",
+    "kp_sum", "kp_n", "damage_taken_pm_sum", "damage_taken_pm_n", "gold_pm_sum", "gold_pm_n",
+    "cs_pm_sum", "cs_pm_n", "placement_sum", "placement_n",
+]
+PLAYER_AGG_COLUMNS = (
+    [column.strip() for column in PLAYER_AGG_KEY.split(",")] + PLAYER_AGG_SUMS
+    + ["oldest_game", "max_killing_spree", "max_killing_spree_match", "max_kda", "max_kda_match",
+       "latest_game", "latest_summoner_level", "latest_profile_icon"]
+)
+# Aggregate rows for the participants matched by {where}, in PLAYER_AGG_COLUMNS order.
+# The *_match columns keep the first match_id reaching the maximum, to name its champion,
+# latest_* the summoner level and icon of the most recent game.
+PLAYER_AGG_SELECT_SQL = f'''
+    SELECT
+        {PLAYER_AGG_KEY},
+        COUNT(*),
+        SUM(CASE WHEN wins = 1 THEN 1 ELSE 0 END),
+        COALESCE(SUM(game_duration), 0),
+        COALESCE(SUM(triple_kills), 0),
+        COALESCE(SUM(quadra_kills), 0),
+        COALESCE(SUM(penta_kills), 0),
+        SUM(CASE WHEN first_blood_kill = 1 OR first_blood_assist = 1 THEN 1 ELSE 0 END),
+        COALESCE(SUM(turret_takedowns + inhibitor_takedowns), 0),
+        SUM(CASE WHEN placement = 1 THEN 1 ELSE 0 END),
+        TOTAL(dpm), COUNT(dpm),
+        TOTAL(kda), COUNT(kda),
+        TOTAL(time_dead_pct), COUNT(time_dead_pct),
+        TOTAL(vision_score), COUNT(vision_score),
+        TOTAL(kp), COUNT(kp),
+        TOTAL(damage_taken_pm), COUNT(damage_taken_pm),
+        TOTAL(gold_pm), COUNT(gold_pm),
+        TOTAL(cs_pm), COUNT(cs_pm),
+        TOTAL(placement_f), COUNT(placement_f),
+        MIN(game_creation),
+        MAX(largest_killing_spree),
+        MIN(CASE WHEN largest_killing_spree = group_max_spree THEN match_id END),
+        MAX(kda),
+        MIN(CASE WHEN kda = group_max_kda THEN match_id END),
+        MAX(game_creation),
+        MAX(CASE WHEN game_creation = group_latest THEN summoner_level END),
+        MAX(CASE WHEN game_creation = group_latest THEN profile_icon END)
+    FROM (
+        SELECT *,
+            MAX(largest_killing_spree) OVER player_key AS group_max_spree,
+            MAX(kda) OVER player_key AS group_max_kda,
+            MAX(game_creation) OVER player_key AS group_latest
+        FROM (
+            SELECT
+                p.match_id,
+                COALESCE(p.puuid, '') AS puuid,
+                p.riot_id_game_name_norm AS riot_name,
+                m.game_mode_norm AS game_mode,
+                COALESCE(p.champion_name, '') AS champion_name,
+                COALESCE(p.champion_name_norm, '') AS champion_name_norm,
+                COALESCE(strftime('%Y', m.game_creation), '') AS year,
+                m.game_duration, m.game_creation, p.wins, p.triple_kills, p.quadra_kills, p.penta_kills,
+                p.first_blood_kill, p.first_blood_assist, p.turret_takedowns, p.inhibitor_takedowns,
+                p.placement, p.vision_score, p.largest_killing_spree, p.summoner_level, p.profile_icon,
+                p.total_damage_to_champions / (m.game_duration / 60.0) AS dpm,
+                CASE
+                    WHEN p.deaths = 0 THEN p.kills + p.assists
+                    ELSE CAST((p.kills + p.assists) AS FLOAT) / p.deaths
+                END AS kda,
+                CAST(p.total_time_spent_dead AS FLOAT) / m.game_duration * 100 AS time_dead_pct,
+                p.kill_participation * 100 AS kp,
+                p.total_damage_taken / (m.game_duration / 60.0) AS damage_taken_pm,
+                p.gold_earned / (m.game_duration / 60.0) AS gold_pm,
+                p.total_minions_killed / (m.game_duration / 60.0) AS cs_pm,
+                CAST(p.placement AS FLOAT) AS placement_f
+            FROM participants p
+            JOIN matches m ON p.match_id = m.match_id
+            WHERE p.riot_id_game_name_norm IS NOT NULL AND m.game_mode_norm IS NOT NULL
+            AND {{where}}
+        )
+        WINDOW player_key AS (PARTITION BY {PLAYER_AGG_KEY})
+    )
+    GROUP BY {PLAYER_AGG_KEY}
+'''
+# Keys (in PLAYER_AGG_KEY order) touched by participants matched by {where}
+PLAYER_AGG_KEYS_SQL = f'''
+    SELECT DISTINCT
+        p.riot_id_game_name_norm, m.game_mode_norm,
+        COALESCE(strftime('%Y', m.game_creation), ''), COALESCE(p.champion_name, ''),
+        COALESCE(p.champion_name_norm, ''), COALESCE(p.puuid, '')
+    FROM participants p
+    JOIN matches m ON p.match_id = m.match_id
+    WHERE p.riot_id_game_name_norm IS NOT NULL AND m.game_mode_norm IS NOT NULL
+    AND {{where}}
+'''
+PLAYER_AGG_KEY_WHERE = (
+    "p.riot_id_game_name_norm = ? AND m.game_mode_norm = ? "
+    "AND COALESCE(strftime('%Y', m.game_creation), '') = ? "
+    "AND COALESCE(p.champion_name, '') = ? AND COALESCE(p.champion_name_norm, '') = ? "
+    "AND COALESCE(p.puuid, '') = ?"
+)
+# Folds new matches into existing rows, the maxima keep the earliest match_id on ties
+PLAYER_AGG_UPSERT_SQL = f'''
+    INSERT INTO player_champion_mode_agg ({", ".join(PLAYER_AGG_COLUMNS)})
+    {PLAYER_AGG_SELECT_SQL}
+    ON CONFLICT ({PLAYER_AGG_KEY}) DO UPDATE SET
+        {", ".join(f"{column} = {column} + excluded.{column}" for column in PLAYER_AGG_SUMS)},
+        oldest_game = COALESCE(MIN(oldest_game, excluded.oldest_game), oldest_game, excluded.oldest_game),
+        max_killing_spree_match = CASE
+            WHEN max_killing_spree IS NULL OR excluded.max_killing_spree > max_killing_spree
+                OR (excluded.max_killing_spree = max_killing_spree AND excluded.max_killing_spree_match < max_killing_spree_match)
+            THEN excluded.max_killing_spree_match ELSE max_killing_spree_match END,
+        max_killing_spree = CASE
+            WHEN max_killing_spree IS NULL OR excluded.max_killing_spree > max_killing_spree
+            THEN excluded.max_killing_spree ELSE max_killing_spree END,
+        max_kda_match = CASE
+            WHEN max_kda IS NULL OR excluded.max_kda > max_kda
+                OR (excluded.max_kda = max_kda AND excluded.max_kda_match < max_kda_match)
+            THEN excluded.max_kda_match ELSE max_kda_match END,
+        max_kda = CASE
+            WHEN max_kda IS NULL OR excluded.max_kda > max_kda
+            THEN excluded.max_kda ELSE max_kda END,
+        latest_summoner_level = CASE
+            WHEN latest_game IS NULL OR excluded.latest_game > latest_game
+            THEN excluded.latest_summoner_level ELSE latest_summoner_level END,
+        latest_profile_icon = CASE
+            WHEN latest_game IS NULL OR excluded.latest_game > latest_game
+            THEN excluded.latest_profile_icon ELSE latest_profile_icon END,
+        latest_game = COALESCE(MAX(latest_game, excluded.latest_game), latest_game, excluded.latest_game)
+'''
+REBUILD_PLAYER_AGG_SQL = f'''
+    INSERT INTO player_champion_mode_agg ({", ".join(PLAYER_AGG_COLUMNS)})
+    {PLAYER_AGG_SELECT_SQL.format(where="1")}
+'''
+
+# Versioned schema migrations, applied in order by DatabaseOperations.ensure_schema.
+# A shipped migration must never change, add a new version instead.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "pending_matches table", [
+        """
+        CREATE TABLE IF NOT EXISTS pending_matches (
+            match_id TEXT PRIMARY KEY,
+            game_mode TEXT NOT NULL,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            attempts INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "user_watermarks table", [
+        """
+        CREATE TABLE IF NOT EXISTS user_watermarks (
+            puuid TEXT PRIMARY KEY,
+            last_game_end_timestamp INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (3, "match_payloads table", [
+        """
+        CREATE TABLE IF NOT EXISTS match_payloads (
+            match_id TEXT PRIMARY KEY,
+            compression TEXT NOT NULL DEFAULT 'zlib',
+            payload BLOB NOT NULL,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (4, "indexes for the hot query predicates", [
+        # Player lookups by name, puuid and champion (expression indexes match LOWER(...) = LOWER(?))
+        "CREATE INDEX IF NOT EXISTS idx_participants_name_lower ON participants (LOWER(riot_id_game_name), match_id)",
+        "CREATE INDEX IF NOT EXISTS idx_participants_puuid_match ON participants (puuid, match_id)",
+        "CREATE INDEX IF NOT EXISTS idx_participants_champion_lower ON participants (LOWER(champion_name), match_id)",
+        # Mode filters, leaderboard periods and 'latest game in this mode' lookups
+        "CREATE INDEX IF NOT EXISTS idx_matches_mode_lower_end ON matches (LOWER(game_mode), game_end)",
+        "CREATE INDEX IF NOT EXISTS idx_matches_game_creation ON matches (game_creation)",
+        "CREATE INDEX IF NOT EXISTS idx_matches_remakes ON matches (game_duration) WHERE game_duration = 0",
+        # Child rows are cleared by match_id whenever a match is (re-)ingested
+        "CREATE INDEX IF NOT EXISTS idx_bans_match ON bans (match_id)",
+        "CREATE INDEX IF NOT EXISTS idx_objectives_match ON objectives (match_id)",
+        "CREATE INDEX IF NOT EXISTS idx_challenges_match ON challenges (match_id)",
+        "CREATE INDEX IF NOT EXISTS idx_perks_match ON perks (match_id)",
+        "CREATE INDEX IF NOT EXISTS idx_perk_styles_perk ON perk_styles (perk_id)",
+        "CREATE INDEX IF NOT EXISTS idx_perk_selections_style ON perk_selections (perk_style_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_puuid ON users (puuid)",
+        "CREATE INDEX IF NOT EXISTS idx_users_guild ON users (guild_id)",
+        "CREATE INDEX IF NOT EXISTS idx_pending_matches_created ON pending_matches (created_at)",
+        # Give the query planner statistics for the new indexes
+        "ANALYZE",
+    ]),
+    (5, "normalized name, mode and champion columns", [
+        add_normalized_columns,
+        "DROP INDEX IF EXISTS idx_participants_name_lower",
+        "DROP INDEX IF EXISTS idx_participants_champion_lower",
+        "DROP INDEX IF EXISTS idx_matches_mode_lower_end",
+        "CREATE INDEX IF NOT EXISTS idx_participants_name_norm ON participants (riot_id_game_name_norm, match_id)",
+        "CREATE INDEX IF NOT EXISTS idx_participants_champion_norm ON participants (champion_name_norm, match_id)",
+        "CREATE INDEX IF NOT EXISTS idx_matches_mode_norm_end ON matches (game_mode_norm, game_end)",
+    ]),
+    (6, "jobs table replacing pending_matches", [
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_type TEXT NOT NULL,
+            job_key TEXT NOT NULL,
+            payload TEXT NOT NULL,  -- JSON
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            next_run_at REAL NOT NULL,  -- Epoch seconds, end of the lease while claimed
+            lease_token TEXT,  -- Set while a worker holds the job
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_attempt_at TIMESTAMP,
+            UNIQUE (job_type, job_key)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_jobs_next_run ON jobs (next_run_at)",
+        move_pending_matches_to_jobs,
+        "DROP TABLE IF EXISTS pending_matches",
+    ]),
+    # Keyed on the normalized columns, so it comes after they are filled. The DDL and the
+    # rebuild are frozen here, PLAYER_AGG_* describe the current table for the runtime code
+    (7, "player_champion_mode_agg table", [
+        """
+        CREATE TABLE IF NOT EXISTS player_champion_mode_agg (
+            riot_name TEXT NOT NULL,
+            game_mode TEXT NOT NULL,
+            year TEXT NOT NULL,
+            champion_name TEXT NOT NULL,
+            champion_name_norm TEXT NOT NULL,
+            puuid TEXT NOT NULL,
+            games INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            duration_sum INTEGER NOT NULL DEFAULT 0,
+            triples INTEGER NOT NULL DEFAULT 0,
+            quadras INTEGER NOT NULL DEFAULT 0,
+            pentas INTEGER NOT NULL DEFAULT 0,
+            first_bloods INTEGER NOT NULL DEFAULT 0,
+            objectives INTEGER NOT NULL DEFAULT 0,
+            first_places INTEGER NOT NULL DEFAULT 0,
+            dpm_sum REAL NOT NULL DEFAULT 0,
+            dpm_n INTEGER NOT NULL DEFAULT 0,
+            kda_sum REAL NOT NULL DEFAULT 0,
+            kda_n INTEGER NOT NULL DEFAULT 0,
+            time_dead_pct_sum REAL NOT NULL DEFAULT 0,
+            time_dead_pct_n INTEGER NOT NULL DEFAULT 0,
+            vision_sum REAL NOT NULL DEFAULT 0,
+            vision_n INTEGER NOT NULL DEFAULT 0,
+            kp_sum REAL NOT NULL DEFAULT 0,
+            kp_n INTEGER NOT NULL DEFAULT 0,
+            damage_taken_pm_sum REAL NOT NULL DEFAULT 0,
+            damage_taken_pm_n INTEGER NOT NULL DEFAULT 0,
+            gold_pm_sum REAL NOT NULL DEFAULT 0,
+            gold_pm_n INTEGER NOT NULL DEFAULT 0,
+            cs_pm_sum REAL NOT NULL DEFAULT 0,
+            cs_pm_n INTEGER NOT NULL DEFAULT 0,
+            placement_sum REAL NOT NULL DEFAULT 0,
+            placement_n INTEGER NOT NULL DEFAULT 0,
+            oldest_game,
+            max_killing_spree INTEGER,
+            max_killing_spree_match TEXT,
+            max_kda,
+            max_kda_match TEXT,
+            latest_game,
+            latest_summoner_level INTEGER,
+            latest_profile_icon INTEGER,
+            PRIMARY KEY (riot_name, game_mode, year, champion_name, champion_name_norm, puuid)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_player_agg_puuid ON player_champion_mode_agg (puuid, game_mode)",
+        """
+        INSERT INTO player_champion_mode_agg (
+            riot_name, game_mode, year, champion_name, champion_name_norm, puuid, games, wins,
+            duration_sum, triples, quadras, pentas, first_bloods, objectives, first_places, dpm_sum,
+            dpm_n, kda_sum, kda_n, time_dead_pct_sum, time_dead_pct_n, vision_sum, vision_n, kp_sum,
+            kp_n, damage_taken_pm_sum, damage_taken_pm_n, gold_pm_sum, gold_pm_n, cs_pm_sum, cs_pm_n,
+            placement_sum, placement_n, oldest_game, max_killing_spree, max_killing_spree_match,
+            max_kda, max_kda_match, latest_game, latest_summoner_level, latest_profile_icon
+        )
+        SELECT
+            riot_name, game_mode, year, champion_name, champion_name_norm, puuid,
+            COUNT(*),
+            SUM(CASE WHEN wins = 1 THEN 1 ELSE 0 END),
+            COALESCE(SUM(game_duration), 0),
+            COALESCE(SUM(triple_kills), 0),
+            COALESCE(SUM(quadra_kills), 0),
+            COALESCE(SUM(penta_kills), 0),
+            SUM(CASE WHEN first_blood_kill = 1 OR first_blood_assist = 1 THEN 1 ELSE 0 END),
+            COALESCE(SUM(turret_takedowns + inhibitor_takedowns), 0),
+            SUM(CASE WHEN placement = 1 THEN 1 ELSE 0 END),
+            TOTAL(dpm), COUNT(dpm),
+            TOTAL(kda), COUNT(kda),
+            TOTAL(time_dead_pct), COUNT(time_dead_pct),
+            TOTAL(vision_score), COUNT(vision_score),
+            TOTAL(kp), COUNT(kp),
+            TOTAL(damage_taken_pm), COUNT(damage_taken_pm),
+            TOTAL(gold_pm), COUNT(gold_pm),
+            TOTAL(cs_pm), COUNT(cs_pm),
+            TOTAL(placement_f), COUNT(placement_f),
+            MIN(game_creation),
+            MAX(largest_killing_spree),
+            MIN(CASE WHEN largest_killing_spree = group_max_spree THEN match_id END),
+            MAX(kda),
+            MIN(CASE WHEN kda = group_max_kda THEN match_id END),
+            MAX(game_creation),
+            MAX(CASE WHEN game_creation = group_latest THEN summoner_level END),
+            MAX(CASE WHEN game_creation = group_latest THEN profile_icon END)
+        FROM (
+            SELECT *,
+                MAX(largest_killing_spree) OVER player_key AS group_max_spree,
+                MAX(kda) OVER player_key AS group_max_kda,
+                MAX(game_creation) OVER player_key AS group_latest
+            FROM (
+                SELECT
+                    p.match_id,
+                    COALESCE(p.puuid, '') AS puuid,
+                    p.riot_id_game_name_norm AS riot_name,
+                    m.game_mode_norm AS game_mode,
+                    COALESCE(p.champion_name, '') AS champion_name,
+                    COALESCE(p.champion_name_norm, '') AS champion_name_norm,
+                    COALESCE(strftime('%Y', m.game_creation), '') AS year,
+                    m.game_duration, m.game_creation, p.wins, p.triple_kills, p.quadra_kills, p.penta_kills,
+                    p.first_blood_kill, p.first_blood_assist, p.turret_takedowns, p.inhibitor_takedowns,
+                    p.placement, p.vision_score, p.largest_killing_spree, p.summoner_level, p.profile_icon,
+                    p.total_damage_to_champions / (m.game_duration / 60.0) AS dpm,
+                    CASE
+                        WHEN p.deaths = 0 THEN p.kills + p.assists
+                        ELSE CAST((p.kills + p.assists) AS FLOAT) / p.deaths
+                    END AS kda,
+                    CAST(p.total_time_spent_dead AS FLOAT) / m.game_duration * 100 AS time_dead_pct,
+                    p.kill_participation * 100 AS kp,
+                    p.total_damage_taken / (m.game_duration / 60.0) AS damage_taken_pm,
+                    p.gold_earned / (m.game_duration / 60.0) AS gold_pm,
+                    p.total_minions_killed / (m.game_duration / 60.0) AS cs_pm,
+                    CAST(p.placement AS FLOAT) AS placement_f
+                FROM participants p
+                JOIN matches m ON p.match_id = m.match_id
+                WHERE p.riot_id_game_name_norm IS NOT NULL AND m.game_mode_norm IS NOT NULL
+            )
+            WINDOW player_key AS (PARTITION BY riot_name, game_mode, year, champion_name, champion_name_norm, puuid)
+        )
+        GROUP BY riot_name, game_mode, year, champion_name, champion_name_norm, puuid
+        """,
+        # Give the query planner statistics for the new indexes
+        "ANALYZE",
+    ]),
+]
+
+# Group commit settings for the DatabaseWriter
+WRITER_GROUP_COMMIT_SECONDS = 0.05  # Longest a write waits for other writes to share its commit
+WRITER_GROUP_COMMIT_JOBS = 100  # Commit right away once this many writes are waiting
+
+class DatabaseWriter:
+    """Owns the only write connection to the database and applies queued write jobs.
+
+    A job is a function that takes a cursor. Jobs arriving within WRITER_GROUP_COMMIT_SECONDS
+    of each other (up to WRITER_GROUP_COMMIT_JOBS) share one transaction and one commit,
+    each inside its own savepoint so a failing job only fails its own caller.
+    It runs on a thread because sqlite3 calls block; callers await the returned future.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.jobs: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="DatabaseWriter", daemon=True)
+        self.thread.start()
+
+    def submit(self, job: Callable[[sqlite3.Cursor], Any]) -> asyncio.Future:
+        """Queue a write job, the future resolves to its return value once committed."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.jobs.put((job, future, loop))
+        return future
+
+    def stop(self):
+        """Finish the queued jobs and close the connection."""
+        self.jobs.put(None)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode, transactions and savepoints are managed explicitly in _run
+        conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")  # 256 MB
+        return conn
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]):
+        if future.done():  # Caller gave up waiting
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _run(self):
+        conn = None
+        stopping = False
+        while not stopping:
+            first = self.jobs.get()
+            if first is None:
+                break
+            batch = [first]
+            # Collect more jobs until the group commit window closes
+            deadline = time.monotonic() + WRITER_GROUP_COMMIT_SECONDS
+            while len(batch) < WRITER_GROUP_COMMIT_JOBS:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self.jobs.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+
+            outcomes = []
+            try:
+                if conn is None:
+                    conn = self._connect()
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                for job, future, loop in batch:
+                    cursor.execute("SAVEPOINT writer_job")
+                    try:
+                        result = job(cursor)
+                        cursor.execute("RELEASE SAVEPOINT writer_job")
+                        outcomes.append((future, loop, result, None))
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT writer_job")
+                        cursor.execute("RELEASE SAVEPOINT writer_job")
+                        outcomes.append((future, loop, None, e))
+                cursor.execute("COMMIT")
+            except sqlite3.Error as e:
+                print(f"❌ Database writer failed to commit {len(batch)} jobs: {e}")
+                if conn is not None and conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                outcomes = [(future, loop, None, e) for _, future, loop in batch]
+
+            for future, loop, result, error in outcomes:
+                try:
+                    loop.call_soon_threadsafe(self._resolve, future, result, error)
+                except RuntimeError:
+                    pass  # Event loop already closed
+        if conn is not None:
+            conn.close()
+
+class DatabaseReadPool:
+    """Runs read queries on a bounded thread pool so sqlite3 never blocks the event loop.
+
+    Each worker thread keeps one connection, opened with its PRAGMAs on first use and
+    reused for every query that thread runs. Query functions take the connection as
+    their first argument.
+    """
+
+    def __init__(self, db_path: str, size: int):
+        self.db_path = db_path
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="DatabaseReader")
+        self.local = threading.local()
+        self.connections: List[sqlite3.Connection] = []
+        self.lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # check_same_thread=False only so close() can close it from the event loop thread
+            conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA mmap_size=268435456")  # 256 MB
+            conn.execute("PRAGMA cache_size=-32000")  # 32 MB page cache per connection
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def _call(self, fn: Callable[..., Any], args: tuple) -> Any:
+        conn = self._connection()
+        try:
+            return fn(conn, *args)
+        finally:
+            # Leave the pooled connection the way we found it
+            conn.row_factory = None
+            if conn.in_transaction:
+                conn.rollback()
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(conn, *args) on a pooled connection and return its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._call, fn, args)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+
+class QueryCache:
+    """In-process LRU + TTL cache for read results, bounded by entry count and approximate size.
+
+    Every entry carries tags naming the data it was computed from (("puuid", ...),
+    ("name", ...), ("champion", champion, mode)). Writes invalidate exactly the entries
+    sharing a tag with what they changed. A read that overlapped an invalidation is not
+    stored, so a result computed from pre-write rows never lands in the cache.
+    Only used from the event loop thread, so it needs no locking.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, Tuple[Any, float, Set[tuple], int]]" = OrderedDict()
+        self.tag_index: Dict[tuple, Set[Hashable]] = {}
+        self.size = 0
+        self.generation = 0  # Bumped by every invalidation
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _copy(value):
+        # Callers may set attributes on the returned objects, hand out copies
+        if isinstance(value, list):
+            return [copy.copy(item) for item in value]
+        return copy.copy(value)
+
+    @staticmethod
+    def _estimate_size(value) -> int:
+        if isinstance(value, (list, tuple)):
+            return sys.getsizeof(value) + sum(QueryCache._estimate_size(item) for item in value)
+        if hasattr(value, "__dict__"):
+            return sys.getsizeof(value) + sys.getsizeof(value.__dict__) + sum(sys.getsizeof(v) for v in value.__dict__.values())
+        return sys.getsizeof(value)
+
+    def _remove(self, key: Hashable):
+        _, _, tags, size = self.entries.pop(key)
+        self.size -= size
+        for tag in tags:
+            keys = self.tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tag_index[tag]
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Return (hit, value), value is a copy of the cached result."""
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, self._copy(entry[0])
+
+    def token(self) -> int:
+        """Take before running the query, pass to put()."""
+        return self.generation
+
+    def put(self, key: Hashable, value: Any, tags: Iterable[tuple], token: int):
+        if token != self.generation:
+            return  # Something was invalidated while the query ran, the result may predate it
+        if key in self.entries:
+            self._remove(key)
+        value = self._copy(value)
+        size = self._estimate_size(value)
+        if size > self.max_bytes:
+            return
+        tags = set(tags)
+        self.entries[key] = (value, time.monotonic() + self.ttl, tags, size)
+        self.size += size
+        for tag in tags:
+            self.tag_index.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def invalidate(self, tags: Iterable[tuple]):
+        """Drop every entry sharing a tag with tags."""
+        self.generation += 1
+        for tag in tags:
+            for key in list(self.tag_index.get(tag, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        self.generation += 1
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+        self.tag_index.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+class ChampionIndex:
+    """In-memory champion lookup by numeric id, Data Dragon key or display name.
+
+    Built from the champions table. load() swaps in complete new maps, so readers
+    never see a half-built index.
+    """
+
+    def __init__(self):
+        self.by_id: Dict[int, ChampionRef] = {}
+        self.by_name: Dict[str, ChampionRef] = {}  # normalize_key of both key and display name
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def load(self, champions: Iterable[ChampionRef]):
+        by_id, by_name = {}, {}
+        for champion in champions:
+            by_id[champion.id] = champion
+            by_name[normalize_key(champion.name)] = champion
+            by_name[normalize_key(champion.key)] = champion
+        self.by_id, self.by_name = by_id, by_name
+
+    def add(self, champion: ChampionRef):
+        self.by_id[champion.id] = champion
+        self.by_name[normalize_key(champion.name)] = champion
+        self.by_name[normalize_key(champion.key)] = champion
+
+    def get(self, id) -> Optional[ChampionRef]:
+        try:
+            return self.by_id.get(int(id))
+        except (TypeError, ValueError):
+            return None
+
+    def find(self, name: str) -> Optional[ChampionRef]:
+        """Resolve a Data Dragon key ("MonkeyKing") or display name ("Wukong")."""
+        return self.by_name.get(normalize_key(name))
+
 class DatabaseOperations(commands.Cog):
     def __init__(self, bot):
+        # Load .env from the project root (one folder up from src)
+        env_path = Path(__file__).parent.parent.parent / '.env'
+        load_dotenv(env_path)
         self.bot = bot
         self.db_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../database/lol_database.db'))
+        # Read queries run on this pool, size is configurable with DB_READ_POOL_SIZE
+        self.readers = DatabaseReadPool(self.db_path, int(os.getenv("DB_READ_POOL_SIZE", DB_READ_POOL_SIZE)))
+        # Column names of the challenges table, read once on first use
+        self.challenge_columns: Optional[Set[str]] = None
+        # Every write goes through this single writer
+        self.writer = DatabaseWriter(self.db_path)
+        # Pending schema migrations, started on cog load and awaited by ensure_schema
+        self.schema_task: Optional[asyncio.Future] = None
+        # Results of the hot read queries, invalidated by the writes that change them
+        self.cache = QueryCache(
+            int(os.getenv("QUERY_CACHE_MAX_ENTRIES", QUERY_CACHE_MAX_ENTRIES)),
+            int(os.getenv("QUERY_CACHE_MAX_BYTES", QUERY_CACHE_MAX_BYTES)),
+            float(os.getenv("QUERY_CACHE_TTL_SECONDS", QUERY_CACHE_TTL_SECONDS))
+        )
+        # Champion id/key/name lookups, loaded from the champions table on cog load
+        self.champions = ChampionIndex()
+        # Set by enqueue_job so the job workers don't sleep through a job that is due right away
+        self.job_enqueued = asyncio.Event()
 
-    async def get_player_stats(self, username, gamemode, champion=None, limit=200, sort_by="champion games", sort_order="DESC", min_games=1, year=None) -> List[PlayerStats]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    async def cog_load(self):
+        """Bring the schema up to date and load the champion index as soon as the cog is loaded."""
+        await self.ensure_schema()
+        await self.load_champion_index()
 
+    def cog_unload(self):
+        """Stop the writer thread and the read pool when the cog is unloaded or reloaded."""
+        self.writer.stop()
+        self.readers.close()
+
+    async def ensure_schema(self) -> bool:
+        """Apply pending MIGRATIONS once; later calls return as soon as they are done.
+
+        Returns False if a migration failed, it is retried on the next call.
+        """
+        if self.schema_task is None:
+            self.schema_task = asyncio.ensure_future(self.writer.submit(self._apply_migrations))
+        try:
+            await asyncio.shield(self.schema_task)
+            return True
+        except Exception as e:
+            print(f"❌ Schema migration failed: {e}")
+            self.schema_task = None
+            return False
+
+    @staticmethod
+    def _apply_migrations(cursor) -> List[int]:
+        """Writer job: run every migration newer than the recorded schema version."""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+        newly_applied = []
+        for version, description, statements in MIGRATIONS:
+            if version in applied:
+                continue
+            print(f"🛠️ Applying schema migration {version}: {description}")
+            for statement in statements:
+                if callable(statement):
+                    statement(cursor)
+                else:
+                    cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (?, ?)", (version, description))
+            newly_applied.append(version)
+        return newly_applied
+
+    @staticmethod
+    def _resolve_player_puuids(cursor, name_norm: str) -> List[str]:
+        """
+        puuids of the tracked users a game name refers to: users that currently have that
+        name or played under it before. Their games are then looked up by puuid, so a
+        renamed player keeps the history of their old names.
+        """
+        cursor.execute('''
+            SELECT DISTINCT a.puuid
+            FROM player_champion_mode_agg a
+            JOIN users u ON u.puuid = a.puuid
+            WHERE a.riot_name = ?
+        ''', (name_norm,))
+        puuids = {row[0] for row in cursor.fetchall()}
+        cursor.execute("SELECT DISTINCT puuid, riot_id_game_name FROM users WHERE puuid IS NOT NULL")
+        puuids.update(puuid for puuid, game_name in cursor.fetchall() if normalize_key(game_name) == name_norm)
+        return sorted(puuids)
+
+    async def get_player_stats(self, username, gamemode, champion=None, limit=200, sort_by="champion games", sort_order="DESC", min_games=1, year=None) -> List[PlayerStats]:
         # Define valid sort columns and their SQL expressions
         sort_columns = {
             "champion games": "total_games",
@@ -31,343 +848,444 @@ class DatabaseOperations(commands.Cog):
 
         # Validate and get sort column
         sort_column = sort_columns.get(sort_by, "total_games")
-        
+
         # Validate sort order
         sort_order = "DESC" if sort_order.upper() not in ["ASC", "DESC"] else sort_order.upper()
 
-        # Add year filter to base query if year is provided
-        year_filter = f"AND strftime('%Y', m.game_creation) = '{year}'" if year else ""
+        name_norm = normalize_key(username)
+        cache_key = ("player_stats", name_norm, normalize_key(gamemode), normalize_key(champion),
+                     limit, sort_column, sort_order, min_games, str(year) if year else None)
+        hit, cached = self.cache.get(cache_key)
+        if hit:
+            return cached
+        token = self.cache.token()
 
-        base_query = f'''
-        WITH base_data AS (
-            SELECT p.*, m.game_duration, m.game_creation
-            FROM participants p
-            JOIN matches m ON p.match_id = m.match_id
-            WHERE LOWER(p.riot_id_game_name) = LOWER(?)
-            AND LOWER(m.game_mode) = LOWER(?)
-            {year_filter}
-            {{champion_filter}}
-        ),
-        champion_stats AS (
+        await self.ensure_schema()
+
+        def read(conn):
+            cursor = conn.cursor()
+
+            # Aggregates come pre-summed from player_champion_mode_agg, AVG() becomes sum / count.
+            # base_data is read once: per-champion stats come from one GROUP BY, the overall
+            # stats from window functions over those groups, before min_games filters them.
+            # Tracked players are looked up by puuid so their games under previous names count too
+            puuids = self._resolve_player_puuids(cursor, name_norm)
+            if puuids:
+                player_filter = f"puuid IN ({', '.join('?' * len(puuids))})"
+                player_params = puuids
+            else:
+                player_filter = "riot_name = ?"
+                player_params = [name_norm]
+
+            filters = ""
+            params = player_params + [normalize_key(gamemode)]
+            if year:
+                filters += " AND year = ?"
+                params.append(str(year))
+            if champion:
+                # If champion is specified, filter for that champion
+                filters += " AND champion_name_norm = ?"
+                params.append(normalize_key(champion))
+
+            query = f'''
+            WITH base_data AS (
+                SELECT *,
+                    MAX(max_killing_spree) OVER () as base_max_killing_spree,
+                    MAX(max_kda) OVER () as base_max_kda
+                FROM player_champion_mode_agg
+                WHERE {player_filter}
+                AND game_mode = ?
+                {filters}
+            ),
+            champion_stats AS (
+                SELECT 
+                    champion_name,
+                    SUM(games) as total_games,
+                    ROUND(100.0 * SUM(wins) / SUM(games), 1) as winrate,
+                    ROUND(TOTAL(dpm_sum) / SUM(dpm_n), 0) as avg_damage_per_minute,
+                    ROUND(TOTAL(kda_sum) / SUM(kda_n), 2) as average_kda,
+                    SUM(triples) as total_triples,
+                    SUM(quadras) as total_quadras,
+                    SUM(pentas) as total_pentas,
+                    ROUND(TOTAL(time_dead_pct_sum) / SUM(time_dead_pct_n), 1) as avg_time_dead_pct,
+                    ROUND(TOTAL(cs_pm_sum) / SUM(cs_pm_n), 1) as avg_cs_per_min,
+                    ROUND(TOTAL(placement_sum) / SUM(placement_n), 2) as avg_placement,
+                    SUM(first_places) as first_place_count,
+                    -- Partial sums for the overall stats
+                    SUM(wins) as wins,
+                    MIN(oldest_game) as oldest_game,
+                    SUM(duration_sum) as duration_sum,
+                    SUM(first_bloods) as first_bloods,
+                    SUM(objectives) as objectives,
+                    TOTAL(kp_sum) as kp_sum, SUM(kp_n) as kp_n,
+                    TOTAL(vision_sum) as vision_sum, SUM(vision_n) as vision_n,
+                    TOTAL(gold_pm_sum) as gold_pm_sum, SUM(gold_pm_n) as gold_pm_n,
+                    TOTAL(damage_taken_pm_sum) as damage_taken_pm_sum, SUM(damage_taken_pm_n) as damage_taken_pm_n,
+                    MAX(max_killing_spree) as max_killing_spree,
+                    MAX(max_kda) as max_kda,
+                    MIN(CASE WHEN max_killing_spree = base_max_killing_spree THEN max_killing_spree_match END) as max_killing_spree_match,
+                    MIN(CASE WHEN max_kda = base_max_kda THEN max_kda_match END) as max_kda_match
+                FROM base_data
+                GROUP BY champion_name
+            ),
+            overall_stats AS (
+                SELECT *,
+                    SUM(total_games) OVER () as overall_games,
+                    COUNT(*) OVER () as overall_unique_champions,
+                    MIN(oldest_game) OVER () as overall_oldest_game,
+                    SUM(duration_sum) OVER () as overall_duration,
+                    SUM(total_pentas) OVER () as overall_pentas,
+                    ROUND(100.0 * SUM(wins) OVER () / SUM(total_games) OVER (), 1) as overall_winrate,
+                    ROUND(SUM(kp_sum) OVER () / SUM(kp_n) OVER (), 1) as overall_kill_participation,
+                    ROUND(SUM(vision_sum) OVER () / SUM(vision_n) OVER (), 1) as overall_vision_score,
+                    ROUND(SUM(gold_pm_sum) OVER () / SUM(gold_pm_n) OVER (), 0) as overall_gold_per_min,
+                    ROUND(SUM(damage_taken_pm_sum) OVER () / SUM(damage_taken_pm_n) OVER (), 0) as overall_damage_taken_per_min,
+                    SUM(first_bloods) OVER () as overall_first_bloods,
+                    SUM(objectives) OVER () as overall_objectives,
+                    MAX(max_killing_spree) OVER () as overall_max_killing_spree,
+                    MAX(max_kda) OVER () as overall_max_kda,
+                    FIRST_VALUE(CASE WHEN max_killing_spree_match IS NOT NULL THEN champion_name END)
+                        OVER (ORDER BY max_killing_spree_match IS NULL, max_killing_spree_match) as max_killing_spree_champion,
+                    FIRST_VALUE(CASE WHEN max_kda_match IS NOT NULL THEN champion_name END)
+                        OVER (ORDER BY max_kda_match IS NULL, max_kda_match) as max_kda_champion
+                FROM champion_stats
+            ),
+            latest_info AS (
+                -- Latest summoner level and profile icon, over all game modes
+                SELECT latest_summoner_level, latest_profile_icon
+                FROM player_champion_mode_agg
+                WHERE {player_filter}
+                ORDER BY latest_game DESC
+                LIMIT 1
+            )
             SELECT 
                 champion_name,
-                COUNT(*) as total_games,
-                ROUND(AVG(CASE WHEN wins = 1 THEN 100.0 ELSE 0 END), 1) as winrate,
-                ROUND(AVG(total_damage_to_champions / (game_duration / 60.0)), 0) as avg_damage_per_minute,
-                ROUND(AVG(CASE 
-                    WHEN deaths = 0 THEN kills + assists 
-                    ELSE CAST((kills + assists) AS FLOAT) / deaths 
-                END), 2) as average_kda,
-                ROUND(AVG(CAST(kills AS FLOAT)), 1) as avg_kills,
-                ROUND(AVG(CAST(deaths AS FLOAT)), 1) as avg_deaths,
-                ROUND(AVG(CAST(assists AS FLOAT)), 1) as avg_assists,
-                SUM(triple_kills) as total_triples,
-                SUM(quadra_kills) as total_quadras,
-                SUM(penta_kills) as total_pentas,
-                ROUND(AVG(CAST(total_time_spent_dead AS FLOAT) / game_duration * 100), 1) as avg_time_dead_pct,
-                ROUND(AVG(vision_score), 1) as avg_vision_score,
-                ROUND(AVG(kill_participation * 100), 1) as avg_kill_participation,
-                ROUND(AVG(total_damage_taken / (game_duration / 60.0)), 0) as avg_damage_taken_per_min,
-                SUM(CASE WHEN first_blood_kill = 1 OR first_blood_assist = 1 THEN 1 ELSE 0 END) as total_first_bloods,
-                SUM(turret_takedowns + inhibitor_takedowns) as total_objectives,
-                ROUND(AVG(gold_earned / (game_duration / 60.0)), 0) as avg_gold_per_min,
-                ROUND(AVG(total_minions_killed / (game_duration / 60.0)), 1) as avg_cs_per_min,
-                MAX(largest_killing_spree) as max_killing_spree,
-                MAX(CASE 
-                    WHEN deaths = 0 THEN kills + assists 
-                    ELSE CAST((kills + assists) AS FLOAT) / deaths 
-                END) as max_kda,
-                ROUND(AVG(CAST(placement AS FLOAT)), 2) as avg_placement,
-                SUM(CASE WHEN placement = 1 THEN 1 ELSE 0 END) as first_place_count
-            FROM base_data
-            GROUP BY champion_name
-            HAVING total_games >= ?
-        ),
-        overall_stats AS (
-            SELECT 
-                ROUND(AVG(kill_participation * 100), 1) as overall_kill_participation,
-                MAX(largest_killing_spree) as overall_max_killing_spree,
-                (SELECT p2.champion_name FROM base_data p2 WHERE p2.largest_killing_spree = (SELECT MAX(largest_killing_spree) FROM base_data)) as max_killing_spree_champion,
-                SUM(CASE WHEN first_blood_kill = 1 OR first_blood_assist = 1 THEN 1 ELSE 0 END) as overall_first_bloods,
-                SUM(turret_takedowns + inhibitor_takedowns) as overall_objectives,
-                ROUND(AVG(gold_earned / (game_duration / 60.0)), 0) as overall_gold_per_min,
-                ROUND(AVG(total_damage_taken / (game_duration / 60.0)), 0) as overall_damage_taken_per_min,
-                ROUND(AVG(total_minions_killed / (game_duration / 60.0)), 1) as overall_cs_per_min,
-                MAX(CASE 
-                    WHEN deaths = 0 THEN kills + assists 
-                    ELSE CAST((kills + assists) AS FLOAT) / deaths 
-                END) as overall_max_kda,
-                (SELECT p2.champion_name FROM base_data p2 WHERE (CASE WHEN p2.deaths = 0 THEN p2.kills + p2.assists ELSE CAST((p2.kills + p2.assists) AS FLOAT) / p2.deaths END) = 
-                    (SELECT MAX(CASE WHEN deaths = 0 THEN kills + assists ELSE CAST((kills + assists) AS FLOAT) / deaths END) FROM base_data)) as max_kda_champion,
-                ROUND(AVG(vision_score), 1) as overall_vision_score,
-                (SELECT summoner_level FROM base_data ORDER BY game_creation DESC LIMIT 1) as latest_summoner_level,
-                (SELECT profile_icon FROM base_data ORDER BY game_creation DESC LIMIT 1) as latest_profile_icon
-            FROM base_data
-        )
-        SELECT 
-            champion_name,
-            total_games as champion_games,
-            winrate,
-            avg_damage_per_minute,
-            average_kda,
-            (SELECT COUNT(*) FROM base_data) as total_games_overall,
-            (SELECT COUNT(DISTINCT champion_name) FROM base_data) as unique_champions_played,
-            ROUND(CAST((SELECT COUNT(DISTINCT champion_name) FROM base_data) AS FLOAT) / 
-                (SELECT COUNT(*) FROM base_data) * 100, 1) as unique_champ_ratio,
-            (SELECT MIN(game_creation) FROM base_data) as oldest_game,
-            ROUND(CAST((SELECT SUM(game_duration) FROM base_data) AS FLOAT) / 3600, 1) as total_hours_played,
-            total_triples,
-            total_quadras,
-            total_pentas,
-            (SELECT SUM(penta_kills) FROM base_data) as total_pentas_overall,
-            (SELECT ROUND(AVG(CASE WHEN wins = 1 THEN 100.0 ELSE 0 END), 1) FROM base_data) as total_winrate,
-            avg_time_dead_pct,
-            (SELECT overall_vision_score FROM overall_stats) as avg_vision_score,
-            (SELECT overall_kill_participation FROM overall_stats) as avg_kill_participation,
-            (SELECT overall_damage_taken_per_min FROM overall_stats) as avg_damage_taken_per_min,
-            (SELECT overall_first_bloods FROM overall_stats) as total_first_bloods,
-            (SELECT overall_objectives FROM overall_stats) as total_objectives,
-            (SELECT overall_gold_per_min FROM overall_stats) as avg_gold_per_min,
-            avg_cs_per_min,
-            (SELECT overall_max_killing_spree FROM overall_stats) as max_killing_spree,
-            (SELECT overall_max_kda FROM overall_stats) as max_kda,
-            (SELECT max_killing_spree_champion FROM overall_stats) as max_killing_spree_champion,
-            (SELECT max_kda_champion FROM overall_stats) as max_kda_champion,
-            (SELECT latest_summoner_level FROM overall_stats) as summoner_level,
-            (SELECT latest_profile_icon FROM overall_stats) as profile_icon,
-            avg_placement,
-            first_place_count
-        FROM champion_stats
-        ORDER BY {sort_column} {sort_order}, champion_games DESC
-        LIMIT ?;
-        '''
+                total_games as champion_games,
+                winrate,
+                avg_damage_per_minute,
+                average_kda,
+                overall_games as total_games_overall,
+                overall_unique_champions as unique_champions_played,
+                ROUND(CAST(overall_unique_champions AS FLOAT) / overall_games * 100, 1) as unique_champ_ratio,
+                overall_oldest_game as oldest_game,
+                ROUND(CAST(overall_duration AS FLOAT) / 3600, 1) as total_hours_played,
+                total_triples,
+                total_quadras,
+                total_pentas,
+                overall_pentas as total_pentas_overall,
+                overall_winrate as total_winrate,
+                avg_time_dead_pct,
+                overall_vision_score as avg_vision_score,
+                overall_kill_participation as avg_kill_participation,
+                overall_damage_taken_per_min as avg_damage_taken_per_min,
+                overall_first_bloods as total_first_bloods,
+                overall_objectives as total_objectives,
+                overall_gold_per_min as avg_gold_per_min,
+                avg_cs_per_min,
+                overall_max_killing_spree as max_killing_spree,
+                overall_max_kda as max_kda,
+                max_killing_spree_champion,
+                max_kda_champion,
+                latest_summoner_level as summoner_level,
+                latest_profile_icon as profile_icon,
+                avg_placement,
+                first_place_count
+            FROM overall_stats
+            LEFT JOIN latest_info ON 1 = 1
+            WHERE total_games >= ?
+            ORDER BY {sort_column} {sort_order}, champion_games DESC, champion_name
+            LIMIT ?;
+            '''
+            cursor.execute(query, params + player_params + [min_games, limit])
+            results = cursor.fetchall()
 
-        if champion:
-            # If champion is specified, filter for that champion and remove the HAVING clause
-            query = base_query.format(
-                champion_filter="AND LOWER(p.champion_name) = LOWER(?)",
-                sort_column=sort_column,
-                sort_order=sort_order
-            )
-            cursor.execute(query, (username, gamemode, champion, min_games, limit))
-        else:
-            # Original behavior: show champions with minimum games
-            query = base_query.format(
-                champion_filter="",
-                sort_column=sort_column,
-                sort_order=sort_order
-            )
-            cursor.execute(query, (username, gamemode, min_games, limit))
-
-        results = cursor.fetchall()
-
-        # Additional query to get latest summoner level and profile icon
-        latest_info_query = '''
-        SELECT summoner_level, profile_icon
-        FROM participants p
-        JOIN matches m ON p.match_id = m.match_id
-        WHERE LOWER(p.riot_id_game_name) = LOWER(?)
-        ORDER BY m.game_creation DESC
-        LIMIT 1;
-        '''
-        cursor.execute(latest_info_query, (username,))
-        latest_info = cursor.fetchone()
-        conn.close()
-
-        player_stats = []
-        for row in results:
-            player_stats.append(PlayerStats(
-                champion_name=row[0],
-                champion_games=row[1],
-                winrate=row[2],
-                avg_damage_per_minute=row[3],
-                average_kda=row[4],
-                total_games_overall=row[5],
-                unique_champions_played=row[6],
-                unique_champ_ratio=row[7],
-                oldest_game=row[8],
-                total_hours_played=row[9],
-                total_triples=row[10],
-                total_quadras=row[11],
-                total_pentas=row[12],
-                total_pentas_overall=row[13],
-                total_winrate=row[14],
-                avg_time_dead_pct=row[15],
-                avg_vision_score=row[16],
-                avg_kill_participation=row[17],
-                avg_damage_taken_per_min=row[18],
-                total_first_bloods=row[19],
-                total_objectives=row[20],
-                avg_gold_per_min=row[21],
-                avg_cs_per_min=row[22],
-                max_killing_spree=row[23],
-                max_kda=row[24],
-                max_killing_spree_champion=row[25],
-                max_kda_champion=row[26],
-                summoner_level=latest_info[0] if latest_info else 0,
-                profile_icon=latest_info[1] if latest_info else 0,
-                avg_placement=row[29],
-                first_place_count=row[30]
-            ))
-        if not player_stats:
-            # If no champion stats found, still create an entry with the latest summoner info
-            player_stats.append(PlayerStats(
-                champion_name="",
-                champion_games=0,
-                winrate=0.0,
-                avg_damage_per_minute=0.0,
-                average_kda=0.0,
-                total_games_overall=0,
-                unique_champions_played=0,
-                unique_champ_ratio=0.0,
-                oldest_game="",
-                total_hours_played=0.0,
-                total_triples=0,
-                total_quadras=0,
-                total_pentas=0,
-                total_pentas_overall=0,
-                total_winrate=0.0,
-                avg_time_dead_pct=0.0,
-                avg_vision_score=0.0,
-                avg_kill_participation=0.0,
-                avg_damage_taken_per_min=0.0,
-                total_first_bloods=0,
-                total_objectives=0,
-                avg_gold_per_min=0.0,
-                avg_cs_per_min=0.0,
-                max_killing_spree=0,
-                max_kda=0.0,
-                max_killing_spree_champion="",
-                max_kda_champion="",
-                summoner_level=latest_info[0] if latest_info else 0,
-                profile_icon=latest_info[1] if latest_info else 0,
-                avg_placement=0.0,
-                first_place_count=0
-            ))
+            latest_info = results[0][27:29] if results else None
+            if not results:
+                # No champion rows, still look up the latest summoner info for the empty entry
+                cursor.execute(f'''
+                SELECT latest_summoner_level, latest_profile_icon
+                FROM player_champion_mode_agg
+                WHERE {player_filter}
+                ORDER BY latest_game DESC
+                LIMIT 1;
+                ''', player_params)
+                latest_info = cursor.fetchone()
+
+            player_stats = []
+            for row in results:
+                player_stats.append(PlayerStats(
+                    champion_name=row[0],
+                    champion_games=row[1],
+                    winrate=row[2],
+                    avg_damage_per_minute=row[3],
+                    average_kda=row[4],
+                    total_games_overall=row[5],
+                    unique_champions_played=row[6],
+                    unique_champ_ratio=row[7],
+                    oldest_game=row[8],
+                    total_hours_played=row[9],
+                    total_triples=row[10],
+                    total_quadras=row[11],
+                    total_pentas=row[12],
+                    total_pentas_overall=row[13],
+                    total_winrate=row[14],
+                    avg_time_dead_pct=row[15],
+                    avg_vision_score=row[16],
+                    avg_kill_participation=row[17],
+                    avg_damage_taken_per_min=row[18],
+                    total_first_bloods=row[19],
+                    total_objectives=row[20],
+                    avg_gold_per_min=row[21],
+                    avg_cs_per_min=row[22],
+                    max_killing_spree=row[23],
+                    max_kda=row[24],
+                    max_killing_spree_champion=row[25],
+                    max_kda_champion=row[26],
+                    summoner_level=latest_info[0] if latest_info else 0,
+                    profile_icon=latest_info[1] if latest_info else 0,
+                    avg_placement=row[29],
+                    first_place_count=row[30]
+                ))
+            if not player_stats:
+                # If no champion stats found, still create an entry with the latest summoner info
+                player_stats.append(PlayerStats(
+                    champion_name="",
+                    champion_games=0,
+                    winrate=0.0,
+                    avg_damage_per_minute=0.0,
+                    average_kda=0.0,
+                    total_games_overall=0,
+                    unique_champions_played=0,
+                    unique_champ_ratio=0.0,
+                    oldest_game="",
+                    total_hours_played=0.0,
+                    total_triples=0,
+                    total_quadras=0,
+                    total_pentas=0,
+                    total_pentas_overall=0,
+                    total_winrate=0.0,
+                    avg_time_dead_pct=0.0,
+                    avg_vision_score=0.0,
+                    avg_kill_participation=0.0,
+                    avg_damage_taken_per_min=0.0,
+                    total_first_bloods=0,
+                    total_objectives=0,
+                    avg_gold_per_min=0.0,
+                    avg_cs_per_min=0.0,
+                    max_killing_spree=0,
+                    max_kda=0.0,
+                    max_killing_spree_champion="",
+                    max_kda_champion="",
+                    summoner_level=latest_info[0] if latest_info else 0,
+                    profile_icon=latest_info[1] if latest_info else 0,
+                    avg_placement=0.0,
+                    first_place_count=0
+                ))
+            return player_stats, puuids
+
+        player_stats, puuids = await self.readers.run(read)
+        self.cache.put(cache_key, player_stats, [("name", name_norm)] + [("puuid", puuid) for puuid in puuids], token)
         return player_stats
 
     async def get_all_players_stats(self) -> List[UserStats]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        def read(conn):
+            cursor = conn.cursor()
 
-        query = '''
-        WITH earliest_match AS (
+            query = '''
+            WITH earliest_match AS (
+                SELECT 
+                    puuid, 
+                    MIN(m.game_creation) AS first_game_date,
+                    (SELECT p2.match_id 
+                     FROM participants p2 
+                     JOIN matches m2 ON p2.match_id = m2.match_id 
+                     WHERE p2.puuid = p1.puuid 
+                     ORDER BY m2.game_creation ASC LIMIT 1) AS first_match_id
+                FROM participants p1
+                JOIN matches m ON p1.match_id = m.match_id
+                GROUP BY p1.puuid
+            )
             SELECT 
-                puuid, 
-                MIN(m.game_creation) AS first_game_date,
-                (SELECT p2.match_id 
-                 FROM participants p2 
-                 JOIN matches m2 ON p2.match_id = m2.match_id 
-                 WHERE p2.puuid = p1.puuid 
-                 ORDER BY m2.game_creation ASC LIMIT 1) AS first_match_id
-            FROM participants p1
-            JOIN matches m ON p1.match_id = m.match_id
-            GROUP BY p1.puuid
-        )
-        SELECT 
-            p.riot_id_game_name,
-            p.riot_id_tagline,
-            ROUND(SUM(p.time_played) / 3600.0, 2) AS total_hours_played,
-            ROUND(
-                SUM(
-                    CASE 
-                        WHEN strftime('%Y', m.game_creation) = '2025' 
-                        THEN p.time_played 
-                        ELSE 0 
-                    END
-                ) / 3600.0, 2
-            ) AS total_hours_2024,
-            COUNT(p.match_id) AS games_played,
-            ROUND(AVG(p.time_played) / 60.0, 2) AS avg_minutes_per_game,
-            e.first_game_date,
-            SUM(p.penta_kills) as total_pentas,
-            ROUND(100.0 * SUM(CASE WHEN p.wins = 1 THEN 1 ELSE 0 END) / COUNT(*), 1) as winrate
-        FROM participants p
-        JOIN matches m ON p.match_id = m.match_id
-        JOIN earliest_match e ON p.puuid = e.puuid
-        JOIN participants ep ON ep.puuid = e.puuid AND ep.match_id = e.first_match_id
-        GROUP BY p.puuid
-        ORDER BY total_hours_played DESC
-        LIMIT 20;
-        '''
-        
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.close()
-        
-        return [UserStats(
-            riot_id_game_name=row[0],
-            riot_id_tagline=row[1],
-            total_hours_played=row[2],
-            total_hours_2024=row[3],
-            games_played=row[4],
-            avg_minutes_per_game=row[5],
-            first_game_date=row[6],
-            total_pentas=row[7],
-            winrate=row[8]
-        ) for row in results]
+                p.riot_id_game_name,
+                p.riot_id_tagline,
+                ROUND(SUM(p.time_played) / 3600.0, 2) AS total_hours_played,
+                ROUND(
+                    SUM(
+                        CASE 
+                            WHEN strftime('%Y', m.game_creation) = '2025' 
+                            THEN p.time_played 
+                            ELSE 0 
+                        END
+                    ) / 3600.0, 2
+                ) AS total_hours_2024,
+                COUNT(p.match_id) AS games_played,
+                ROUND(AVG(p.time_played) / 60.0, 2) AS avg_minutes_per_game,
+                e.first_game_date,
+                SUM(p.penta_kills) as total_pentas,
+                ROUND(100.0 * SUM(CASE WHEN p.wins = 1 THEN 1 ELSE 0 END) / COUNT(*), 1) as winrate
+            FROM participants p
+            JOIN matches m ON p.match_id = m.match_id
+            JOIN earliest_match e ON p.puuid = e.puuid
+            JOIN participants ep ON ep.puuid = e.puuid AND ep.match_id = e.first_match_id
+            GROUP BY p.puuid
+            ORDER BY total_hours_played DESC
+            LIMIT 20;
+            '''
+
+            cursor.execute(query)
+            results = cursor.fetchall()
+
+            return [UserStats(
+                riot_id_game_name=row[0],
+                riot_id_tagline=row[1],
+                total_hours_played=row[2],
+                total_hours_2024=row[3],
+                games_played=row[4],
+                avg_minutes_per_game=row[5],
+                first_game_date=row[6],
+                total_pentas=row[7],
+                winrate=row[8]
+            ) for row in results]
+
+        return await self.readers.run(read)
 
     async def get_player_friend_stats(self, username) -> List[PlayerFriendStats]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        def read(conn):
+            cursor = conn.cursor()
 
-        query = '''
-        WITH my_matches AS (
-            SELECT 
-                p.match_id, 
-                p.team_id, 
-                CASE WHEN p.wins = 1 THEN 1 ELSE 0 END AS my_win
-            FROM participants p
-            WHERE LOWER(p.riot_id_game_name) = LOWER(?)
-        ),
-        teammates AS (
-            SELECT
-                p2.riot_id_game_name AS teammate_name,
-                COUNT(*) AS games_together,
-                SUM(CASE WHEN m.my_win = 1 THEN 1 ELSE 0 END) AS wins_together,
-                ROUND(
-                    100.0 * SUM(CASE WHEN m.my_win = 1 THEN 1 ELSE 0 END) 
-                    / COUNT(*), 1
-                ) AS win_rate
-            FROM my_matches m
-            JOIN participants p2 ON p2.match_id = m.match_id
-            WHERE p2.team_id = m.team_id
-              AND LOWER(p2.riot_id_game_name) <> LOWER(?)
-            GROUP BY p2.riot_id_game_name
-            HAVING COUNT(*) >= 5
-        )
-        SELECT *
-        FROM teammates
-        ORDER BY win_rate DESC, games_together DESC
-        LIMIT 15;
-        '''
-        
-        cursor.execute(query, (username, username))
-        results = cursor.fetchall()
-        conn.close()
-        
-        return [PlayerFriendStats(
-            teammate_name=row[0],
-            games_together=row[1],
-            wins_together=row[2],
-            win_rate=row[3]
-        ) for row in results]
+            # Tracked players are matched by puuid, anyone else by their normalized game name
+            puuids = self._resolve_player_puuids(cursor, normalize_key(username))
+            if puuids:
+                placeholders = ', '.join('?' * len(puuids))
+                player_filter = f"p.puuid IN ({placeholders})"
+                teammate_filter = f"p2.puuid NOT IN ({placeholders}) AND p2.riot_id_game_name_norm IS NOT NULL"
+                player_params = puuids
+            else:
+                player_filter = "p.riot_id_game_name_norm = ?"
+                teammate_filter = "p2.riot_id_game_name_norm <> ?"
+                player_params = [normalize_key(username)]
+
+            query = f'''
+            WITH my_matches AS (
+                SELECT 
+                    p.match_id, 
+                    p.team_id, 
+                    CASE WHEN p.wins = 1 THEN 1 ELSE 0 END AS my_win
+                FROM participants p
+                WHERE {player_filter}
+            ),
+            teammates AS (
+                SELECT
+                    p2.riot_id_game_name AS teammate_name,
+                    COUNT(*) AS games_together,
+                    SUM(CASE WHEN m.my_win = 1 THEN 1 ELSE 0 END) AS wins_together,
+                    ROUND(
+                        100.0 * SUM(CASE WHEN m.my_win = 1 THEN 1 ELSE 0 END) 
+                        / COUNT(*), 1
+                    ) AS win_rate
+                FROM my_matches m
+                JOIN participants p2 ON p2.match_id = m.match_id
+                WHERE p2.team_id = m.team_id
+                  AND {teammate_filter}
+                GROUP BY p2.riot_id_game_name
+                HAVING COUNT(*) >= 5
+            )
+            SELECT *
+            FROM teammates
+            ORDER BY win_rate DESC, games_together DESC
+            LIMIT 15;
+            '''
+
+            cursor.execute(query, player_params + player_params)
+            results = cursor.fetchall()
+
+            return [PlayerFriendStats(
+                teammate_name=row[0],
+                games_together=row[1],
+                wins_together=row[2],
+                win_rate=row[3]
+            ) for row in results]
+
+        return await self.readers.run(read)
 
     async def get_stored_match_ids(self, puuid) -> Set[str]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT DISTINCT match_id 
-            FROM participants 
-            WHERE puuid = ?
-            UNION
-            SELECT match_id
-            FROM matches
-            WHERE game_duration = 0
-        ''', (puuid,))
-        stored_matches = set(row[0] for row in cursor.fetchall())
-        conn.close()
-        return stored_matches
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT DISTINCT match_id 
+                FROM participants 
+                WHERE puuid = ?
+                UNION
+                SELECT match_id
+                FROM matches
+                WHERE game_duration = 0
+            ''', (puuid,))
+            stored_matches = set(row[0] for row in cursor.fetchall())
+            return stored_matches
+
+        return await self.readers.run(read)
+
+    async def get_existing_match_ids(self, match_ids: List[str]) -> Set[str]:
+        """Return which of the given match ids are already stored."""
+        if not match_ids:
+            return set()
+        def read(conn):
+            cursor = conn.cursor()
+            placeholders = ",".join("?" * len(match_ids))
+            cursor.execute(f"SELECT match_id FROM matches WHERE match_id IN ({placeholders})", list(match_ids))
+            existing = set(row[0] for row in cursor.fetchall())
+            return existing
+
+        return await self.readers.run(read)
+
+    async def get_user_watermark(self, puuid: str) -> Optional[int]:
+        """
+        Get the game_end_timestamp (epoch ms) up to which update_database has stored a user's matches.
+        Returns None if no update cycle has stored matches for the user yet. It isn't seeded from
+        stored matches, since finished live games are stored on their own, ahead of older ones.
+        """
+        await self.ensure_schema()
+
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute("SELECT last_game_end_timestamp FROM user_watermarks WHERE puuid = ?", (puuid,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        return await self.readers.run(read)
+
+    async def advance_user_watermarks(self, watermarks: Dict[str, int]):
+        """Move users' watermarks (puuid -> game_end_timestamp in epoch ms) forward, never back.
+
+        Only update_database calls this, once every match it found for a user is stored,
+        so a match that failed to fetch stays inside the next discovery window.
+        """
+        if not watermarks:
+            return
+        def write(cursor):
+            cursor.executemany("""
+                INSERT INTO user_watermarks (puuid, last_game_end_timestamp, updated_at)
+                VALUES (?, ?, datetime('now'))
+                ON CONFLICT(puuid) DO UPDATE SET
+                    last_game_end_timestamp = MAX(last_game_end_timestamp, excluded.last_game_end_timestamp),
+                    updated_at = excluded.updated_at
+            """, list(watermarks.items()))
+        await self.writer.submit(write)
+
+    async def get_match_end_timestamps(self, match_ids: List[str]) -> Dict[str, int]:
+        """game_end_timestamp (epoch ms) of the given stored matches."""
+        if not match_ids:
+            return {}
+        def read(conn):
+            cursor = conn.cursor()
+            placeholders = ",".join("?" * len(match_ids))
+            cursor.execute(f"""
+                SELECT match_id, game_end_timestamp FROM matches
+                WHERE match_id IN ({placeholders}) AND game_end_timestamp > 0
+            """, list(match_ids))
+            return dict(cursor.fetchall())
+
+        return await self.readers.run(read)
 
     async def get_player_match_ids(self, riot_id_game_name: str, game_mode: str = None, limit: int = None, start_date: str = None, end_date: str = None) -> List[str]:
         """
@@ -383,421 +1301,744 @@ class DatabaseOperations(commands.Cog):
         Returns:
             List of match IDs for the player
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Build the query with optional filters
-        query = '''
-            SELECT DISTINCT p.match_id
-            FROM participants p
-            JOIN matches m ON p.match_id = m.match_id
-            WHERE LOWER(p.riot_id_game_name) = LOWER(?)
-        '''
-        params = [riot_id_game_name]
-        
-        if game_mode:
-            query += ' AND LOWER(m.game_mode) = LOWER(?)'
-            params.append(game_mode)
-            
-        if start_date:
-            query += ' AND DATE(m.game_creation) >= ?'
-            params.append(start_date)
-            
-        if end_date:
-            query += ' AND DATE(m.game_creation) <= ?'
-            params.append(end_date)
-            
-        # Order by game creation date (newest first)
-        query += ' ORDER BY m.game_creation DESC'
-        
-        if limit:
-            query += ' LIMIT ?'
-            params.append(limit)
-            
-        cursor.execute(query, params)
-        match_ids = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        
-        return match_ids
+        def read(conn):
+            cursor = conn.cursor()
+
+            # Build the query with optional filters, tracked players are matched by puuid
+            puuids = self._resolve_player_puuids(cursor, normalize_key(riot_id_game_name))
+            if puuids:
+                player_filter = f"p.puuid IN ({', '.join('?' * len(puuids))})"
+                params = list(puuids)
+            else:
+                player_filter = "p.riot_id_game_name_norm = ?"
+                params = [normalize_key(riot_id_game_name)]
+            query = f'''
+                SELECT DISTINCT p.match_id
+                FROM participants p
+                JOIN matches m ON p.match_id = m.match_id
+                WHERE {player_filter}
+            '''
+
+            if game_mode:
+                query += ' AND m.game_mode_norm = ?'
+                params.append(normalize_key(game_mode))
+
+            if start_date:
+                query += ' AND DATE(m.game_creation) >= ?'
+                params.append(start_date)
+
+            if end_date:
+                query += ' AND DATE(m.game_creation) <= ?'
+                params.append(end_date)
+
+            # Order by game creation date (newest first)
+            query += ' ORDER BY m.game_creation DESC'
+
+            if limit:
+                query += ' LIMIT ?'
+                params.append(limit)
+
+            cursor.execute(query, params)
+            match_ids = [row[0] for row in cursor.fetchall()]
+
+            return match_ids
+
+        return await self.readers.run(read)
 
     async def get_match_count(self) -> int:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM matches')
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM matches')
+            count = cursor.fetchone()[0]
+            return count
+
+        return await self.readers.run(read)
 
     async def get_users(self, guild_id = None, active = False) -> List[User]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        if guild_id:
-            cursor.execute('SELECT id, username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active, last_game_played FROM users WHERE guild_id = ?', (guild_id,))
-        elif active:
-            cursor.execute('SELECT id, username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active, last_game_played FROM users WHERE active = ?', (active,))
-        else:
-            cursor.execute('SELECT id, username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active, last_game_played FROM users')
-        results = cursor.fetchall()
-        conn.close()
-        
-        return [User(
-            id=row[0],
-            username=row[1],
-            puuid=row[2],
-            riot_id_game_name=row[3],
-            riot_id_tagline=row[4],
-            guild_id=row[5],
-            active=bool(row[6]),
-            last_game_played=row[7]
-        ) for row in results]
+        def read(conn):
+            cursor = conn.cursor()
+            if guild_id:
+                cursor.execute('SELECT id, username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active, last_game_played FROM users WHERE guild_id = ?', (guild_id,))
+            elif active:
+                cursor.execute('SELECT id, username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active, last_game_played FROM users WHERE active = ?', (active,))
+            else:
+                cursor.execute('SELECT id, username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active, last_game_played FROM users')
+            results = cursor.fetchall()
+
+            return [User(
+                id=row[0],
+                username=row[1],
+                puuid=row[2],
+                riot_id_game_name=row[3],
+                riot_id_tagline=row[4],
+                guild_id=row[5],
+                active=bool(row[6]),
+                last_game_played=row[7]
+            ) for row in results]
+
+        return await self.readers.run(read)
+
+    async def load_champion_index(self) -> int:
+        """Rebuild the champion index from the champions table, returns the number of champions."""
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, name, image_full FROM champions')
+            return [
+                ChampionRef(id=row[0], key=row[2].replace('.png', ''), name=row[1], image=row[2])
+                for row in cursor.fetchall() if row[2]
+            ]
+
+        try:
+            self.champions.load(await self.readers.run(read))
+        except Exception as e:
+            print(f"❌ Error loading champion index: {e}")
+        return len(self.champions)
 
     async def get_champion(self, id) -> Optional[str]:
-        #get version with riotapioperations
-        versions = await self.bot.get_cog("RiotAPIOperations").get_versions()
+        """Data Dragon key of a champion id, e.g. 62 -> "MonkeyKing"."""
+        champion = self.champions.get(id)
+        if champion:
+            return champion.key
+        # Not in the champions table yet (new champion, update not applied), ask Data Dragon once
+        riot_ops = self.bot.get_cog("RiotAPIOperations")
+        versions = await riot_ops.get_versions()
         url = f"https://ddragon.leagueoflegends.com/cdn/{versions[0]}/data/en_US/champion.json"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                data = await response.json()
-                for champ_name, champ_data in data['data'].items():
-                    if int(champ_data['key']) == id:
-                        return champ_data['id']
+        async with riot_ops.get_session().get(url) as response:
+            data = await response.json()
+            for champ_name, champ_data in data['data'].items():
+                if int(champ_data['key']) == int(id):
+                    self.champions.add(ChampionRef(
+                        id=int(champ_data['key']),
+                        key=champ_data['id'],
+                        name=champ_data['name'],
+                        image=champ_data['image']['full']
+                    ))
+                    return champ_data['id']
         return None
 
-    async def insert_match(self, match_data):
+    @staticmethod
+    def _build_payload_row(match_data) -> tuple:
+        """Compress a raw match payload into a match_payloads row (see ARCHIVE_PAYLOAD_SQL)."""
+        payload = zlib.compress(json.dumps(match_data, separators=(",", ":")).encode("utf-8"), PAYLOAD_COMPRESSION_LEVEL)
+        return (match_data['metadata']['matchId'], payload)
+
+    @staticmethod
+    def _decode_match_payload(compression: str, payload: bytes) -> dict:
+        if compression != "zlib":
+            raise ValueError(f"Unsupported payload compression: {compression}")
+        return json.loads(zlib.decompress(payload))
+
+    async def get_match_payload(self, match_id: str) -> Optional[dict]:
+        """Get the archived raw match-v5 payload for a match, None if it was never archived."""
+        await self.ensure_schema()
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute("SELECT compression, payload FROM match_payloads WHERE match_id = ?", (match_id,))
+            row = cursor.fetchone()
+            return self._decode_match_payload(*row) if row else None
+
+        return await self.readers.run(read)
+
+    @staticmethod
+    def _challenge_column(key: str) -> str:
+        """Map a ChallengesDto key to its column, e.g. damagePerMinute -> damage_per_minute."""
+        if key in CHALLENGE_COLUMN_OVERRIDES:
+            return CHALLENGE_COLUMN_OVERRIDES[key]
+        name = re.sub(r'(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])|(?<=[A-Za-z])(?=[0-9])', '_', key)
+        return re.sub(r'_+', '_', name).lower()
+
+    def _build_match_rows(self, match_data) -> dict:
+        """Turn a match payload into the rows for matches and each of its child tables.
+
+        No database access, so a malformed payload fails here before anything is written.
+        """
         match_id = match_data['metadata']['matchId']
         info = match_data['info']
         metadata = match_data['metadata']
-        
-        print(f"🔄 Processing match: {match_id}")
-        print(f"📊 Match has {len(info.get('participants', []))} participants")
-        
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            cursor = conn.cursor()
-            
-            # Enable WAL mode for better concurrency
-            cursor.execute("PRAGMA journal_mode=WAL")
-            cursor.execute("PRAGMA synchronous=NORMAL")
-            cursor.execute("PRAGMA temp_store=MEMORY")
-            cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB
-            
-            cursor.execute('''
-            INSERT OR REPLACE INTO matches (
-                match_id, game_duration, game_version, game_mode, game_type, 
-                game_creation, game_end, data_version, end_of_game_result,
-                game_id, game_name, game_start_timestamp, game_end_timestamp,
-                map_id, platform_id, queue_id, tournament_code
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+        rows = {
+            "match_id": match_id,
+            "matches": [],
+            "teams": [],
+            "bans": [],
+            "objectives": [],
+            "participants": [],
+            "challenges": [],  # (participant_id, {column: value})
+            "perks": [],  # (participant_id, (defense, flex, offense), styles)
+        }
+
+        rows["matches"].append((
+            match_id,
+            info.get('gameDuration', 0),
+            info.get('gameVersion', ''),
+            info.get('gameMode', ''),
+            info.get('gameType', ''),
+            datetime.fromtimestamp(info.get('gameCreation', 0)/1000) if info.get('gameCreation') else None,
+            datetime.fromtimestamp(info.get('gameEndTimestamp', 0)/1000) if info.get('gameEndTimestamp') else None,
+            metadata.get('dataVersion', ''),
+            info.get('endOfGameResult', ''),
+            info.get('gameId', 0),
+            info.get('gameName', ''),
+            info.get('gameStartTimestamp', 0),
+            info.get('gameEndTimestamp', 0),
+            info.get('mapId', 0),
+            info.get('platformId', ''),
+            info.get('queueId', 0),
+            info.get('tournamentCode', ''),
+            normalize_key(info.get('gameMode', ''))
+        ))
+
+        for team in info.get('teams', []):
+            rows["teams"].append((match_id, team.get('teamId', 0), team.get('win', False)))
+            for ban in team.get('bans', []):
+                rows["bans"].append((match_id, team.get('teamId', 0), ban.get('championId', 0), ban.get('pickTurn', 0)))
+            for obj_type, obj_data in team.get('objectives', {}).items():
+                if isinstance(obj_data, dict):
+                    rows["objectives"].append((match_id, team.get('teamId', 0), obj_type,
+                                               obj_data.get('first', False), obj_data.get('kills', 0)))
+
+        for participant in info.get('participants', []):
+            # Helper function to safely get values with defaults
+            def get_safe(key, default=0):
+                return participant.get(key, default)
+
+            # Helper function to safely get nested challenge values
+            def get_challenge(key, default=0):
+                return participant.get('challenges', {}).get(key, default)
+
+            # Helper function to get missions data
+            def get_mission(key, default=0):
+                return participant.get('missions', {}).get(key, default)
+
+            rows["participants"].append((
                 match_id,
-                info.get('gameDuration', 0),
-                info.get('gameVersion', ''),
-                info.get('gameMode', ''),
-                info.get('gameType', ''),
-                datetime.fromtimestamp(info.get('gameCreation', 0)/1000) if info.get('gameCreation') else None,
-                datetime.fromtimestamp(info.get('gameEndTimestamp', 0)/1000) if info.get('gameEndTimestamp') else None,
-                metadata.get('dataVersion', ''),
-                info.get('endOfGameResult', ''),
-                info.get('gameId', 0),
-                info.get('gameName', ''),
-                info.get('gameStartTimestamp', 0),
-                info.get('gameEndTimestamp', 0),
-                info.get('mapId', 0),
-                info.get('platformId', ''),
-                info.get('queueId', 0),
-                info.get('tournamentCode', '')
+                get_safe('puuid'),
+                get_safe('summonerName'),
+                get_safe('championName'),
+                get_safe('championId'),
+                get_safe('teamId'),
+                get_safe('teamPosition'),
+                get_safe('individualPosition'),
+                get_safe('lane'),
+                get_safe('role'),
+                get_safe('win'),
+                get_safe('kills'),
+                get_safe('deaths'),
+                get_safe('assists'),
+                get_challenge('kda') or (get_safe('kills') + get_safe('assists')) / max(get_safe('deaths'), 1),
+                get_challenge('killParticipation'),
+                get_safe('champLevel'),
+                get_safe('visionScore'),
+                get_safe('totalDamageDealt'),
+                get_safe('totalDamageDealtToChampions'),
+                get_safe('physicalDamageDealtToChampions'),
+                get_safe('magicDamageDealtToChampions'),
+                get_safe('trueDamageDealtToChampions'),
+                get_safe('totalDamageTaken'),
+                get_safe('goldEarned'),
+                get_safe('goldSpent'),
+                get_safe('totalMinionsKilled'),
+                get_safe('visionWardsBoughtInGame'),
+                get_safe('sightWardsBoughtInGame'),
+                get_safe('wardsPlaced'),
+                get_safe('wardsKilled'),
+                get_safe('champExperience'),
+                get_safe('timePlayed'),
+                get_safe('totalTimeSpentDead'),
+                get_safe('item0'),
+                get_safe('item1'),
+                get_safe('item2'),
+                get_safe('item3'),
+                get_safe('item4'),
+                get_safe('item5'),
+                get_safe('item6'),
+                get_safe('bountyLevel'),
+                get_safe('killingSprees'),
+                get_safe('largestKillingSpree'),
+                get_safe('largestMultiKill'),
+                get_safe('longestTimeSpentLiving'),
+                get_safe('doubleKills'),
+                get_safe('tripleKills'),
+                get_safe('quadraKills'),
+                get_safe('pentaKills'),
+                get_safe('unrealKills'),
+                get_safe('damageDealtToBuildings'),
+                get_safe('damageDealtToObjectives'),
+                get_safe('damageDealtToTurrets'),
+                get_safe('damageSelfMitigated'),
+                get_safe('largestCriticalStrike'),
+                get_safe('inhibitorKills'),
+                get_safe('inhibitorTakedowns'),
+                get_safe('inhibitorsLost'),
+                get_safe('nexusKills'),
+                get_safe('nexusLost'),
+                get_safe('nexusTakedowns'),
+                get_safe('turretKills'),
+                get_safe('turretTakedowns'),
+                get_safe('turretsLost'),
+                get_safe('championTransform'),
+                get_safe('consumablesPurchased'),
+                get_safe('itemsPurchased'),
+                get_safe('neutralMinionsKilled'),
+                get_safe('totalAllyJungleMinionsKilled'),
+                get_safe('totalEnemyJungleMinionsKilled'),
+                get_safe('totalTimeCCDealt'),
+                get_safe('totalUnitsHealed'),
+                get_safe('firstBloodAssist'),
+                get_safe('firstBloodKill'),
+                get_safe('firstTowerAssist'),
+                get_safe('firstTowerKill'),
+                get_safe('gameEndedInSurrender'),
+                get_safe('gameEndedInEarlySurrender'),
+                get_safe('teamEarlySurrendered'),
+                get_safe('spell1Casts'),
+                get_safe('spell2Casts'),
+                get_safe('spell3Casts'),
+                get_safe('spell4Casts'),
+                get_safe('summoner1Casts'),
+                get_safe('summoner2Casts'),
+                get_safe('summoner1Id'),
+                get_safe('summoner2Id'),
+                get_safe('totalHeal'),
+                get_safe('totalHealsOnTeammates'),
+                get_safe('totalDamageShieldedOnTeammates'),
+                get_safe('allInPings'),
+                get_safe('assistMePings'),
+                get_safe('basicPings'),
+                get_safe('commandPings'),
+                get_safe('dangerPings'),
+                get_safe('enemyMissingPings'),
+                get_safe('enemyVisionPings'),
+                get_safe('getBackPings'),
+                get_safe('holdPings'),
+                get_safe('needVisionPings'),
+                get_safe('onMyWayPings'),
+                get_safe('pushPings'),
+                get_safe('retreatPings'),
+                get_safe('visionClearedPings'),
+                get_safe('summonerLevel'),
+                get_safe('riotIdGameName'),
+                get_safe('riotIdTagline'),
+                get_safe('profileIcon'),
+                # New fields
+                get_safe('baronKills'),
+                get_safe('dragonKills'),
+                get_safe('eligibleForProgression'),
+                get_safe('magicDamageDealt'),
+                get_safe('magicDamageTaken'),
+                get_safe('physicalDamageDealt'),
+                get_safe('physicalDamageTaken'),
+                get_safe('trueDamageDealt'),
+                get_safe('trueDamageTaken'),
+                get_safe('objectivesStolen'),
+                get_safe('objectivesStolenAssists'),
+                get_safe('participantId'),
+                get_safe('placement'),
+                get_safe('playerAugment1'),
+                get_safe('playerAugment2'),
+                get_safe('playerAugment3'),
+                get_safe('playerAugment4'),
+                get_safe('playerSubteamId'),
+                get_safe('subteamPlacement'),
+                get_safe('summonerId'),
+                get_safe('timeCCingOthers'),
+                get_safe('detectorWardsPlaced'),
+                get_safe('sightWardsBoughtInGame'),
+                get_safe('visionWardsBoughtInGame'),
+                # Mission scores
+                get_mission('playerScore0'),
+                get_mission('playerScore1'),
+                get_mission('playerScore2'),
+                get_mission('playerScore3'),
+                get_mission('playerScore4'),
+                get_mission('playerScore5'),
+                get_mission('playerScore6'),
+                get_mission('playerScore7'),
+                get_mission('playerScore8'),
+                get_mission('playerScore9'),
+                get_mission('playerScore10'),
+                get_mission('playerScore11'),
+                # Normalized lookup columns
+                normalize_key(get_safe('riotIdGameName')),
+                normalize_key(get_safe('championName'))
             ))
 
-            # Insert team data
-            for team in info.get('teams', []):
-                cursor.execute('''
-                INSERT OR REPLACE INTO teams (match_id, team_id, win) 
-                VALUES (?, ?, ?)
-                ''', (match_id, team.get('teamId', 0), team.get('win', False)))
-                
-                # Insert bans for this team
-                for ban in team.get('bans', []):
-                    cursor.execute('''
-                    INSERT OR REPLACE INTO bans (match_id, team_id, champion_id, pick_turn)
-                    VALUES (?, ?, ?, ?)
-                    ''', (match_id, team.get('teamId', 0), ban.get('championId', 0), ban.get('pickTurn', 0)))
-                
-                # Insert objectives for this team
-                objectives = team.get('objectives', {})
-                for obj_type, obj_data in objectives.items():
-                    if isinstance(obj_data, dict):
-                        cursor.execute('''
-                        INSERT OR REPLACE INTO objectives (match_id, team_id, objective_type, first, kills)
-                        VALUES (?, ?, ?, ?, ?)
-                        ''', (match_id, team.get('teamId', 0), obj_type, 
-                              obj_data.get('first', False), obj_data.get('kills', 0)))
-
-            # Insert participant data with all new fields
-            for participant in info.get('participants', []):
-                # Helper function to safely get values with defaults
-                def get_safe(key, default=0):
-                    return participant.get(key, default)
-                
-                # Helper function to safely get nested challenge values
-                def get_challenge(key, default=0):
-                    return participant.get('challenges', {}).get(key, default)
-                
-                # Helper function to get missions data
-                def get_mission(key, default=0):
-                    return participant.get('missions', {}).get(key, default)
+            challenges = {}
+            for key, value in (participant.get('challenges') or {}).items():
+                if isinstance(value, list):
+                    value = ",".join(str(v) for v in value)  # legendaryItemUsed
+                elif isinstance(value, dict):
+                    continue
+                challenges[self._challenge_column(key)] = value
+            if challenges:
+                rows["challenges"].append((get_safe('participantId'), challenges))
 
-                cursor.execute('''
-                INSERT OR REPLACE INTO participants (
-                    match_id, puuid, summoner_name, champion_name, champion_id,
-                    team_id, team_position, individual_position, lane, role,
-                    wins, kills, deaths, assists, kda, kill_participation,
-                    champion_level, vision_score, total_damage_dealt,
-                    total_damage_to_champions, physical_damage_to_champions,
-                    magic_damage_to_champions, true_damage_to_champions,
-                    total_damage_taken, gold_earned, gold_spent,
-                    total_minions_killed, vision_wards_bought,
-                    sight_wards_bought, wards_placed, wards_killed,
-                    champion_experience, time_played, total_time_spent_dead,
-                    item0, item1, item2, item3, item4, item5, item6,
-                    bounty_level, killing_sprees, largest_killing_spree,
-                    largest_multi_kill, longest_time_spent_living, double_kills,
-                    triple_kills, quadra_kills, penta_kills, unreal_kills,
-                    damage_dealt_to_buildings, damage_dealt_to_objectives,
-                    damage_dealt_to_turrets, damage_self_mitigated,
-                    largest_critical_strike, inhibitor_kills, inhibitor_takedowns,
-                    inhibitors_lost, nexus_kills, nexus_lost, nexus_takedowns,
-                    turret_kills, turret_takedowns, turrets_lost, champion_transform,
-                    consumables_purchased, items_purchased, neutral_minions_killed,
-                    total_ally_jungle_minions_killed, total_enemy_jungle_minions_killed,
-                    total_time_cc_dealt, total_units_healed, first_blood_assist,
-                    first_blood_kill, first_tower_assist, first_tower_kill,
-                    game_ended_in_surrender, game_ended_in_early_surrender,
-                    team_early_surrendered, spell1_casts, spell2_casts, spell3_casts,
-                    spell4_casts, summoner1_casts, summoner2_casts, summoner1_id,
-                    summoner2_id, total_heal, total_heals_on_teammates,
-                    total_damage_shielded_on_teammates, all_in_pings, assist_me_pings,
-                    basic_pings, command_pings, danger_pings, enemy_missing_pings,
-                    enemy_vision_pings, get_back_pings, hold_pings, need_vision_pings,
-                    on_my_way_pings, push_pings, retreat_pings, vision_cleared_pings,
-                    summoner_level, riot_id_game_name, riot_id_tagline, profile_icon,
-                    baron_kills, dragon_kills, eligible_for_progression,
-                    magic_damage_dealt, magic_damage_taken, physical_damage_dealt,
-                    physical_damage_taken, true_damage_dealt, true_damage_taken,
-                    objectives_stolen, objectives_stolen_assists, participant_id,
-                    placement, player_augment1, player_augment2, player_augment3,
-                    player_augment4, player_subteam_id, subteam_placement,
-                    summoner_id, time_ccing_others, detector_wards_placed,
-                    sight_wards_bought_in_game, vision_wards_bought_in_game,
-                    player_score0, player_score1, player_score2, player_score3,
-                    player_score4, player_score5, player_score6, player_score7,
-                    player_score8, player_score9, player_score10, player_score11
-                ) VALUES (
-                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?
-                )
-                ''', (
-                    match_id,
-                    get_safe('puuid'),
-                    get_safe('summonerName'),
-                    get_safe('championName'),
-                    get_safe('championId'),
-                    get_safe('teamId'),
-                    get_safe('teamPosition'),
-                    get_safe('individualPosition'),
-                    get_safe('lane'),
-                    get_safe('role'),
-                    get_safe('win'),
-                    get_safe('kills'),
-                    get_safe('deaths'),
-                    get_safe('assists'),
-                    get_challenge('kda') or (get_safe('kills') + get_safe('assists')) / max(get_safe('deaths'), 1),
-                    get_challenge('killParticipation'),
-                    get_safe('champLevel'),
-                    get_safe('visionScore'),
-                    get_safe('totalDamageDealt'),
-                    get_safe('totalDamageDealtToChampions'),
-                    get_safe('physicalDamageDealtToChampions'),
-                    get_safe('magicDamageDealtToChampions'),
-                    get_safe('trueDamageDealtToChampions'),
-                    get_safe('totalDamageTaken'),
-                    get_safe('goldEarned'),
-                    get_safe('goldSpent'),
-                    get_safe('totalMinionsKilled'),
-                    get_safe('visionWardsBoughtInGame'),
-                    get_safe('sightWardsBoughtInGame'),
-                    get_safe('wardsPlaced'),
-                    get_safe('wardsKilled'),
-                    get_safe('champExperience'),
-                    get_safe('timePlayed'),
-                    get_safe('totalTimeSpentDead'),
-                    get_safe('item0'),
-                    get_safe('item1'),
-                    get_safe('item2'),
-                    get_safe('item3'),
-                    get_safe('item4'),
-                    get_safe('item5'),
-                    get_safe('item6'),
-                    get_safe('bountyLevel'),
-                    get_safe('killingSprees'),
-                    get_safe('largestKillingSpree'),
-                    get_safe('largestMultiKill'),
-                    get_safe('longestTimeSpentLiving'),
-                    get_safe('doubleKills'),
-                    get_safe('tripleKills'),
-                    get_safe('quadraKills'),
-                    get_safe('pentaKills'),
-                    get_safe('unrealKills'),
-                    get_safe('damageDealtToBuildings'),
-                    get_safe('damageDealtToObjectives'),
-                    get_safe('damageDealtToTurrets'),
-                    get_safe('damageSelfMitigated'),
-                    get_safe('largestCriticalStrike'),
-                    get_safe('inhibitorKills'),
-                    get_safe('inhibitorTakedowns'),
-                    get_safe('inhibitorsLost'),
-                    get_safe('nexusKills'),
-                    get_safe('nexusLost'),
-                    get_safe('nexusTakedowns'),
-                    get_safe('turretKills'),
-                    get_safe('turretTakedowns'),
-                    get_safe('turretsLost'),
-                    get_safe('championTransform'),
-                    get_safe('consumablesPurchased'),
-                    get_safe('itemsPurchased'),
-                    get_safe('neutralMinionsKilled'),
-                    get_safe('totalAllyJungleMinionsKilled'),
-                    get_safe('totalEnemyJungleMinionsKilled'),
-                    get_safe('totalTimeCCDealt'),
-                    get_safe('totalUnitsHealed'),
-                    get_safe('firstBloodAssist'),
-                    get_safe('firstBloodKill'),
-                    get_safe('firstTowerAssist'),
-                    get_safe('firstTowerKill'),
-                    get_safe('gameEndedInSurrender'),
-                    get_safe('gameEndedInEarlySurrender'),
-                    get_safe('teamEarlySurrendered'),
-                    get_safe('spell1Casts'),
-                    get_safe('spell2Casts'),
-                    get_safe('spell3Casts'),
-                    get_safe('spell4Casts'),
-                    get_safe('summoner1Casts'),
-                    get_safe('summoner2Casts'),
-                    get_safe('summoner1Id'),
-                    get_safe('summoner2Id'),
-                    get_safe('totalHeal'),
-                    get_safe('totalHealsOnTeammates'),
-                    get_safe('totalDamageShieldedOnTeammates'),
-                    get_safe('allInPings'),
-                    get_safe('assistMePings'),
-                    get_safe('basicPings'),
-                    get_safe('commandPings'),
-                    get_safe('dangerPings'),
-                    get_safe('enemyMissingPings'),
-                    get_safe('enemyVisionPings'),
-                    get_safe('getBackPings'),
-                    get_safe('holdPings'),
-                    get_safe('needVisionPings'),
-                    get_safe('onMyWayPings'),
-                    get_safe('pushPings'),
-                    get_safe('retreatPings'),
-                    get_safe('visionClearedPings'),
-                    get_safe('summonerLevel'),
-                    get_safe('riotIdGameName'),
-                    get_safe('riotIdTagline'),
-                    get_safe('profileIcon'),
-                    # New fields
-                    get_safe('baronKills'),
-                    get_safe('dragonKills'),
-                    get_safe('eligibleForProgression'),
-                    get_safe('magicDamageDealt'),
-                    get_safe('magicDamageTaken'),
-                    get_safe('physicalDamageDealt'),
-                    get_safe('physicalDamageTaken'),
-                    get_safe('trueDamageDealt'),
-                    get_safe('trueDamageTaken'),
-                    get_safe('objectivesStolen'),
-                    get_safe('objectivesStolenAssists'),
+            perks = participant.get('perks') or {}
+            if perks:
+                stat_perks = perks.get('statPerks', {})
+                rows["perks"].append((
                     get_safe('participantId'),
-                    get_safe('placement'),
-                    get_safe('playerAugment1'),
-                    get_safe('playerAugment2'),
-                    get_safe('playerAugment3'),
-                    get_safe('playerAugment4'),
-                    get_safe('playerSubteamId'),
-                    get_safe('subteamPlacement'),
-                    get_safe('summonerId'),
-                    get_safe('timeCCingOthers'),
-                    get_safe('detectorWardsPlaced'),
-                    get_safe('sightWardsBoughtInGame'),
-                    get_safe('visionWardsBoughtInGame'),
-                    # Mission scores
-                    get_mission('playerScore0'),
-                    get_mission('playerScore1'),
-                    get_mission('playerScore2'),
-                    get_mission('playerScore3'),
-                    get_mission('playerScore4'),
-                    get_mission('playerScore5'),
-                    get_mission('playerScore6'),
-                    get_mission('playerScore7'),
-                    get_mission('playerScore8'),
-                    get_mission('playerScore9'),
-                    get_mission('playerScore10'),
-                    get_mission('playerScore11')
+                    (stat_perks.get('defense', 0), stat_perks.get('flex', 0), stat_perks.get('offense', 0)),
+                    perks.get('styles', [])
                 ))
-                
-                # Insert challenges data if available (simplified for now)
-                challenges = participant.get('challenges', {})
-                if challenges:
-                    print(f"📈 Found {len(challenges)} challenges for participant {get_safe('participantId')}")
-                
-                # Insert perks data if available (simplified for now)  
-                perks = participant.get('perks', {})
-                if perks:
-                    print(f"🔮 Found perks data for participant {get_safe('participantId')}")
-
-            conn.commit()
-            print(f"✅ Successfully inserted match: {match_id}")
-            
-        except sqlite3.OperationalError as e:
-            print(f"❌ Database operational error for match {match_id}: {e}")
-            if conn:
-                conn.rollback()
-            raise e
+
+        return rows
+
+    def _write_match_batch(self, cursor, batch: List[dict]):
+        """Write built match rows for several matches with one executemany per table.
+
+        Runs inside the caller's transaction. Child rows without a natural key are
+        cleared first so writing a match twice doesn't duplicate them.
+        """
+        match_ids = [(rows["match_id"],) for rows in batch]
+
+        # Matches stored before get their player aggregates recomputed instead of added twice
+        cursor.execute(f"SELECT match_id FROM matches WHERE match_id IN ({', '.join('?' * len(match_ids))})", [m[0] for m in match_ids])
+        rewritten = {row[0] for row in cursor.fetchall()}
+        rewritten_where = f"p.match_id IN ({', '.join('?' * len(rewritten))})"
+        stale_keys = set()
+        if rewritten:
+            cursor.execute(PLAYER_AGG_KEYS_SQL.format(where=rewritten_where), list(rewritten))
+            stale_keys.update(cursor.fetchall())
+
+        cursor.executemany("DELETE FROM perk_selections WHERE perk_style_id IN (SELECT ps.id FROM perk_styles ps JOIN perks p ON p.id = ps.perk_id WHERE p.match_id = ?)", match_ids)
+        cursor.executemany("DELETE FROM perk_styles WHERE perk_id IN (SELECT id FROM perks WHERE match_id = ?)", match_ids)
+        for table in ("perks", "challenges", "bans", "objectives"):
+            cursor.executemany(f"DELETE FROM {table} WHERE match_id = ?", match_ids)
+
+        cursor.executemany('''
+        INSERT OR REPLACE INTO matches (
+            match_id, game_duration, game_version, game_mode, game_type, 
+            game_creation, game_end, data_version, end_of_game_result,
+            game_id, game_name, game_start_timestamp, game_end_timestamp,
+            map_id, platform_id, queue_id, tournament_code, game_mode_norm
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [row for rows in batch for row in rows["matches"]])
+        cursor.executemany('''
+        INSERT OR REPLACE INTO teams (match_id, team_id, win) 
+        VALUES (?, ?, ?)
+        ''', [row for rows in batch for row in rows["teams"]])
+        cursor.executemany('''
+        INSERT INTO bans (match_id, team_id, champion_id, pick_turn)
+        VALUES (?, ?, ?, ?)
+        ''', [row for rows in batch for row in rows["bans"]])
+        cursor.executemany('''
+        INSERT INTO objectives (match_id, team_id, objective_type, first, kills)
+        VALUES (?, ?, ?, ?, ?)
+        ''', [row for rows in batch for row in rows["objectives"]])
+        cursor.executemany('''
+            INSERT OR REPLACE INTO participants (
+                match_id, puuid, summoner_name, champion_name, champion_id,
+                team_id, team_position, individual_position, lane, role,
+                wins, kills, deaths, assists, kda, kill_participation,
+                champion_level, vision_score, total_damage_dealt,
+                total_damage_to_champions, physical_damage_to_champions,
+                magic_damage_to_champions, true_damage_to_champions,
+                total_damage_taken, gold_earned, gold_spent,
+                total_minions_killed, vision_wards_bought,
+                sight_wards_bought, wards_placed, wards_killed,
+                champion_experience, time_played, total_time_spent_dead,
+                item0, item1, item2, item3, item4, item5, item6,
+                bounty_level, killing_sprees, largest_killing_spree,
+                largest_multi_kill, longest_time_spent_living, double_kills,
+                triple_kills, quadra_kills, penta_kills, unreal_kills,
+                damage_dealt_to_buildings, damage_dealt_to_objectives,
+                damage_dealt_to_turrets, damage_self_mitigated,
+                largest_critical_strike, inhibitor_kills, inhibitor_takedowns,
+                inhibitors_lost, nexus_kills, nexus_lost, nexus_takedowns,
+                turret_kills, turret_takedowns, turrets_lost, champion_transform,
+                consumables_purchased, items_purchased, neutral_minions_killed,
+                total_ally_jungle_minions_killed, total_enemy_jungle_minions_killed,
+                total_time_cc_dealt, total_units_healed, first_blood_assist,
+                first_blood_kill, first_tower_assist, first_tower_kill,
+                game_ended_in_surrender, game_ended_in_early_surrender,
+                team_early_surrendered, spell1_casts, spell2_casts, spell3_casts,
+                spell4_casts, summoner1_casts, summoner2_casts, summoner1_id,
+                summoner2_id, total_heal, total_heals_on_teammates,
+                total_damage_shielded_on_teammates, all_in_pings, assist_me_pings,
+                basic_pings, command_pings, danger_pings, enemy_missing_pings,
+                enemy_vision_pings, get_back_pings, hold_pings, need_vision_pings,
+                on_my_way_pings, push_pings, retreat_pings, vision_cleared_pings,
+                summoner_level, riot_id_game_name, riot_id_tagline, profile_icon,
+                baron_kills, dragon_kills, eligible_for_progression,
+                magic_damage_dealt, magic_damage_taken, physical_damage_dealt,
+                physical_damage_taken, true_damage_dealt, true_damage_taken,
+                objectives_stolen, objectives_stolen_assists, participant_id,
+                placement, player_augment1, player_augment2, player_augment3,
+                player_augment4, player_subteam_id, subteam_placement,
+                summoner_id, time_ccing_others, detector_wards_placed,
+                sight_wards_bought_in_game, vision_wards_bought_in_game,
+                player_score0, player_score1, player_score2, player_score3,
+                player_score4, player_score5, player_score6, player_score7,
+                player_score8, player_score9, player_score10, player_score11,
+                riot_id_game_name_norm, champion_name_norm
+            ) VALUES (
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?
+            )
+            ''', [row for rows in batch for row in rows["participants"]])
+
+        # Challenges: keep the keys that have a column, one executemany per column set
+        if self.challenge_columns is None:
+            cursor.execute("PRAGMA table_info(challenges)")
+            self.challenge_columns = {row[1] for row in cursor.fetchall()} - {"id", "match_id", "participant_id"}
+        challenge_groups = {}
+        for rows in batch:
+            for participant_id, challenges in rows["challenges"]:
+                columns = tuple(column for column in challenges if column in self.challenge_columns)
+                challenge_groups.setdefault(columns, []).append(
+                    (rows["match_id"], participant_id) + tuple(challenges[column] for column in columns)
+                )
+        for columns, values in challenge_groups.items():
+            all_columns = ("match_id", "participant_id") + columns
+            cursor.executemany(
+                f"INSERT INTO challenges ({', '.join(all_columns)}) VALUES ({', '.join('?' * len(all_columns))})",
+                values
+            )
+
+        # Perks: ids are assigned here so styles and selections can reference them in bulk
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM perks")
+        next_perk_id = cursor.fetchone()[0] + 1
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM perk_styles")
+        next_style_id = cursor.fetchone()[0] + 1
+        perk_rows, style_rows, selection_rows = [], [], []
+        for rows in batch:
+            for participant_id, stat_perks, styles in rows["perks"]:
+                perk_rows.append((next_perk_id, rows["match_id"], participant_id) + stat_perks)
+                for style in styles:
+                    style_rows.append((next_style_id, next_perk_id, style.get('description', ''), style.get('style', 0)))
+                    for selection in style.get('selections', []):
+                        selection_rows.append((next_style_id, selection.get('perk', 0), selection.get('var1', 0),
+                                               selection.get('var2', 0), selection.get('var3', 0)))
+                    next_style_id += 1
+                next_perk_id += 1
+        cursor.executemany('''
+        INSERT INTO perks (id, match_id, participant_id, stat_defense, stat_flex, stat_offense)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', perk_rows)
+        cursor.executemany('''
+        INSERT INTO perk_styles (id, perk_id, description, style)
+        VALUES (?, ?, ?, ?)
+        ''', style_rows)
+        cursor.executemany('''
+        INSERT INTO perk_selections (perk_style_id, perk, var1, var2, var3)
+        VALUES (?, ?, ?, ?, ?)
+        ''', selection_rows)
+
+        # Player aggregates: fold new matches in, recompute the keys of rewritten ones
+        cursor.executemany(
+            PLAYER_AGG_UPSERT_SQL.format(where="p.match_id = ?"),
+            [match_id for match_id in match_ids if match_id[0] not in rewritten]
+        )
+        if rewritten:
+            cursor.execute(PLAYER_AGG_KEYS_SQL.format(where=rewritten_where), list(rewritten))
+            stale_keys.update(cursor.fetchall())
+            self._refresh_player_aggregates(cursor, stale_keys)
+
+    @staticmethod
+    def _refresh_player_aggregates(cursor, keys):
+        """Recompute player_champion_mode_agg rows for the given keys from the raw tables."""
+        keys = list(keys)
+        key_where = " AND ".join(f"{column.strip()} = ?" for column in PLAYER_AGG_KEY.split(","))
+        cursor.executemany(f"DELETE FROM player_champion_mode_agg WHERE {key_where}", keys)
+        cursor.executemany(f'''
+        INSERT INTO player_champion_mode_agg ({", ".join(PLAYER_AGG_COLUMNS)})
+        {PLAYER_AGG_SELECT_SQL.format(where=PLAYER_AGG_KEY_WHERE)}
+        ''', keys)
+
+    async def rebuild_player_aggregates(self) -> int:
+        """
+        Recompute the whole player_champion_mode_agg table from participants and matches.
+
+        Returns:
+            Number of aggregate rows written
+        """
+        await self.ensure_schema()
+
+        def write(cursor):
+            cursor.execute("DELETE FROM player_champion_mode_agg")
+            cursor.execute(REBUILD_PLAYER_AGG_SQL)
+            cursor.execute("SELECT COUNT(*) FROM player_champion_mode_agg")
+            return cursor.fetchone()[0]
+        try:
+            return await self.writer.submit(write)
+        finally:
+            self.cache.clear()
+
+    @staticmethod
+    def _match_cache_tags(batch: List[dict]) -> set:
+        """Cache tags touched by a batch of built match rows."""
+        tags = set()
+        for rows in batch:
+            mode_norm = rows["matches"][0][-1]
+            for participant in rows["participants"]:
+                tags.add(("puuid", participant[1]))
+                tags.add(("name", participant[-2]))
+                tags.add(("champion", participant[-1], mode_norm))
+        return tags
+
+    def _write_matches_with_fallback(self, cursor, batch: List[dict], payloads: Optional[List[tuple]] = None) -> Dict[str, Optional[str]]:
+        """Write a batch in one go, falling back to one savepoint per match if that fails.
+
+        Returns match_id -> None on success or the error message, so one bad payload
+        only fails itself instead of the whole batch.
+        """
+        payloads = payloads or []
+        cursor.execute("SAVEPOINT match_batch")
+        try:
+            if payloads:
+                cursor.executemany(ARCHIVE_PAYLOAD_SQL, payloads)
+            self._write_match_batch(cursor, batch)
+            cursor.execute("RELEASE SAVEPOINT match_batch")
+            return {rows["match_id"]: None for rows in batch}
         except sqlite3.Error as e:
-            print(f"❌ Database error for match {match_id}: {e}")
-            if conn:
-                conn.rollback()
-            raise e
-        except Exception as e:
-            print(f"❌ Unexpected error for match {match_id}: {e}")
-            if conn:
-                conn.rollback()
-            raise e
+            print(f"⚠️ Batch write of {len(batch)} matches failed ({e}), retrying one match at a time")
+            cursor.execute("ROLLBACK TO SAVEPOINT match_batch")
+            cursor.execute("RELEASE SAVEPOINT match_batch")
+
+        payload_by_id = {payload[0]: payload for payload in payloads}
+        results = {}
+        for rows in batch:
+            match_id = rows["match_id"]
+            cursor.execute("SAVEPOINT match_row")
+            try:
+                if match_id in payload_by_id:
+                    cursor.execute(ARCHIVE_PAYLOAD_SQL, payload_by_id[match_id])
+                self._write_match_batch(cursor, [rows])
+                cursor.execute("RELEASE SAVEPOINT match_row")
+                results[match_id] = None
+            except sqlite3.Error as e:
+                print(f"❌ Database error for match {match_id}: {e}")
+                cursor.execute("ROLLBACK TO SAVEPOINT match_row")
+                cursor.execute("RELEASE SAVEPOINT match_row")
+                results[match_id] = str(e)
+        return results
+
+    async def insert_matches(self, matches_data: List[dict]) -> Dict[str, Optional[str]]:
+        """
+        Store several match payloads in one transaction.
+
+        Rows are written with one executemany per table as a single DatabaseWriter job.
+        If the batch fails, each match is retried in its own savepoint so one bad payload
+        doesn't take the rest of the batch down with it.
+
+        Returns:
+            Dict of match_id -> None if stored, or the error message if it failed
+        """
+        results: Dict[str, Optional[str]] = {}
+        batch = []
+        payloads = []
+        for match_data in matches_data:
+            try:
+                batch.append(self._build_match_rows(match_data))
+                payloads.append(self._build_payload_row(match_data))
+            except Exception as e:
+                match_id = match_data.get('metadata', {}).get('matchId', 'unknown') if isinstance(match_data, dict) else 'unknown'
+                print(f"❌ Malformed payload for match {match_id}: {e}")
+                results[match_id] = f"Malformed payload: {e}"
+        if not batch:
+            return results
+
+        await self.ensure_schema()
+
+        print(f"🔄 Processing {len(batch)} matches: {', '.join(rows['match_id'] for rows in batch)}")
+        try:
+            results.update(await self.writer.submit(lambda cursor: self._write_matches_with_fallback(cursor, batch, payloads)))
+        except sqlite3.Error as e:
+            print(f"❌ Database error while storing {len(batch)} matches: {e}")
+            for rows in batch:
+                results[rows["match_id"]] = str(e)
+            return results
         finally:
-            if conn:
-                conn.close()
-                print(f"🔐 Database connection closed for match: {match_id}")
+            self.cache.invalidate(self._match_cache_tags(batch))
 
-    async def insert_user(self, username, puuid, riot_id_game_name, riot_id_tagline, inter, active = "TRUE"):
-        conn = sqlite3.connect(self.db_path)
+        stored = sum(1 for rows in batch if results.get(rows["match_id"]) is None)
+        print(f"✅ Successfully inserted {stored}/{len(batch)} matches")
+        return results
+
+    async def insert_match(self, match_data):
+        """Store a single match payload, raises sqlite3.Error if it couldn't be stored."""
+        match_id = match_data['metadata']['matchId']
+        results = await self.insert_matches([match_data])
+        if results.get(match_id) is not None:
+            raise sqlite3.Error(results[match_id])
+
+    async def reingest_matches(self, match_ids: Optional[List[str]] = None, batch_size: int = 200) -> Tuple[int, int, int]:
+        """
+        Rebuild matches, participants, teams, bans, objectives, challenges and perks from
+        the archived payloads, without any Riot API calls.
+
+        Args:
+            match_ids: Only re-ingest these matches, all archived matches if None
+            batch_size: Matches written per transaction
+
+        Returns:
+            Tuple of (reingested, failed, stored matches without an archived payload)
+        """
+        await self.ensure_schema()
+
+        def read(conn):
+            cursor = conn.cursor()
+            ids = match_ids
+            if ids is None:
+                cursor.execute("SELECT match_id FROM match_payloads ORDER BY match_id")
+                ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT COUNT(*) FROM matches WHERE match_id NOT IN (SELECT match_id FROM match_payloads)")
+            return ids, cursor.fetchone()[0]
+
+        match_ids, missing = await self.readers.run(read)
+
+        reingested = 0
+        failed = 0
+        for start in range(0, len(match_ids), batch_size):
+            # Loading and decompressing happens on the read pool, the writer does the rest
+            built, decode_failures = await self.readers.run(self._load_archived_batch, match_ids[start:start + batch_size])
+            failed += decode_failures
+            if built:
+                try:
+                    results = await self.writer.submit(lambda cursor, built=built: self._write_matches_with_fallback(cursor, built))
+                finally:
+                    self.cache.invalidate(self._match_cache_tags(built))
+                reingested += sum(1 for error in results.values() if error is None)
+                failed += sum(1 for error in results.values() if error is not None)
+            print(f"♻️ Re-ingested {reingested}/{len(match_ids)} matches")
+        return reingested, failed, missing
+
+    def _load_archived_batch(self, conn: sqlite3.Connection, match_ids: List[str]) -> Tuple[List[dict], int]:
+        """Read, decompress and build rows for archived matches. Returns (built rows, failures)."""
         cursor = conn.cursor()
+        placeholders = ",".join("?" * len(match_ids))
+        cursor.execute(f"SELECT match_id, compression, payload FROM match_payloads WHERE match_id IN ({placeholders})", match_ids)
+        rows = cursor.fetchall()
+
+        built = []
+        failed = 0
+        for match_id, compression, payload in rows:
+            try:
+                built.append(self._build_match_rows(self._decode_match_payload(compression, payload)))
+            except Exception as e:
+                print(f"❌ Failed to re-ingest match {match_id}: {e}")
+                failed += 1
+        return built, failed
+
+    async def insert_user(self, username, puuid, riot_id_game_name, riot_id_tagline, inter, active = "TRUE"):
         guild_id = inter.guild.id
-        
-        cursor.execute('''
-        INSERT OR REPLACE INTO users (
-            username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active
-        ) VALUES (?, ?, ?, ?, ?, ?)
-        ''', (username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active))
-        
-        conn.commit()
-        conn.close()
+
+        def write(cursor):
+            cursor.execute('''
+            INSERT OR REPLACE INTO users (
+                username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active
+            ) VALUES (?, ?, ?, ?, ?, ?)
+            ''', (username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active))
+
+        await self.writer.submit(write)
+        # A new or replaced user changes which puuids a name resolves to
+        self.cache.clear()
     
     async def insert_champions(self, champions_data: List[dict]) -> int:
         """
@@ -837,11 +2078,8 @@ class DatabaseOperations(commands.Cog):
         Returns:
             Number of champions added/updated
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        champions_added = 0
-
-        try:
+        def write(cursor):
+            champions_added = 0
             for champion in champions_data:
                 cursor.execute('''
                     INSERT OR REPLACE INTO champions (
@@ -887,53 +2125,103 @@ class DatabaseOperations(commands.Cog):
                     champion['stats_attackspeed']
                 ))
                 champions_added += 1
+            return champions_added
 
-            conn.commit()
+        try:
+            champions_added = await self.writer.submit(write)
+            await self.load_champion_index()
             return champions_added
         except Exception as e:
             print(f"Error inserting champions: {e}")
             await self.bot.get_channel(self.bot.botlol_channel_id).send(f"Error inserting champions: {e}")
             return 0
-        finally:
-            conn.close()
 
     async def update_user(self, username, puuid = None, riot_id_game_name = None, riot_id_tagline = None, last_game_played = None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Build update query dynamically based on non-None values
-        update_fields = []
-        params = []
-        if puuid is not None:
-            update_fields.append("puuid = ?")
-            params.append(puuid)
-        if riot_id_game_name is not None:
-            update_fields.append("riot_id_game_name = ?") 
-            params.append(riot_id_game_name)
-        if riot_id_tagline is not None:
-            update_fields.append("riot_id_tagline = ?")
-            params.append(riot_id_tagline)
-        if last_game_played is not None:
-            update_fields.append("last_game_played = ?")
-            params.append(last_game_played)
+        def write(cursor):
+            # Build update query dynamically based on non-None values
+            update_fields = []
+            params = []
+            if puuid is not None:
+                update_fields.append("puuid = ?")
+                params.append(puuid)
+            if riot_id_game_name is not None:
+                update_fields.append("riot_id_game_name = ?") 
+                params.append(riot_id_game_name)
+            if riot_id_tagline is not None:
+                update_fields.append("riot_id_tagline = ?")
+                params.append(riot_id_tagline)
+            if last_game_played is not None:
+                update_fields.append("last_game_played = ?")
+                params.append(last_game_played)
             
-        if update_fields:
-            query = f"UPDATE users SET {', '.join(update_fields)} WHERE username = ?"
-            params.append(username)
-            cursor.execute(query, params)
-            
-        conn.commit()
-        conn.close()
+            if update_fields:
+                query = f"UPDATE users SET {', '.join(update_fields)} WHERE username = ?"
+                params.append(username)
+                cursor.execute(query, params)
+
+        await self.writer.submit(write)
+        if puuid is not None or riot_id_game_name is not None:
+            self.cache.clear()
     
+    async def get_play_time_profiles(self, puuids: List[str], days: int) -> Dict[str, Tuple[List[int], Optional[int]]]:
+        """Per user over the last days: games started in each local hour of the day, and the
+        game_end_timestamp (epoch ms) of their latest match, None if they have none.
+        """
+        await self.ensure_schema()
+        if not puuids:
+            return {}
+
+        def read(conn):
+            cursor = conn.cursor()
+            placeholders = ",".join("?" * len(puuids))
+            since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+            hours = {puuid: [0] * 24 for puuid in puuids}
+            last_game_end = dict.fromkeys(puuids)
+            # game_creation is stored in local time, so the hours line up with datetime.now()
+            cursor.execute(f"""
+                SELECT p.puuid, CAST(strftime('%H', m.game_creation) AS INTEGER) AS hour,
+                       COUNT(*), MAX(m.game_end_timestamp)
+                FROM participants p
+                JOIN matches m ON m.match_id = p.match_id
+                WHERE p.puuid IN ({placeholders}) AND m.game_creation >= ?
+                GROUP BY p.puuid, hour
+            """, (*puuids, since))
+            for puuid, hour, games, game_end in cursor.fetchall():
+                if hour is not None:
+                    hours[puuid][hour] = games
+                if game_end and (last_game_end[puuid] or 0) < game_end:
+                    last_game_end[puuid] = game_end
+            return {puuid: (hours[puuid], last_game_end[puuid]) for puuid in puuids}
+
+        return await self.readers.run(read)
+
+    async def get_most_played_champions(self, limit: int) -> List[str]:
+        """Champion names ordered by games played across every player and mode."""
+        await self.ensure_schema()
+
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT champion_name FROM player_champion_mode_agg
+                WHERE champion_name != ''
+                GROUP BY champion_name
+                ORDER BY SUM(games) DESC
+                LIMIT ?
+            ''', (limit,))
+            return [row[0] for row in cursor.fetchall()]
+
+        return await self.readers.run(read)
+
     async def get_champion_names(self) -> List[str]:
         """Get all champion names from the database."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT image_full FROM champions ORDER BY name')
-        #remove .png from the end of the string
-        names = [row[0].replace('.png', '') for row in cursor.fetchall()]
-        conn.close()
-        return names
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute('SELECT image_full FROM champions ORDER BY name')
+            #remove .png from the end of the string
+            names = [row[0].replace('.png', '') for row in cursor.fetchall()]
+            return names
+
+        return await self.readers.run(read)
         
     async def get_match_info(self, match_id: str) -> tuple:
         """Get basic match information from the database.
@@ -944,16 +2232,17 @@ class DatabaseOperations(commands.Cog):
         Returns:
             Tuple containing (game_mode, game_duration, game_end, game_creation, queue_id)
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT game_mode, game_duration, game_end, game_creation, queue_id
-            FROM matches
-            WHERE match_id = ?
-        ''', (match_id,))
-        match_info = cursor.fetchone()
-        conn.close()
-        return match_info
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT game_mode, game_duration, game_end, game_creation, queue_id
+                FROM matches
+                WHERE match_id = ?
+            ''', (match_id,))
+            match_info = cursor.fetchone()
+            return match_info
+
+        return await self.readers.run(read)
         
     async def get_match_participants(self, match_id: str) -> list:
         """Get all participants data for a specific match.
@@ -964,32 +2253,33 @@ class DatabaseOperations(commands.Cog):
         Returns:
             List of dictionaries containing participant data
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # This makes fetchall() return dictionaries
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT 
-                p.riot_id_game_name, p.champion_name, p.team_id, p.wins,
-                p.kills, p.deaths, p.assists, p.total_damage_to_champions,
-                p.vision_score, p.gold_earned, p.total_minions_killed,
-                p.total_time_spent_dead, p.largest_killing_spree,
-                p.largest_multi_kill, p.penta_kills, p.profile_icon,
-                p.puuid, p.summoner_level, p.kda, p.kill_participation,
-                p.total_damage_dealt, p.damage_self_mitigated,
-                p.total_heal, p.total_heals_on_teammates,
-                p.total_damage_shielded_on_teammates, p.placement,
-                p.item0, p.item1, p.item2, p.item3, p.item4, p.item5, p.item6,
-                p.player_augment1, p.player_augment2, p.player_augment3, p.player_augment4
-            FROM participants p
-            WHERE p.match_id = ?
-            ORDER BY p.team_id, p.total_damage_to_champions DESC
-        ''', (match_id,))
-        participants_data = cursor.fetchall()
-        
-        # Convert sqlite3.Row objects to dictionaries
-        result = [dict(row) for row in participants_data]
-        conn.close()
-        return result
+        def read(conn):
+            conn.row_factory = sqlite3.Row  # This makes fetchall() return dictionaries
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT 
+                    p.riot_id_game_name, p.champion_name, p.team_id, p.wins,
+                    p.kills, p.deaths, p.assists, p.total_damage_to_champions,
+                    p.vision_score, p.gold_earned, p.total_minions_killed,
+                    p.total_time_spent_dead, p.largest_killing_spree,
+                    p.largest_multi_kill, p.penta_kills, p.profile_icon,
+                    p.puuid, p.summoner_level, p.kda, p.kill_participation,
+                    p.total_damage_dealt, p.damage_self_mitigated,
+                    p.total_heal, p.total_heals_on_teammates,
+                    p.total_damage_shielded_on_teammates, p.placement,
+                    p.item0, p.item1, p.item2, p.item3, p.item4, p.item5, p.item6,
+                    p.player_augment1, p.player_augment2, p.player_augment3, p.player_augment4
+                FROM participants p
+                WHERE p.match_id = ?
+                ORDER BY p.team_id, p.total_damage_to_champions DESC
+            ''', (match_id,))
+            participants_data = cursor.fetchall()
+
+            # Convert sqlite3.Row objects to dictionaries
+            result = [dict(row) for row in participants_data]
+            return result
+
+        return await self.readers.run(read)
 
     async def get_champion_global_stats(self, champion_name, gamemode) -> Optional[PlayerStats]:
         """Get global average statistics for a specific champion in a specific gamemode.
@@ -1001,329 +2291,379 @@ class DatabaseOperations(commands.Cog):
         Returns:
             PlayerStats object with average statistics across all players
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        query = '''
-        WITH champion_data AS (
-            SELECT p.*, m.game_duration, m.game_creation
-            FROM participants p
-            JOIN matches m ON p.match_id = m.match_id
-            WHERE LOWER(p.champion_name) = LOWER(?)
-            AND LOWER(m.game_mode) = LOWER(?)
-        )
-        SELECT 
-            champion_name,
-            COUNT(*) as champion_games,
-            ROUND(AVG(CASE WHEN wins = 1 THEN 100.0 ELSE 0 END), 1) as winrate,
-            ROUND(AVG(total_damage_to_champions / (game_duration / 60.0)), 0) as avg_damage_per_minute,
-            ROUND(AVG(CASE 
-                WHEN deaths = 0 THEN kills + assists 
-                ELSE CAST((kills + assists) AS FLOAT) / deaths 
-            END), 2) as average_kda,
-            ROUND(AVG(CAST(kills AS FLOAT)), 1) as avg_kills,
-            ROUND(AVG(CAST(deaths AS FLOAT)), 1) as avg_deaths,
-            ROUND(AVG(CAST(assists AS FLOAT)), 1) as avg_assists,
-            SUM(triple_kills) as total_triples,
-            SUM(quadra_kills) as total_quadras,
-            SUM(penta_kills) as total_pentas,
-            ROUND(AVG(CAST(total_time_spent_dead AS FLOAT) / game_duration * 100), 1) as avg_time_dead_pct,
-            ROUND(AVG(vision_score), 1) as avg_vision_score,
-            ROUND(AVG(kill_participation * 100), 1) as avg_kill_participation,
-            ROUND(AVG(total_damage_taken / (game_duration / 60.0)), 0) as avg_damage_taken_per_min,
-            SUM(CASE WHEN first_blood_kill = 1 OR first_blood_assist = 1 THEN 1 ELSE 0 END) as total_first_bloods,
-            SUM(turret_takedowns + inhibitor_takedowns) as total_objectives,
-            ROUND(AVG(gold_earned / (game_duration / 60.0)), 0) as avg_gold_per_min,
-            ROUND(AVG(total_minions_killed / (game_duration / 60.0)), 1) as avg_cs_per_min,
-            ROUND(AVG(damage_self_mitigated), 0) as avg_damage_mitigated,
-            MAX(largest_killing_spree) as max_killing_spree,
-            MAX(CASE 
-                WHEN deaths = 0 THEN kills + assists 
-                ELSE CAST((kills + assists) AS FLOAT) / deaths 
-            END) as max_kda
-        FROM champion_data
-        GROUP BY champion_name
-        '''
-        
-        cursor.execute(query, (champion_name, gamemode))
-        result = cursor.fetchone()
-        conn.close()
-        
-        if not result:
-            return None
-            
-        return PlayerStats(
-            champion_name=result[0],
-            champion_games=result[1],
-            winrate=result[2],
-            avg_damage_per_minute=result[3],
-            average_kda=result[4],
-            total_games_overall=result[1],  # Same as champion_games for global stats
-            unique_champions_played=1,  # Only one champion
-            unique_champ_ratio=100.0,  # 100% since only one champion
-            oldest_game="",  # Not relevant for global stats
-            total_hours_played=0.0,  # Not calculated for global stats
-            total_triples=result[8],
-            total_quadras=result[9],
-            total_pentas=result[10],
-            total_pentas_overall=result[10],  # Same as total_pentas for global stats
-            total_winrate=result[2],  # Same as winrate for global stats
-            avg_time_dead_pct=result[11],
-            avg_vision_score=result[12],
-            avg_kill_participation=result[13],
-            avg_damage_taken_per_min=result[14],
-            total_first_bloods=result[15],
-            total_objectives=result[16],
-            avg_gold_per_min=result[17],
-            avg_cs_per_min=result[18],  # New field for CS per minute
-            max_killing_spree=result[19],
-            max_kda=result[20],
-            max_killing_spree_champion=result[0],  # Same as champion_name
-            max_kda_champion=result[0],  # Same as champion_name
-            summoner_level=0,  # Not relevant for global stats
-            profile_icon=0  # Not relevant for global stats
-        )
+        cache_tag = ("champion", normalize_key(champion_name), normalize_key(gamemode))
+        hit, cached = self.cache.get(("champion_global_stats",) + cache_tag[1:])
+        if hit:
+            return cached
+        token = self.cache.token()
+
+        def read(conn):
+            cursor = conn.cursor()
+
+            query = '''
+            WITH champion_data AS (
+                SELECT p.*, m.game_duration, m.game_creation
+                FROM participants p
+                JOIN matches m ON p.match_id = m.match_id
+                WHERE p.champion_name_norm = ?
+                AND m.game_mode_norm = ?
+            )
+            SELECT 
+                champion_name,
+                COUNT(*) as champion_games,
+                ROUND(AVG(CASE WHEN wins = 1 THEN 100.0 ELSE 0 END), 1) as winrate,
+                ROUND(AVG(total_damage_to_champions / (game_duration / 60.0)), 0) as avg_damage_per_minute,
+                ROUND(AVG(CASE 
+                    WHEN deaths = 0 THEN kills + assists 
+                    ELSE CAST((kills + assists) AS FLOAT) / deaths 
+                END), 2) as average_kda,
+                ROUND(AVG(CAST(kills AS FLOAT)), 1) as avg_kills,
+                ROUND(AVG(CAST(deaths AS FLOAT)), 1) as avg_deaths,
+                ROUND(AVG(CAST(assists AS FLOAT)), 1) as avg_assists,
+                SUM(triple_kills) as total_triples,
+                SUM(quadra_kills) as total_quadras,
+                SUM(penta_kills) as total_pentas,
+                ROUND(AVG(CAST(total_time_spent_dead AS FLOAT) / game_duration * 100), 1) as avg_time_dead_pct,
+                ROUND(AVG(vision_score), 1) as avg_vision_score,
+                ROUND(AVG(kill_participation * 100), 1) as avg_kill_participation,
+                ROUND(AVG(total_damage_taken / (game_duration / 60.0)), 0) as avg_damage_taken_per_min,
+                SUM(CASE WHEN first_blood_kill = 1 OR first_blood_assist = 1 THEN 1 ELSE 0 END) as total_first_bloods,
+                SUM(turret_takedowns + inhibitor_takedowns) as total_objectives,
+                ROUND(AVG(gold_earned / (game_duration / 60.0)), 0) as avg_gold_per_min,
+                ROUND(AVG(total_minions_killed / (game_duration / 60.0)), 1) as avg_cs_per_min,
+                ROUND(AVG(damage_self_mitigated), 0) as avg_damage_mitigated,
+                MAX(largest_killing_spree) as max_killing_spree,
+                MAX(CASE 
+                    WHEN deaths = 0 THEN kills + assists 
+                    ELSE CAST((kills + assists) AS FLOAT) / deaths 
+                END) as max_kda
+            FROM champion_data
+            GROUP BY champion_name
+            '''
+
+            cursor.execute(query, cache_tag[1:])
+            result = cursor.fetchone()
+
+            if not result:
+                return None
+
+            return PlayerStats(
+                champion_name=result[0],
+                champion_games=result[1],
+                winrate=result[2],
+                avg_damage_per_minute=result[3],
+                average_kda=result[4],
+                total_games_overall=result[1],  # Same as champion_games for global stats
+                unique_champions_played=1,  # Only one champion
+                unique_champ_ratio=100.0,  # 100% since only one champion
+                oldest_game="",  # Not relevant for global stats
+                total_hours_played=0.0,  # Not calculated for global stats
+                total_triples=result[8],
+                total_quadras=result[9],
+                total_pentas=result[10],
+                total_pentas_overall=result[10],  # Same as total_pentas for global stats
+                total_winrate=result[2],  # Same as winrate for global stats
+                avg_time_dead_pct=result[11],
+                avg_vision_score=result[12],
+                avg_kill_participation=result[13],
+                avg_damage_taken_per_min=result[14],
+                total_first_bloods=result[15],
+                total_objectives=result[16],
+                avg_gold_per_min=result[17],
+                avg_cs_per_min=result[18],  # New field for CS per minute
+                max_killing_spree=result[19],
+                max_kda=result[20],
+                max_killing_spree_champion=result[0],  # Same as champion_name
+                max_kda_champion=result[0],  # Same as champion_name
+                summoner_level=0,  # Not relevant for global stats
+                profile_icon=0  # Not relevant for global stats
+            )
+
+        stats = await self.readers.run(read)
+        self.cache.put(("champion_global_stats",) + cache_tag[1:], stats, [cache_tag], token)
+        return stats
 
     async def get_leaderboard_kda(self, gamemode: str, guild_id: int, period: str = "Weekly", limit: int = 10) -> List[Tuple[str, float, int, int]]:
         """Fetches the KDA leaderboard for the specified period, retrieving the profile icon from the player's latest game in this mode."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        params = [gamemode, gamemode, guild_id] # Base params for subquery and main query
-        where_clauses = [
-            "LOWER(m.game_mode) = LOWER(?)",
-            "u.guild_id = ?",
-            "p.riot_id_game_name IS NOT NULL AND p.riot_id_game_name != '0' AND p.riot_id_game_name != ''"
-        ]
-
-        if period != "All Time":
-            today = date.today()
-            if period == "Weekly":
-                start_date = today - timedelta(days=today.weekday())
-            elif period == "Monthly":
-                start_date = today.replace(day=1)
-            else: # Default to weekly if invalid period somehow passed
-                start_date = today - timedelta(days=today.weekday())
-            
-            start_datetime = datetime.combine(start_date, dt_time.min)
-            start_string = start_datetime.strftime('%Y-%m-%d %H:%M:%S')
-            where_clauses.append("m.game_end >= ?")
-            params.append(start_string)
+        def read(conn):
+            cursor = conn.cursor()
+            params = [normalize_key(gamemode), normalize_key(gamemode), guild_id] # Base params for subquery and main query
+            where_clauses = [
+                "m.game_mode_norm = ?",
+                "u.guild_id = ?",
+                "p.riot_id_game_name IS NOT NULL AND p.riot_id_game_name != '0' AND p.riot_id_game_name != ''"
+            ]
 
-        query = f"""
-        SELECT
-            p.riot_id_game_name,
-            ROUND(AVG(CASE
-                WHEN p.deaths = 0 THEN p.kills + p.assists
-                ELSE CAST(p.kills + p.assists AS FLOAT) / p.deaths
-            END), 2) as average_kda,
-            COUNT(DISTINCT p.match_id) as total_games,
-            (SELECT pp.profile_icon
-             FROM participants pp
-             JOIN matches mm ON pp.match_id = mm.match_id
-             WHERE pp.puuid = p.puuid AND LOWER(mm.game_mode) = LOWER(?)
-             ORDER BY mm.game_end DESC
-             LIMIT 1
-            ) as latest_profile_icon_id
-        FROM participants p
-        JOIN matches m ON p.match_id = m.match_id
-        INNER JOIN users u ON p.puuid = u.puuid
-        WHERE {" AND ".join(where_clauses)}
-        GROUP BY p.puuid, p.riot_id_game_name
-        HAVING total_games > 0
-        ORDER BY average_kda DESC
-        LIMIT ?;
-        """
-        params.append(limit) # Add limit to the end of params
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        conn.close()
-        return results
+            if period != "All Time":
+                today = date.today()
+                if period == "Weekly":
+                    start_date = today - timedelta(days=today.weekday())
+                elif period == "Monthly":
+                    start_date = today.replace(day=1)
+                else: # Default to weekly if invalid period somehow passed
+                    start_date = today - timedelta(days=today.weekday())
+
+                start_datetime = datetime.combine(start_date, dt_time.min)
+                start_string = start_datetime.strftime('%Y-%m-%d %H:%M:%S')
+                where_clauses.append("m.game_end >= ?")
+                params.append(start_string)
+
+            query = f"""
+            SELECT
+                p.riot_id_game_name,
+                ROUND(AVG(CASE
+                    WHEN p.deaths = 0 THEN p.kills + p.assists
+                    ELSE CAST(p.kills + p.assists AS FLOAT) / p.deaths
+                END), 2) as average_kda,
+                COUNT(DISTINCT p.match_id) as total_games,
+                (SELECT pp.profile_icon
+                 FROM participants pp
+                 JOIN matches mm ON pp.match_id = mm.match_id
+                 WHERE pp.puuid = p.puuid AND mm.game_mode_norm = ?
+                 ORDER BY mm.game_end DESC
+                 LIMIT 1
+                ) as latest_profile_icon_id
+            FROM participants p
+            JOIN matches m ON p.match_id = m.match_id
+            INNER JOIN users u ON p.puuid = u.puuid
+            WHERE {" AND ".join(where_clauses)}
+            GROUP BY p.puuid, p.riot_id_game_name
+            HAVING total_games > 0
+            ORDER BY average_kda DESC
+            LIMIT ?;
+            """
+            params.append(limit) # Add limit to the end of params
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+            return results
+
+        return await self.readers.run(read)
 
     async def get_leaderboard_winrate(self, gamemode: str, guild_id: int, period: str = "Weekly", min_games: int = 10, limit: int = 10) -> List[Tuple[str, float, int, int]]:
         """Fetches the Win Rate leaderboard for the specified period, retrieving the profile icon from the player's latest game in this mode."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        params = [gamemode, gamemode, guild_id]
-        where_clauses = [
-            "LOWER(m.game_mode) = LOWER(?)",
-            "u.guild_id = ?",
-            "p.riot_id_game_name IS NOT NULL AND p.riot_id_game_name != '0' AND p.riot_id_game_name != ''"
-        ]
-
-        if period != "All Time":
-            today = date.today()
-            if period == "Weekly":
-                start_date = today - timedelta(days=today.weekday())
-            elif period == "Monthly":
-                start_date = today.replace(day=1)
-            else: 
-                start_date = today - timedelta(days=today.weekday())
-            
-            start_datetime = datetime.combine(start_date, dt_time.min)
-            start_string = start_datetime.strftime('%Y-%m-%d %H:%M:%S')
-            where_clauses.append("m.game_end >= ?")
-            params.append(start_string)
+        def read(conn):
+            cursor = conn.cursor()
+            params = [normalize_key(gamemode), normalize_key(gamemode), guild_id]
+            where_clauses = [
+                "m.game_mode_norm = ?",
+                "u.guild_id = ?",
+                "p.riot_id_game_name IS NOT NULL AND p.riot_id_game_name != '0' AND p.riot_id_game_name != ''"
+            ]
 
-        query = f"""
-        SELECT
-            p.riot_id_game_name,
-            ROUND(AVG(CASE WHEN p.wins = 1 THEN 100.0 ELSE 0 END), 1) as winrate,
-            COUNT(DISTINCT p.match_id) as total_games,
-            (SELECT pp.profile_icon
-             FROM participants pp
-             JOIN matches mm ON pp.match_id = mm.match_id
-             WHERE pp.puuid = p.puuid AND LOWER(mm.game_mode) = LOWER(?)
-             ORDER BY mm.game_end DESC
-             LIMIT 1
-            ) as latest_profile_icon_id
-        FROM participants p
-        JOIN matches m ON p.match_id = m.match_id
-        INNER JOIN users u ON p.puuid = u.puuid
-        WHERE {" AND ".join(where_clauses)}
-        GROUP BY p.puuid, p.riot_id_game_name
-        HAVING total_games >= ?
-        ORDER BY winrate DESC
-        LIMIT ?;
-        """
-        params.append(min_games) # Add min_games
-        params.append(limit)     # Add limit
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        conn.close()
-        return results
+            if period != "All Time":
+                today = date.today()
+                if period == "Weekly":
+                    start_date = today - timedelta(days=today.weekday())
+                elif period == "Monthly":
+                    start_date = today.replace(day=1)
+                else: 
+                    start_date = today - timedelta(days=today.weekday())
+
+                start_datetime = datetime.combine(start_date, dt_time.min)
+                start_string = start_datetime.strftime('%Y-%m-%d %H:%M:%S')
+                where_clauses.append("m.game_end >= ?")
+                params.append(start_string)
+
+            query = f"""
+            SELECT
+                p.riot_id_game_name,
+                ROUND(AVG(CASE WHEN p.wins = 1 THEN 100.0 ELSE 0 END), 1) as winrate,
+                COUNT(DISTINCT p.match_id) as total_games,
+                (SELECT pp.profile_icon
+                 FROM participants pp
+                 JOIN matches mm ON pp.match_id = mm.match_id
+                 WHERE pp.puuid = p.puuid AND mm.game_mode_norm = ?
+                 ORDER BY mm.game_end DESC
+                 LIMIT 1
+                ) as latest_profile_icon_id
+            FROM participants p
+            JOIN matches m ON p.match_id = m.match_id
+            INNER JOIN users u ON p.puuid = u.puuid
+            WHERE {" AND ".join(where_clauses)}
+            GROUP BY p.puuid, p.riot_id_game_name
+            HAVING total_games >= ?
+            ORDER BY winrate DESC
+            LIMIT ?;
+            """
+            params.append(min_games) # Add min_games
+            params.append(limit)     # Add limit
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+            return results
+
+        return await self.readers.run(read)
 
     async def get_leaderboard_dpm(self, gamemode: str, guild_id: int, period: str = "Weekly", limit: int = 10) -> List[Tuple[str, int, int, int]]:
         """Fetches the DPM leaderboard for the specified period, retrieving the profile icon from the player's latest game in this mode."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        params = [gamemode, gamemode, guild_id] # Base params for subquery and main query
-        where_clauses = [
-            "LOWER(m.game_mode) = LOWER(?)",
-            "u.guild_id = ?",
-            "p.riot_id_game_name IS NOT NULL AND p.riot_id_game_name != '0' AND p.riot_id_game_name != ''",
-            "m.game_duration > 0" # Ensure game duration is positive to avoid division by zero
-        ]
-
-        if period != "All Time":
-            today = date.today()
-            if period == "Weekly":
-                start_date = today - timedelta(days=today.weekday())
-            elif period == "Monthly":
-                start_date = today.replace(day=1)
-            else: # Default to weekly
-                start_date = today - timedelta(days=today.weekday())
-
-            start_datetime = datetime.combine(start_date, dt_time.min)
-            start_string = start_datetime.strftime('%Y-%m-%d %H:%M:%S')
-            where_clauses.append("m.game_end >= ?")
-            params.append(start_string)
-
-        query = f"""
-        SELECT
-            p.riot_id_game_name,
-            -- Calculate Average DPM (Damage Per Minute)
-            ROUND(AVG(p.total_damage_to_champions / (m.game_duration / 60.0)), 0) as average_dpm,
-            COUNT(DISTINCT p.match_id) as total_games,
-            (SELECT pp.profile_icon
-             FROM participants pp
-             JOIN matches mm ON pp.match_id = mm.match_id
-             WHERE pp.puuid = p.puuid AND LOWER(mm.game_mode) = LOWER(?)
-             ORDER BY mm.game_end DESC
-             LIMIT 1
-            ) as latest_profile_icon_id
-        FROM participants p
-        JOIN matches m ON p.match_id = m.match_id
-        INNER JOIN users u ON p.puuid = u.puuid
-        WHERE {" AND ".join(where_clauses)}
-        GROUP BY p.puuid, p.riot_id_game_name
-        HAVING total_games > 0 AND average_dpm IS NOT NULL -- Ensure DPM could be calculated
-        ORDER BY average_dpm DESC
-        LIMIT ?;
-        """
-        params.append(limit) # Add limit to the end of params
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        conn.close()
-        # Result tuple: (name, dpm, games, latest_profile_icon_id)
-        # Convert DPM to int here
-        return [(name, int(dpm) if dpm is not None else 0, games, icon) for name, dpm, games, icon in results]
-
-    async def create_pending_matches_table(self):
-        """Create the pending_matches table if it doesn't exist"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS pending_matches (
-                match_id TEXT PRIMARY KEY,
-                game_mode TEXT NOT NULL,
-                channel_id INTEGER NOT NULL,
-                message_id INTEGER NOT NULL,
-                attempts INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-        conn.close()
+        def read(conn):
+            cursor = conn.cursor()
+            params = [normalize_key(gamemode), normalize_key(gamemode), guild_id] # Base params for subquery and main query
+            where_clauses = [
+                "m.game_mode_norm = ?",
+                "u.guild_id = ?",
+                "p.riot_id_game_name IS NOT NULL AND p.riot_id_game_name != '0' AND p.riot_id_game_name != ''",
+                "m.game_duration > 0" # Ensure game duration is positive to avoid division by zero
+            ]
+
+            if period != "All Time":
+                today = date.today()
+                if period == "Weekly":
+                    start_date = today - timedelta(days=today.weekday())
+                elif period == "Monthly":
+                    start_date = today.replace(day=1)
+                else: # Default to weekly
+                    start_date = today - timedelta(days=today.weekday())
+
+                start_datetime = datetime.combine(start_date, dt_time.min)
+                start_string = start_datetime.strftime('%Y-%m-%d %H:%M:%S')
+                where_clauses.append("m.game_end >= ?")
+                params.append(start_string)
+
+            query = f"""
+            SELECT
+                p.riot_id_game_name,
+                -- Calculate Average DPM (Damage Per Minute)
+                ROUND(AVG(p.total_damage_to_champions / (m.game_duration / 60.0)), 0) as average_dpm,
+                COUNT(DISTINCT p.match_id) as total_games,
+                (SELECT pp.profile_icon
+                 FROM participants pp
+                 JOIN matches mm ON pp.match_id = mm.match_id
+                 WHERE pp.puuid = p.puuid AND mm.game_mode_norm = ?
+                 ORDER BY mm.game_end DESC
+                 LIMIT 1
+                ) as latest_profile_icon_id
+            FROM participants p
+            JOIN matches m ON p.match_id = m.match_id
+            INNER JOIN users u ON p.puuid = u.puuid
+            WHERE {" AND ".join(where_clauses)}
+            GROUP BY p.puuid, p.riot_id_game_name
+            HAVING total_games > 0 AND average_dpm IS NOT NULL -- Ensure DPM could be calculated
+            ORDER BY average_dpm DESC
+            LIMIT ?;
+            """
+            params.append(limit) # Add limit to the end of params
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+            # Result tuple: (name, dpm, games, latest_profile_icon_id)
+            # Convert DPM to int here
+            return [(name, int(dpm) if dpm is not None else 0, games, icon) for name, dpm, games, icon in results]
+
+        return await self.readers.run(read)
+
+    async def enqueue_job(self, job_type: str, job_key: str, payload: dict, max_attempts: int, delay: float = 0):
+        """Add a job to the durable queue, replacing (and resetting) a queued job with the same type and key."""
+        await self.ensure_schema()
+        def write(cursor):
+            cursor.execute("""
+                INSERT INTO jobs (job_type, job_key, payload, attempts, max_attempts, next_run_at, created_at)
+                VALUES (?, ?, ?, 0, ?, ?, datetime('now'))
+                ON CONFLICT (job_type, job_key) DO UPDATE SET
+                    payload = excluded.payload, attempts = 0, max_attempts = excluded.max_attempts,
+                    next_run_at = excluded.next_run_at, lease_token = NULL, last_error = NULL,
+                    created_at = excluded.created_at
+            """, (job_type, job_key, json.dumps(payload), max_attempts, time.time() + delay))
+        await self.writer.submit(write)
+        self.job_enqueued.set()
+
+    async def claim_jobs(self, limit: int, lease_seconds: float) -> List[Job]:
+        """Lease up to limit due jobs, oldest due first. A job not finished within its lease runs again."""
+        await self.ensure_schema()
+        def write(cursor):
+            now = time.time()
+            cursor.execute("""
+                SELECT id, job_type, job_key, payload, attempts, max_attempts
+                FROM jobs WHERE next_run_at <= ?
+                ORDER BY next_run_at LIMIT ?
+            """, (now, limit))
+            jobs = [
+                Job(id=row[0], job_type=row[1], job_key=row[2], payload=json.loads(row[3]),
+                    attempts=row[4] + 1, max_attempts=row[5], lease_token=uuid.uuid4().hex)
+                for row in cursor.fetchall()
+            ]
+            cursor.executemany("""
+                UPDATE jobs SET attempts = ?, lease_token = ?, next_run_at = ?, last_attempt_at = datetime('now')
+                WHERE id = ?
+            """, [(job.attempts, job.lease_token, now + lease_seconds, job.id) for job in jobs])
+            return jobs
+
+        return await self.writer.submit(write)
+
+    async def complete_job(self, job: Job):
+        """Remove a finished job, unless its lease ran out and someone else holds it now."""
+        def write(cursor):
+            cursor.execute("DELETE FROM jobs WHERE id = ? AND lease_token = ?", (job.id, job.lease_token))
+        await self.writer.submit(write)
+
+    async def retry_job(self, job: Job, delay: float, error: str = None):
+        """Release a job to run again after delay seconds."""
+        def write(cursor):
+            cursor.execute("""
+                UPDATE jobs SET next_run_at = ?, lease_token = NULL, last_error = ?
+                WHERE id = ? AND lease_token = ?
+            """, (time.time() + delay, error, job.id, job.lease_token))
+        await self.writer.submit(write)
+
+    async def run_job_now(self, job_type: str, job_key: str) -> bool:
+        """Make a queued job due right away. False if it isn't queued or a worker holds it right now."""
+        def write(cursor):
+            now = time.time()
+            cursor.execute("""
+                UPDATE jobs SET next_run_at = MIN(next_run_at, ?)
+                WHERE job_type = ? AND job_key = ? AND (lease_token IS NULL OR next_run_at <= ?)
+            """, (now, job_type, job_key, now))
+            return cursor.rowcount > 0
+
+        scheduled = await self.writer.submit(write)
+        if scheduled:
+            self.job_enqueued.set()
+        return scheduled
+
+    async def get_next_job_time(self) -> Optional[float]:
+        """Epoch seconds when the next job is due, None if the queue is empty."""
+        await self.ensure_schema()
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(next_run_at) FROM jobs")
+            return cursor.fetchone()[0]
+
+        return await self.readers.run(read)
 
     async def add_pending_match(self, match_id: str, game_mode: str, channel_id: int, message_id: int):
         """Add a match to the pending matches queue"""
-        await self.create_pending_matches_table()  # Ensure table exists
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO pending_matches 
-            (match_id, game_mode, channel_id, message_id, attempts, created_at, last_attempt)
-            VALUES (?, ?, ?, ?, 0, datetime('now'), datetime('now'))
-        """, (match_id, game_mode, channel_id, message_id))
-        conn.commit()
-        conn.close()
+        await self.enqueue_job(
+            PENDING_MATCH_JOB, match_id,
+            {"game_mode": game_mode, "channel_id": channel_id, "message_id": message_id},
+            PENDING_MATCH_MAX_ATTEMPTS, delay=PENDING_MATCH_FIRST_RUN_SECONDS
+        )
 
     async def get_pending_matches(self, if_older_than: int = 0) -> list:
-        """Get all pending matches that need to be retried"""
-        await self.create_pending_matches_table()  # Ensure table exists
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT match_id, game_mode, channel_id, message_id, attempts, created_at, last_attempt
-            FROM pending_matches
-            WHERE created_at < datetime('now', '-{} minutes')  -- Maximum 10 attempts
-            ORDER BY created_at ASC
-        """.format(if_older_than))
-        results = cursor.fetchall()
-        conn.close()
-        return results
+        """Get all pending matches, as (match_id, game_mode, channel_id, message_id, attempts, created_at, last_attempt)"""
+        await self.ensure_schema()
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT job_key, payload, attempts, created_at, COALESCE(last_attempt_at, created_at)
+                FROM jobs
+                WHERE job_type = ? AND created_at <= datetime('now', ?)
+                ORDER BY created_at ASC
+            """, (PENDING_MATCH_JOB, f"-{int(if_older_than)} minutes"))
+            results = []
+            for match_id, payload, attempts, created_at, last_attempt in cursor.fetchall():
+                payload = json.loads(payload)
+                results.append((match_id, payload["game_mode"], payload["channel_id"], payload["message_id"], attempts, created_at, last_attempt))
+            return results
 
-    async def update_pending_match_attempt(self, match_id: str):
-        """Increment the attempt counter and update last_attempt timestamp"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE pending_matches 
-            SET attempts = attempts + 1, last_attempt = datetime('now')
-            WHERE match_id = ?
-        """, (match_id,))
-        conn.commit()
-        conn.close()
+        return await self.readers.run(read)
+
+    async def retry_pending_match_now(self, match_id: str) -> bool:
+        """Run a pending match's job right away instead of waiting for its backoff"""
+        return await self.run_job_now(PENDING_MATCH_JOB, match_id)
 
     async def remove_pending_match(self, match_id: str):
         """Remove a match from the pending matches queue"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM pending_matches WHERE match_id = ?", (match_id,))
-        conn.commit()
-        conn.close()
-
-    async def cleanup_old_pending_matches(self, days: int = 7):
-        """Remove pending matches older than specified days"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            DELETE FROM pending_matches 
-            WHERE created_at < datetime('now', '-{} days')
-        """.format(days))
-        conn.commit()
-        conn.close()
+        def write(cursor):
+            cursor.execute("DELETE FROM jobs WHERE job_type = ? AND job_key = ?", (PENDING_MATCH_JOB, match_id))
+        await self.writer.submit(write)
 
 def setup(bot):
     bot.add_cog(DatabaseOperations(bot))
@@ -1,4 +1,7 @@
+import os
 import time
+import heapq
+import random
 from collections import deque
 import aiohttp
 import asyncio
@@ -6,13 +9,128 @@ from disnake.ext import commands
 import disnake
 import psutil
 import datetime
+from .DatabaseOperations import PENDING_MATCH_JOB
+
+# check_if_in_game polling settings
+LIVE_GAME_POLL_SECONDS = 15  # Time between the starts of two sweeps, each polls the users that are due
+SPECTATOR_POLL_CONCURRENCY = 8  # Spectator requests in flight, the rate limiter still has the final say
+BACKGROUND_UPDATE_SECONDS = 60 * 60  # Time between full update_database sweeps, finished live games are stored right away
+
+# SpectatorSchedule settings
+SPECTATOR_REQUESTS_PER_MINUTE = 30  # Budget for users not in a game, override with SPECTATOR_REQUESTS_PER_MINUTE in .env
+SPECTATOR_MIN_INTERVAL_SECONDS = 60  # In game, just finished a game, or at their usual hours
+SPECTATOR_MAX_INTERVAL_SECONDS = 60 * 60  # Dormant accounts
+SPECTATOR_OFF_HOURS_FACTOR = 5  # Interval multiplier outside a user's usual hours
+SPECTATOR_IDLE_DOUBLING_DAYS = 7  # The interval doubles for every this many days since the last game
+SPECTATOR_RECENT_GAME_SECONDS = 45 * 60  # How long after a game a user counts as just finished
+SPECTATOR_USUAL_HOUR_SHARE = 0.15  # Share of a user's games within an hour of now that makes it a usual hour
+SPECTATOR_HISTORY_DAYS = 90  # Play time history the profiles are built from
+SPECTATOR_PROFILE_REFRESH_SECONDS = 60 * 60
+
+# Durable job queue workers (DatabaseOperations jobs table)
+JOB_WORKERS = 3  # Jobs run at the same time
+JOB_LEASE_SECONDS = 5 * 60  # A job its worker didn't finish within this runs again
+JOB_BACKOFF_BASE_SECONDS = 2 * 60  # Retry delay after the first failed attempt, doubles with each one
+JOB_BACKOFF_MAX_SECONDS = 30 * 60
+JOB_IDLE_POLL_SECONDS = 5 * 60  # Longest an idle worker sleeps before looking at the queue again
+
+class SpectatorSchedule:
+    """Decides which users check_if_in_game polls, using a heap of (due time, puuid).
+
+    Each user's interval comes from their play time profile: SPECTATOR_MIN_INTERVAL_SECONDS
+    while in a game, right after one and at the hours they usually play, longer off hours,
+    doubling with every SPECTATOR_IDLE_DOUBLING_DAYS without a game up to
+    SPECTATOR_MAX_INTERVAL_SECONDS. Users in a game are always polled when due, since that
+    is how the end of their game is noticed; everyone else shares the per-minute budget,
+    most overdue first.
+    """
+
+    def __init__(self, requests_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.heap = []  # (due, puuid), entries whose due doesn't match self.due are stale
+        self.due = {}  # puuid -> monotonic time of their next poll
+        self.profiles = {}  # puuid -> (games per local hour, last game end in epoch ms)
+        self.profiles_loaded_at = None
+        self.in_game = set()  # Users seen in a game on their last poll
+        self.left_game_at = {}  # puuid -> epoch seconds when they were last seen leaving a game
+
+    def sync(self, puuids):
+        """Track exactly these users, new ones are due right away and trigger a profile reload."""
+        now = time.monotonic()
+        for puuid in puuids:
+            if puuid not in self.due:
+                self._schedule(puuid, now)
+                self.profiles_loaded_at = None
+        for puuid in set(self.due) - set(puuids):
+            del self.due[puuid]
+            self.in_game.discard(puuid)
+            self.left_game_at.pop(puuid, None)
+
+    def _schedule(self, puuid: str, due: float):
+        self.due[puuid] = due
+        heapq.heappush(self.heap, (due, puuid))
+
+    def pop_due(self, budget: int):
+        """Users due for a poll: everyone due who is in a game, plus up to budget others."""
+        now = time.monotonic()
+        polls, deferred = [], []
+        while self.heap and self.heap[0][0] <= now:
+            due, puuid = heapq.heappop(self.heap)
+            if self.due.get(puuid) != due:
+                continue  # Stale entry
+            if puuid in self.in_game:
+                polls.append(puuid)
+            elif budget > 0:
+                polls.append(puuid)
+                budget -= 1
+            else:
+                deferred.append((due, puuid))  # Keeps its place, first in line next sweep
+        for entry in deferred:
+            heapq.heappush(self.heap, entry)
+        return polls
+
+    def interval(self, puuid: str) -> float:
+        if puuid in self.in_game:
+            return SPECTATOR_MIN_INTERVAL_SECONDS
+        hours, last_game_end = self.profiles.get(puuid, ([0] * 24, None))
+        now = time.time()
+        last_games = [t for t in (last_game_end and last_game_end / 1000, self.left_game_at.get(puuid)) if t]
+        if not last_games:
+            return SPECTATOR_MAX_INTERVAL_SECONDS
+        last_game = max(last_games)
+        if now - last_game < SPECTATOR_RECENT_GAME_SECONDS:
+            return SPECTATOR_MIN_INTERVAL_SECONDS
+        interval = SPECTATOR_MIN_INTERVAL_SECONDS * 2 ** ((now - last_game) / 86400 / SPECTATOR_IDLE_DOUBLING_DAYS)
+        hour = datetime.datetime.now().hour
+        games_near_now = sum(hours[(hour + offset) % 24] for offset in (-1, 0, 1))
+        if not sum(hours) or games_near_now / sum(hours) < SPECTATOR_USUAL_HOUR_SHARE:
+            interval *= SPECTATOR_OFF_HOURS_FACTOR
+        return min(interval, SPECTATOR_MAX_INTERVAL_SECONDS)
+
+    def record(self, polled, in_game_puuids):
+        """Reschedule the polled users and every tracked user seen in a live game."""
+        now = time.monotonic()
+        for puuid in set(polled) | (set(in_game_puuids) & set(self.due)):
+            if puuid in in_game_puuids:
+                self.in_game.add(puuid)
+            elif puuid in self.in_game:
+                self.in_game.discard(puuid)
+                self.left_game_at[puuid] = time.time()
+            self._schedule(puuid, now + self.interval(puuid))
 
 class Loops(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Which users to ask spectator-v5 about on each sweep
+        self.spectator_schedule = SpectatorSchedule(int(os.getenv("SPECTATOR_REQUESTS_PER_MINUTE", SPECTATOR_REQUESTS_PER_MINUTE)))
         self.bot.loop.create_task(self.check_if_in_game())
         self.bot.loop.create_task(self.update_cpu_status())
-        self.bot.loop.create_task(self.process_pending_matches())
+        # Durable job queue: handlers by job type, and what to do once a job ran out of attempts
+        self.job_handlers = {PENDING_MATCH_JOB: self.run_pending_match_job}
+        self.job_failure_handlers = {PENDING_MATCH_JOB: self.fail_pending_match_job}
+        for _ in range(JOB_WORKERS):
+            self.bot.loop.create_task(self.job_worker())
+        self.bot.loop.create_task(self.update_database_periodically())
         self.live_game_messages = {}  # Store message IDs for each game
 
     def _get_cpu_temperature(self):
@@ -76,13 +194,207 @@ class Loops(commands.Cog):
                 await asyncio.sleep(30)  # Wait longer on general errors
                 continue
 
+    async def poll_live_games(self, users) -> dict:
+        """Ask spectator-v5 which users are in a game, SPECTATOR_POLL_CONCURRENCY calls at a time.
+
+        Users already seen in a game found earlier in the sweep are skipped without a call.
+        Returns game id -> spectator game data.
+        """
+        riot_ops = self.bot.get_cog("RiotAPIOperations")
+        semaphore = asyncio.Semaphore(SPECTATOR_POLL_CONCURRENCY)
+        seen_puuids = set()  # Participants of games found so far in this sweep
+        games = {}
+
+        async def poll(user):
+            async with semaphore:
+                if user.puuid in seen_puuids:
+                    return
+                try:
+                    game_data = await riot_ops.get_current_game(user.puuid)
+                except Exception as e:
+                    print(f"Error checking if {user.riot_id_game_name} is in a game: {e}")
+                    await self.bot.get_channel(self.bot.botlol_channel_id).send(f"Error checking if {user.riot_id_game_name} is in a game: {e}")
+                    return
+                if game_data and game_data['gameId']:  # Only process if game_data is not None
+                    seen_puuids.update(p['puuid'] for p in game_data.get('participants', []))
+                    games.setdefault(str(game_data['gameId']), game_data)
+
+        await asyncio.gather(*(poll(user) for user in users))
+        return games
+
+    async def finish_live_game(self, game_id: str, message_info: dict):
+        """Store a game that just ended and post its player cards in a thread on the live game message."""
+        try:
+            channel = await self.bot.fetch_channel(message_info['channel_id'])
+            message = await channel.fetch_message(message_info['message_id'])
+            
+            game_mode_finished = message_info.get('game_mode') # Get game_mode
+            game_mode_finished_upper = str(game_mode_finished).upper()
+            skip_deletion = False  # Flag to control message deletion
+
+            # Initial message edit
+            await message.edit(embed=disnake.Embed(
+                title="🎮 Game Over - Processing...", # Changed title and description
+                description="Please wait while we process match data...",
+                color=disnake.Color.gold()
+            ))
+            
+            description_for_next_step = ""
+
+            if game_mode_finished_upper != 'BRAWL':
+                # Fetch and store just this match, waiting for match-v5 to publish it
+                match_region = self.bot.get_cog("RiotAPIOperations").ACCOUNT_REGION.upper()
+                full_game_id = f"{match_region}_{game_id}" if not game_id.startswith(f"{match_region}_") else game_id
+                if not await self.bot.get_cog("RiotAPIOperations").ingest_finished_match(full_game_id):
+                    if game_mode_finished_upper == "CUSTOM":
+                        # No cards for custom games, the background update stores the match later
+                        print(f"Match {full_game_id} not available yet, left to the background update")
+                        await message.edit(embed=disnake.Embed(
+                            title="🎮 Custom Game Over",
+                            description="Stats generation skipped for custom games.",
+                            color=disnake.Color.orange()
+                        ))
+                        return
+                    # Not published yet, the pending_match job keeps retrying and posts the cards
+                    await self.bot.get_cog("DatabaseOperations").add_pending_match(
+                        full_game_id, game_mode_finished_upper, channel.id, message.id
+                    )
+                    print(f"Match {full_game_id} not available yet, queued for retry")
+                    # fail_pending_match_job recognizes the message by this title
+                    await message.edit(embed=disnake.Embed(
+                        title=f"⏳ {game_mode_finished_upper} Match Queued",
+                        description="Match data isn't available yet. Player cards will be posted in a thread once it is.",
+                        color=disnake.Color.orange()
+                    ))
+                    return
+                # CHERRY/KIWI games are queued when they start, the cards are posted here instead
+                await self.bot.get_cog("DatabaseOperations").remove_pending_match(full_game_id)
+                description_for_next_step = "Match data stored. Generating player cards..."
+            else:
+                # For BRAWL games, skip database update
+                description_for_next_step = "Skipped database update for BRAWL game. Generating player cards..."
+            
+            # Update the message to show we're now generating cards
+            await message.edit(embed=disnake.Embed(
+                title="🎮 Game Over - Generating Stats...",
+                description=f"{description_for_next_step}\n\nResults will be posted in the thread attached to this message.",
+                color=disnake.Color.gold()
+            ))
+            
+            # Create or get a thread attached to this live game message and post results there
+            thread = None
+            target_channel = channel
+            try:
+                if hasattr(message, "thread") and message.thread and not message.thread.archived:
+                    thread = message.thread
+                else:
+                    thread_name = "Game Over Stats"
+                    thread = await message.create_thread(name=thread_name, auto_archive_duration=1440)
+                target_channel = thread
+                # Try to remove the system "started a thread" message
+                try:
+                    await asyncio.sleep(5)
+                    async for recent_msg in channel.history(limit=20):
+                        if (
+                            recent_msg.type == disnake.MessageType.thread_created and (
+                                (recent_msg.thread and recent_msg.thread.id == thread.id) or
+                                (thread.name and thread.name in (recent_msg.content or ""))
+                            )
+                        ) or (
+                            (recent_msg.author and self.bot.user and recent_msg.author.id == self.bot.user.id) and
+                            ("started a thread" in (recent_msg.content or "")) and
+                            (thread.name and thread.name in (recent_msg.content or ""))
+                        ):
+                            try:
+                                await recent_msg.delete()
+                            except Exception as de:
+                                print(f"Could not delete system thread message for game {game_id}: {de}")
+                            break
+                except Exception as e:
+                    print(f"Failed to delete system thread message for game {game_id}: {e}")
+            except Exception as e:
+                print(f"Error creating or accessing thread for game {game_id}: {e}")
+            
+            # Then generate finished game card
+            try:
+                # Ensure game_id includes the server prefix (e.g., "EUW1_" + game_id)
+                # The match ID should be prefixed with the region for the Riot API
+                match_region = self.bot.get_cog("RiotAPIOperations").ACCOUNT_REGION.upper()
+                full_game_id = f"{match_region}_{game_id}" if not game_id.startswith(f"{match_region}_") else game_id
+                
+                # Get match information from the database
+                match_info = await self.bot.get_cog("DatabaseOperations").get_match_info(full_game_id)
+                match_participants = await self.bot.get_cog("DatabaseOperations").get_match_participants(full_game_id)
+                
+                if match_info and match_participants:
+                    game_start_date = match_info[3] # Used for timestamp
+
+                    # Common: Prepare participant list (summary embed removed)
+                    tracked_users = await self.bot.get_cog("DatabaseOperations").get_users()
+                    tracked_puuids = {user.puuid for user in tracked_users}
+                    tracked_participants_list = [
+                        f"{p['riot_id_game_name']} ({p['champion_name']})"
+                        for p in match_participants if p['puuid'] in tracked_puuids
+                    ]
+
+                    if game_mode_finished_upper == "CUSTOM":
+                        await message.edit(embed=disnake.Embed(
+                            title="🎮 Custom Game Over",
+                            description="Stats generation skipped for custom games.",
+                            color=disnake.Color.orange()
+                        ))
+                        # No summary or cards for CUSTOM games.
+
+                    elif game_mode_finished_upper == "BRAWL":
+                        await message.edit(embed=disnake.Embed(
+                            title="🎮 BRAWL Game Over",
+                            description="Database update and player card generation skipped for BRAWL games.",
+                            color=disnake.Color.blue() 
+                        ))
+                        # No player cards for BRAWL games.
+
+                    else: # Regular game (not CUSTOM, not BRAWL)
+                        # Generate and send player cards only (no summary embed)
+                        # Each card is posted as soon as it is rendered
+                        async for card_file in self.bot.get_cog("CardGenerator").iter_finished_game_cards(full_game_id):
+                            await target_channel.send(file=card_file)
+
+            except Exception as e:
+                print(f"Error generating finished game card for game {game_id}: {e}")
+                error_embed = disnake.Embed(
+                    title="❌ Error Generating Game Stats",
+                    description=f"Could not generate game stats: {str(e)}",
+                    color=disnake.Color.red()
+                )
+                try: # Attempt to edit the original message first
+                    await message.edit(embed=error_embed)
+                except disnake.NotFound: # If message is already deleted, just send to channel
+                    pass 
+                await target_channel.send(embed=error_embed)
+            finally:
+                await message.edit(embed=None)
+            
+            # Do not delete the original message; keep it as the parent of the thread with results
+            # (Previously deleted the message after a short delay.)
+        except Exception as e:
+            print(f"Error processing finished game {game_id}: {e}")
+            await self.bot.get_channel(self.bot.botlol_channel_id).send(f"Error processing finished game {game_id}: {e}")
+
     async def check_if_in_game(self):
        
         while True:
+            sweep_started = time.monotonic()
             try:
                 """Checks if tracked users are in game and announces their games."""
                 users = await self.bot.get_cog("DatabaseOperations").get_users(active="TRUE")
-                processed_users = set()  # Keep track of processed users
+                users_by_puuid = {user.puuid: user for user in users}
+                schedule = self.spectator_schedule
+                schedule.sync(users_by_puuid)
+                if schedule.profiles_loaded_at is None or sweep_started - schedule.profiles_loaded_at > SPECTATOR_PROFILE_REFRESH_SECONDS:
+                    schedule.profiles = await self.bot.get_cog("DatabaseOperations").get_play_time_profiles(
+                        list(users_by_puuid), SPECTATOR_HISTORY_DAYS
+                    )
+                    schedule.profiles_loaded_at = sweep_started
                 current_game_ids = set()  # Track current active game IDs
                 games_data = {}  # Dictionary to store players grouped by game ID
 
@@ -93,74 +405,76 @@ class Loops(commands.Cog):
                 except Exception:
                     pending_ids = set()
 
-                # Collect data for all users in games
-                for user in users:
-                    if user.username in processed_users:  # Skip if user was already processed
-                        continue
-
+                # Collect data for the users that are due a poll
+                budget = max(1, schedule.requests_per_minute * LIVE_GAME_POLL_SECONDS // 60)
+                due_users = [users_by_puuid[puuid] for puuid in schedule.pop_due(budget)]
+                live_games = await self.poll_live_games(due_users)
+                schedule.record(
+                    [user.puuid for user in due_users],
+                    {p['puuid'] for game in live_games.values() for p in game.get('participants', [])}
+                )
+                for game_id, game_data in live_games.items():
                     try:
-                        game_data = await self.bot.get_cog("RiotAPIOperations").get_current_game(user.puuid)
-                        if game_data and game_data['gameId']:  # Only process if game_data is not None
-                            #debug print the game data
-                            print(game_data)
-                            game_id = str(game_data['gameId'])
-                            current_game_ids.add(game_id)
-                            
-                            # Initialize game data if not exists
-                            if game_id not in games_data:
-                                # If RUBY, attempt to resolve queue name via CDragon using gameQueueConfigId
+                        #debug print the game data
+                        print(game_data)
+                        current_game_ids.add(game_id)
+                        
+                        # Initialize game data if not exists
+                        if game_id not in games_data:
+                            # If RUBY, attempt to resolve queue name via CDragon using gameQueueConfigId
+                            resolved_queue_name = None
+                            try:
+                                if 'RUBY' in str(game_data.get('gameMode', '')):
+                                    queue_id = game_data.get('gameQueueConfigId')
+                                    riot_ops = self.bot.get_cog("RiotAPIOperations")
+                                    if riot_ops and queue_id is not None:
+                                        await riot_ops.ensure_queues_map()
+                                        resolved_queue_name = riot_ops.get_queue_name_from_cache(queue_id)
+                            except Exception as _e:
                                 resolved_queue_name = None
-                                try:
-                                    if 'RUBY' in str(game_data.get('gameMode', '')):
-                                        queue_id = game_data.get('gameQueueConfigId')
-                                        riot_ops = self.bot.get_cog("RiotAPIOperations")
-                                        if riot_ops and queue_id is not None:
-                                            await riot_ops.ensure_queues_map()
-                                            resolved_queue_name = riot_ops.get_queue_name_from_cache(queue_id)
-                                except Exception as _e:
-                                    resolved_queue_name = None
-
-                                games_data[game_id] = {
-                                    'players': [],
-                                    'gameMode': game_data['gameMode'],
-                                    'guild_id': user.guild_id,
-                                    'queue_name': resolved_queue_name
-                                }
-
-                            # Process all tracked users in this game
-                            for participant in game_data['participants']:
-                                # Find if this participant is one of our tracked users
-                                tracked_user = next((u for u in users if u.puuid == participant['puuid']), None)
-                                if tracked_user:
-                                    champion = await self.bot.get_cog("DatabaseOperations").get_champion(participant['championId'])
+
+                            games_data[game_id] = {
+                                'players': [],
+                                'gameMode': game_data['gameMode'],
+                                'guild_id': None,
+                                'queue_name': resolved_queue_name
+                            }
+
+                        # Process all tracked users in this game
+                        for participant in game_data['participants']:
+                            # Find if this participant is one of our tracked users
+                            tracked_user = users_by_puuid.get(participant['puuid'])
+                            if tracked_user:
+                                if games_data[game_id]['guild_id'] is None:
+                                    games_data[game_id]['guild_id'] = tracked_user.guild_id
+                                champion = await self.bot.get_cog("DatabaseOperations").get_champion(participant['championId'])
+                                
+                                stats = await self.bot.get_cog("DatabaseOperations").get_player_stats(
+                                    tracked_user.riot_id_game_name,
+                                    game_data['gameMode'],
+                                    champion
+                                )
+
+                                # Only add to players list and update last_game_played if not announced yet
+                                if game_id != str(tracked_user.last_game_played):
+                                    games_data[game_id]['players'].append({
+                                        'name': tracked_user.riot_id_game_name,
+                                        'champion': champion,
+                                        'gameMode': game_data['gameMode'],
+                                        'queue_name': games_data[game_id].get('queue_name'),
+                                        'stats': stats[0] if stats else None,
+                                        'guild_id': tracked_user.guild_id,
+                                        'game_id': game_id
+                                    })
                                     
-                                    stats = await self.bot.get_cog("DatabaseOperations").get_player_stats(
-                                        tracked_user.riot_id_game_name,
-                                        game_data['gameMode'],
-                                        champion
+                                    await self.bot.get_cog("DatabaseOperations").update_user(
+                                        tracked_user.username, 
+                                        last_game_played=game_id
                                     )
 
-                                    # Only add to players list and update last_game_played if not announced yet
-                                    if game_id != str(tracked_user.last_game_played):
-                                        games_data[game_id]['players'].append({
-                                            'name': tracked_user.riot_id_game_name,
-                                            'champion': champion,
-                                            'gameMode': game_data['gameMode'],
-                                            'queue_name': games_data[game_id].get('queue_name'),
-                                            'stats': stats[0] if stats else None,
-                                            'guild_id': tracked_user.guild_id,
-                                            'game_id': game_id
-                                        })
-                                        
-                                        await self.bot.get_cog("DatabaseOperations").update_user(
-                                            tracked_user.username, 
-                                            last_game_played=game_id
-                                        )
-                                    processed_users.add(tracked_user.username)
-
                     except Exception as e:
-                        print(f"Error checking if {user.riot_id_game_name} is in a game: {e}")
-                        await self.bot.get_channel(self.bot.botlol_channel_id).send(f"Error checking if {user.riot_id_game_name} is in a game: {e}")
+                        print(f"Error processing live game {game_id}: {e}")
+                        await self.bot.get_channel(self.bot.botlol_channel_id).send(f"Error processing live game {game_id}: {e}")
                 # Clean up messages for games that are no longer active
                 games_to_remove = []
                 for game_id, message_info in self.live_game_messages.items():
@@ -174,146 +488,14 @@ class Loops(commands.Cog):
                     if time.time() - last_seen < 120:  # 2 minutes grace
                         continue
 
-                    # Now treat as finished
-                    try:
-                        channel = await self.bot.fetch_channel(message_info['channel_id'])
-                        message = await channel.fetch_message(message_info['message_id'])
-                        
-                        game_mode_finished = message_info.get('game_mode') # Get game_mode
-                        game_mode_finished_upper = str(game_mode_finished).upper()
-                        # Skip unsupported special modes
-                        if game_mode_finished_upper in {'CHERRY', 'KIWI'}:
-                            print(f"Skipping deletion for {game_mode_finished_upper} game {game_id}")
-                            continue
-                        skip_deletion = False  # Flag to control message deletion
-
-                        # Initial message edit
-                        await message.edit(embed=disnake.Embed(
-                            title="🎮 Game Over - Processing...", # Changed title and description
-                            description="Please wait while we process match data...",
-                            color=disnake.Color.gold()
-                        ))
-                        
-                        update_result = 0 
-                        description_for_next_step = ""
-
-                        if game_mode_finished_upper != 'BRAWL':
-                            # First update database with new match data and wait for it to complete
-                            # This is crucial - we need to await this call to ensure the database is updated
-                            # Pass the current game_id to exclude it from being processed as a new match
-                            match_region = self.bot.get_cog("RiotAPIOperations").ACCOUNT_REGION.upper()
-                            full_game_id = f"{match_region}_{game_id}" if not game_id.startswith(f"{match_region}_") else game_id
-                            update_result = await self.bot.get_cog("RiotAPIOperations").update_database(announce=True, exclude_match_id=full_game_id)
-                            description_for_next_step = f"Database updated with {update_result} new matches. Generating player cards..."
-                        else:
-                            # For BRAWL games, skip database update
-                            description_for_next_step = "Skipped database update for BRAWL game. Generating player cards..."
-                        
-                        # Update the message to show we're now generating cards
-                        await message.edit(embed=disnake.Embed(
-                            title="🎮 Game Over - Generating Stats...",
-                            description=f"{description_for_next_step}\n\nResults will be posted in the thread attached to this message.",
-                            color=disnake.Color.gold()
-                        ))
-                        
-                        # Create or get a thread attached to this live game message and post results there
-                        thread = None
-                        target_channel = channel
-                        try:
-                            if hasattr(message, "thread") and message.thread and not message.thread.archived:
-                                thread = message.thread
-                            else:
-                                thread_name = "Game Over Stats"
-                                thread = await message.create_thread(name=thread_name, auto_archive_duration=1440)
-                            target_channel = thread
-                            # Try to remove the system "started a thread" message
-                            try:
-                                await asyncio.sleep(5)
-                                async for recent_msg in channel.history(limit=20):
-                                    if (
-                                        recent_msg.type == disnake.MessageType.thread_created and (
-                                            (recent_msg.thread and recent_msg.thread.id == thread.id) or
-                                            (thread.name and thread.name in (recent_msg.content or ""))
-                                        )
-                                    ) or (
-                                        (recent_msg.author and self.bot.user and recent_msg.author.id == self.bot.user.id) and
-                                        ("started a thread" in (recent_msg.content or "")) and
-                                        (thread.name and thread.name in (recent_msg.content or ""))
-                                    ):
-                                        try:
-                                            await recent_msg.delete()
-                                        except Exception as de:
-                                            print(f"Could not delete system thread message for game {game_id}: {de}")
-                                        break
-                            except Exception as e:
-                                print(f"Failed to delete system thread message for game {game_id}: {e}")
-                        except Exception as e:
-                            print(f"Error creating or accessing thread for game {game_id}: {e}")
-                        
-                        # Then generate finished game card
-                        try:
-                            # Ensure game_id includes the server prefix (e.g., "EUW1_" + game_id)
-                            # The match ID should be prefixed with the region for the Riot API
-                            match_region = self.bot.get_cog("RiotAPIOperations").ACCOUNT_REGION.upper()
-                            full_game_id = f"{match_region}_{game_id}" if not game_id.startswith(f"{match_region}_") else game_id
-                            
-                            # Get match information from the database
-                            match_info = await self.bot.get_cog("DatabaseOperations").get_match_info(full_game_id)
-                            match_participants = await self.bot.get_cog("DatabaseOperations").get_match_participants(full_game_id)
-                            
-                            if match_info and match_participants:
-                                game_start_date = match_info[3] # Used for timestamp
-
-                                # Common: Prepare participant list (summary embed removed)
-                                tracked_users = await self.bot.get_cog("DatabaseOperations").get_users()
-                                tracked_puuids = {user.puuid for user in tracked_users}
-                                tracked_participants_list = [
-                                    f"{p['riot_id_game_name']} ({p['champion_name']})"
-                                    for p in match_participants if p['puuid'] in tracked_puuids
-                                ]
-
-                                if game_mode_finished_upper == "CUSTOM":
-                                    await message.edit(embed=disnake.Embed(
-                                        title="🎮 Custom Game Over",
-                                        description="Stats generation skipped for custom games.",
-                                        color=disnake.Color.orange()
-                                    ))
-                                    # No summary or cards for CUSTOM games.
-
-                                elif game_mode_finished_upper == "BRAWL":
-                                    await message.edit(embed=disnake.Embed(
-                                        title="🎮 BRAWL Game Over",
-                                        description="Database update and player card generation skipped for BRAWL games.",
-                                        color=disnake.Color.blue() 
-                                    ))
-                                    # No player cards for BRAWL games.
-
-                                else: # Regular game (not CUSTOM, not BRAWL)
-                                    # Generate and send player cards only (no summary embed)
-                                    player_cards = await self.bot.get_cog("CardGenerator").generate_finished_game_card(full_game_id)
-                                    for card_file in player_cards:
-                                        await target_channel.send(file=card_file)
-
-                        except Exception as e:
-                            print(f"Error generating finished game card for game {game_id}: {e}")
-                            error_embed = disnake.Embed(
-                                title="❌ Error Generating Game Stats",
-                                description=f"Could not generate game stats: {str(e)}",
-                                color=disnake.Color.red()
-                            )
-                            try: # Attempt to edit the original message first
-                                await message.edit(embed=error_embed)
-                            except disnake.NotFound: # If message is already deleted, just send to channel
-                                pass 
-                            await target_channel.send(embed=error_embed)
-                        finally:
-                            await message.edit(embed=None)
-                        
-                        # Do not delete the original message; keep it as the parent of the thread with results
-                        # (Previously deleted the message after a short delay.)
-                    except Exception as e:
-                        print(f"Error processing finished game {game_id}: {e}")
-                        await self.bot.get_channel(self.bot.botlol_channel_id).send(f"Error processing finished game {game_id}: {e}")
+                    # Skip unsupported special modes, their results come through the pending matches queue
+                    game_mode_finished_upper = str(message_info.get('game_mode')).upper()
+                    if game_mode_finished_upper in {'CHERRY', 'KIWI'}:
+                        print(f"Skipping deletion for {game_mode_finished_upper} game {game_id}")
+                        continue
+
+                    # Now treat as finished, off the sweep since it may wait for match-v5
+                    self.bot.loop.create_task(self.finish_live_game(game_id, message_info))
                     games_to_remove.append(game_id)
                 
                 for game_id in games_to_remove:
@@ -387,146 +569,184 @@ class Loops(commands.Cog):
             except Exception as e:
                 print(f"Error in check_if_in_game loop: {e}")
                 await self.bot.get_channel(self.bot.botlol_channel_id).send(f"Error in check_if_in_game loop: {e}")
-            await asyncio.sleep(60)
+            # Sweeps start every LIVE_GAME_POLL_SECONDS however long the last one took
+            elapsed = time.monotonic() - sweep_started
+            if elapsed > LIVE_GAME_POLL_SECONDS:
+                print(f"⚠️ Live game sweep took {elapsed:.1f}s, longer than the {LIVE_GAME_POLL_SECONDS}s poll interval")
+            await asyncio.sleep(max(0, LIVE_GAME_POLL_SECONDS - elapsed))
 
-    async def process_pending_matches(self):
-        """Periodically process pending special-mode matches that failed to fetch initially"""
+    async def update_database_periodically(self):
+        """Catch up on matches played outside of announced live games, e.g. untracked queues or downtime."""
         await self.bot.wait_until_ready()
-        max_attempts = 20
-        
         while not self.bot.is_closed():
+            # First sweep right at startup, for the matches played while the bot was down
             try:
-                # Clean up old pending matches (older than 7 days)
-                await self.bot.get_cog("DatabaseOperations").cleanup_old_pending_matches(1)
-                
-                # Get all pending matches
-                pending_matches = await self.bot.get_cog("DatabaseOperations").get_pending_matches(if_older_than=10)
-                
-                for match_data in pending_matches:
-                    match_id, game_mode, channel_id, message_id, attempts, created_at, last_attempt = match_data
-                    game_mode_upper = str(game_mode).upper()
-                    print(f"Processing pending match {match_id} (attempt {attempts + 1}) with message ID {message_id} in channel {channel_id}")
-                    
-                    try:
-                        # Try to fetch the match data from the API again
-                        match_data = await self.bot.get_cog("RiotAPIOperations").get_match_data(match_id)
-                        
-                        if match_data:
-                            # Match data was successfully fetched and stored in database
-                            # Now get the processed data from database
-                            match_info = await self.bot.get_cog("DatabaseOperations").get_match_info(match_id)
-                            match_participants = await self.bot.get_cog("DatabaseOperations").get_match_participants(match_id)
-                        
-                        if match_data and match_info and match_participants:
-                            # Match data is now available, process it
+                await self.bot.get_cog("RiotAPIOperations").update_database(announce=False)
+            except Exception as e:
+                print(f"Error in update_database_periodically: {e}")
+            await asyncio.sleep(BACKGROUND_UPDATE_SECONDS)
+
+    async def job_worker(self):
+        """One of JOB_WORKERS workers of the durable job queue: claims a due job, runs it, and
+        otherwise sleeps until the next job is due or a new one is enqueued."""
+        await self.bot.wait_until_ready()
+        db_ops = self.bot.get_cog("DatabaseOperations")
+        while not self.bot.is_closed():
+            try:
+                db_ops.job_enqueued.clear()
+                jobs = await db_ops.claim_jobs(1, JOB_LEASE_SECONDS)
+                if jobs:
+                    await self.run_job(jobs[0])
+                    continue
+                next_run_at = await db_ops.get_next_job_time()
+                timeout = JOB_IDLE_POLL_SECONDS if next_run_at is None else min(JOB_IDLE_POLL_SECONDS, max(0.1, next_run_at - time.time()))
+                try:
+                    await asyncio.wait_for(db_ops.job_enqueued.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except Exception as e:
+                print(f"Error in job_worker loop: {e}")
+                await asyncio.sleep(30)
+
+    async def run_job(self, job):
+        """Run a claimed job: remove it when done, otherwise retry it with exponential backoff and jitter."""
+        db_ops = self.bot.get_cog("DatabaseOperations")
+        error = None
+        try:
+            handler = self.job_handlers.get(job.job_type)
+            if handler is None:
+                raise ValueError(f"No handler for job type {job.job_type}")
+            done = await handler(job)
+        except Exception as e:
+            print(f"Error running {job.job_type} job {job.job_key}: {e}")
+            done, error = False, str(e)
+
+        if done:
+            await db_ops.complete_job(job)
+        elif job.attempts >= job.max_attempts:
+            print(f"Giving up on {job.job_type} job {job.job_key} after {job.attempts} attempts")
+            on_failure = self.job_failure_handlers.get(job.job_type)
+            if on_failure:
+                try:
+                    await on_failure(job)
+                except Exception as e:
+                    print(f"Error handling failed {job.job_type} job {job.job_key}: {e}")
+            await db_ops.complete_job(job)
+        else:
+            delay = min(JOB_BACKOFF_MAX_SECONDS, JOB_BACKOFF_BASE_SECONDS * 2 ** (job.attempts - 1))
+            delay = delay / 2 + random.uniform(0, delay / 2)  # Jitter, so retries queued together don't stay together
+            await db_ops.retry_job(job, delay, error)
+
+    async def run_pending_match_job(self, job) -> bool:
+        """Job handler: post the cards of a pending special-mode match. False while match-v5 doesn't have it yet."""
+        match_id = job.job_key
+        game_mode_upper = str(job.payload['game_mode']).upper()
+        channel_id = job.payload['channel_id']
+        message_id = job.payload['message_id']
+        print(f"Processing pending match {match_id} (attempt {job.attempts}) with message ID {message_id} in channel {channel_id}")
+
+        # Try to fetch the match data from the API again
+        match_data = await self.bot.get_cog("RiotAPIOperations").get_match_data(match_id)
+        if not match_data:
+            print(f"Match {match_id} still not available, attempt {job.attempts}")
+            return False
+        # Match data was successfully fetched and stored in database
+        # Now get the processed data from database
+        match_info = await self.bot.get_cog("DatabaseOperations").get_match_info(match_id)
+        match_participants = await self.bot.get_cog("DatabaseOperations").get_match_participants(match_id)
+        if not (match_info and match_participants):
+            print(f"Match {match_id} still not available, attempt {job.attempts}")
+            return False
+
+        # Match data is now available, process it
+        try:
+            channel = await self.bot.fetch_channel(channel_id)
+            message = await channel.fetch_message(message_id)
+            
+            # Create or get a thread for posting results
+            thread = None
+            target_channel = channel
+            try:
+                if hasattr(message, "thread") and message.thread and not message.thread.archived:
+                    thread = message.thread
+                else:
+                    thread_name = "Game Over Stats"
+                    thread = await message.create_thread(name=thread_name, auto_archive_duration=1440)
+                target_channel = thread
+                # Try to remove the system "started a thread" message
+                try:
+                    await asyncio.sleep(5)
+                    async for recent_msg in channel.history(limit=20):
+                        if (
+                            recent_msg.type == disnake.MessageType.thread_created and (
+                                (recent_msg.thread and recent_msg.thread.id == thread.id) or
+                                (thread.name and thread.name in (recent_msg.content or ""))
+                            )
+                        ) or (
+                            (recent_msg.author and self.bot.user and recent_msg.author.id == self.bot.user.id) and
+                            ("started a thread" in (recent_msg.content or "")) and
+                            (thread.name and thread.name in (recent_msg.content or ""))
+                        ):
                             try:
-                                channel = await self.bot.fetch_channel(channel_id)
-                                message = await channel.fetch_message(message_id)
-                                
-                                # Create or get a thread for posting results
-                                thread = None
-                                target_channel = channel
-                                try:
-                                    if hasattr(message, "thread") and message.thread and not message.thread.archived:
-                                        thread = message.thread
-                                    else:
-                                        thread_name = "Game Over Stats"
-                                        thread = await message.create_thread(name=thread_name, auto_archive_duration=1440)
-                                    target_channel = thread
-                                    # Try to remove the system "started a thread" message
-                                    try:
-                                        await asyncio.sleep(5)
-                                        async for recent_msg in channel.history(limit=20):
-                                            if (
-                                                recent_msg.type == disnake.MessageType.thread_created and (
-                                                    (recent_msg.thread and recent_msg.thread.id == thread.id) or
-                                                    (thread.name and thread.name in (recent_msg.content or ""))
-                                                )
-                                            ) or (
-                                                (recent_msg.author and self.bot.user and recent_msg.author.id == self.bot.user.id) and
-                                                ("started a thread" in (recent_msg.content or "")) and
-                                                (thread.name and thread.name in (recent_msg.content or ""))
-                                            ):
-                                                try:
-                                                    await recent_msg.delete()
-                                                except Exception as de:
-                                                    print(f"Could not delete system thread message for match {match_id}: {de}")
-                                                break
-                                    except Exception as e:
-                                        print(f"Failed to delete system thread message for match {match_id}: {e}")
-                                except Exception as e:
-                                    print(f"Error creating or accessing thread for match {match_id}: {e}")
-                                
-                                # Generate player cards
-                                player_cards = await self.bot.get_cog("CardGenerator").generate_finished_game_card(match_id)
-                                
-                                # Update the queued message to no longer include summary; just post the cards in the thread
-                                for card_file in player_cards:
-                                    await target_channel.send(file=card_file)
-                                
-                                # Remove from pending queue
-                                await self.bot.get_cog("DatabaseOperations").remove_pending_match(match_id)
-                                
-                                print(f"Successfully processed pending {game_mode_upper} match: {match_id}")
-                                
-                            except disnake.NotFound:
-                                # Message or channel was deleted, remove from queue
-                                await self.bot.get_cog("DatabaseOperations").remove_pending_match(match_id)
-                                print(f"Message/channel not found for pending match {match_id}, removed from queue")
-                                
-                        else:
-                            # Match data still not available, update attempt counter
-                            await self.bot.get_cog("DatabaseOperations").update_pending_match_attempt(match_id)
-                            print(f"Match {match_id} still not available, attempt {attempts + 1}")
-                            
-                            # If we've tried too many times, remove from queue and notify
-                            if attempts >= max_attempts:
-                                try:
-                                    channel = await self.bot.fetch_channel(channel_id)
-                                    message = await channel.fetch_message(message_id)
-                                    
-                                    # Validate that this is actually a queued special-mode message
-                                    is_valid_queued_message = (
-                                        message.embeds and 
-                                        len(message.embeds) > 0 and 
-                                        message.embeds[0].title and
-                                        (f"{game_mode_upper} Match Queued" in message.embeds[0].title or 
-                                         f"{game_mode_upper} Match Found" in message.embeds[0].title)
-                                    )
-                                    
-                                    if is_valid_queued_message:
-                                        failure_embed = disnake.Embed(
-                                            title=f"❌ {game_mode_upper} Match Processing Failed",
-                                            description=f"Match {match_id} could not be processed after multiple attempts.\nThis may be due to API limitations or the match being unavailable.",
-                                            color=disnake.Color.red()
-                                        )
-                                        await message.edit(embed=failure_embed)
-                                        
-                                        # Delete message after a delay
-                                        await asyncio.sleep(10)
-                                        await message.delete()
-                                        print(f"Deleted failed {game_mode_upper} match message for {match_id}")
-                                    else:
-                                        print(f"Warning: Message {message_id} for failed match {match_id} doesn't appear to be a {game_mode_upper} queued message. Skipping deletion.")
-                                    
-                                except disnake.NotFound:
-                                    print(f"Message for failed match {match_id} was already deleted")
-                                except Exception as e:
-                                    print(f"Error handling failed match message for {match_id}: {e}")
-                                
-                                await self.bot.get_cog("DatabaseOperations").remove_pending_match(match_id)
-                                print(f"Removed pending match {match_id} after {attempts + 1} failed attempts")
-                    
-                    except Exception as e:
-                        print(f"Error processing pending match {match_id}: {e}")
-                        # Don't remove from queue on error, let it retry
-                        await self.bot.get_cog("DatabaseOperations").update_pending_match_attempt(match_id)
-                        
+                                await recent_msg.delete()
+                            except Exception as de:
+                                print(f"Could not delete system thread message for match {match_id}: {de}")
+                            break
+                except Exception as e:
+                    print(f"Failed to delete system thread message for match {match_id}: {e}")
             except Exception as e:
-                print(f"Error in process_pending_matches loop: {e}")
-                
-            # Check every 2 minutes
-            await asyncio.sleep(120)
+                print(f"Error creating or accessing thread for match {match_id}: {e}")
+
+            # Generate player cards and post each in the thread as soon as it is rendered
+            async for card_file in self.bot.get_cog("CardGenerator").iter_finished_game_cards(match_id):
+                await target_channel.send(file=card_file)
+            await message.edit(embed=None)  # Drop the "Match Queued" embed
+            
+            print(f"Successfully processed pending {game_mode_upper} match: {match_id}")
+            
+        except disnake.NotFound:
+            # Message or channel was deleted, nothing left to post to
+            print(f"Message/channel not found for pending match {match_id}, removed from queue")
+        return True
+
+    async def fail_pending_match_job(self, job):
+        """Failure handler: tell the channel a pending special-mode match could not be processed."""
+        match_id = job.job_key
+        game_mode_upper = str(job.payload['game_mode']).upper()
+        channel_id = job.payload['channel_id']
+        message_id = job.payload['message_id']
+        try:
+            channel = await self.bot.fetch_channel(channel_id)
+            message = await channel.fetch_message(message_id)
+
+            # Validate that this is actually a queued special-mode message
+            is_valid_queued_message = (
+                message.embeds and 
+                len(message.embeds) > 0 and 
+                message.embeds[0].title and
+                (f"{game_mode_upper} Match Queued" in message.embeds[0].title or 
+                 f"{game_mode_upper} Match Found" in message.embeds[0].title)
+            )
+
+            if is_valid_queued_message:
+                failure_embed = disnake.Embed(
+                    title=f"❌ {game_mode_upper} Match Processing Failed",
+                    description=f"Match {match_id} could not be processed after multiple attempts.\nThis may be due to API limitations or the match being unavailable.",
+                    color=disnake.Color.red()
+                )
+                await message.edit(embed=failure_embed)
+
+                # Delete message after a delay
+                await asyncio.sleep(10)
+                await message.delete()
+                print(f"Deleted failed {game_mode_upper} match message for {match_id}")
+            else:
+                print(f"Warning: Message {message_id} for failed match {match_id} doesn't appear to be a {game_mode_upper} queued message. Skipping deletion.")
+
+        except disnake.NotFound:
+            print(f"Message for failed match {match_id} was already deleted")
+        except Exception as e:
+            print(f"Error handling failed match message for {match_id}: {e}")
 
 def setup(bot):
     bot.add_cog(Loops(bot))
@@ -7,8 +7,28 @@ import disnake
 import os
 from dotenv import load_dotenv
 from pathlib import Path
+from urllib.parse import urlparse
 from typing import List, Optional, Dict, Any, Tuple
 from ..models.models import User, Match, Participant
+from ..Utils import ASSET_MANIFEST_FILE, build_asset_manifest
+
+# Connection pool settings for the shared aiohttp session
+HTTP_POOL_SIZE = 100  # Total simultaneous connections across all hosts
+HTTP_POOL_PER_HOST = 20  # Simultaneous connections to a single host (e.g. europe.api.riotgames.com)
+HTTP_KEEPALIVE_SECONDS = 75  # Keep idle connections open between bursts of requests
+HTTP_DNS_CACHE_SECONDS = 300
+
+# update_database pipeline settings
+MATCH_DISCOVERY_CONCURRENCY = 4  # Users whose match id lists are paged at the same time
+MATCH_FETCH_CONCURRENCY = 8  # Match payload requests in flight, the rate limiter still has the final say
+MATCH_WRITE_QUEUE_SIZE = 50  # Fetched payloads waiting for the writer before fetchers pause
+MATCH_WRITE_BATCH_SIZE = 25  # Most matches the writer stores in one transaction
+MATCH_WATERMARK_OVERLAP_SECONDS = 2 * 60 * 60  # How far before a user's watermark discovery looks again
+
+# ingest_finished_match retry settings, match-v5 usually publishes a match a minute or two after it ends
+FINISHED_MATCH_RETRY_SECONDS = 20  # First wait after the match isn't available, doubles on every retry
+FINISHED_MATCH_MAX_RETRY_SECONDS = 120
+FINISHED_MATCH_MAX_WAIT_SECONDS = 10 * 60  # Give up after this long, the caller queues it as pending
 
 class RiotAPIOperations(commands.Cog):
     def __init__(self, bot, account_region="euw1", match_region="europe"):
@@ -20,112 +40,304 @@ class RiotAPIOperations(commands.Cog):
         self.MATCH_REGION = match_region
         self.rate_limiter = self.RateLimiter()
         self.bot = bot
+        # Long-lived pooled HTTP session, opened on cog load and closed on unload
+        self.session: Optional[aiohttp.ClientSession] = None
         # Lazy-loaded CommunityDragon Arena (Cherry) augment id -> icon base mapping
         self.arena_augments_map: Optional[Dict[int, str]] = None
         # Lazy-loaded CommunityDragon queues map id -> queue entry
         self.queues_map: Optional[Dict[int, Dict[str, Any]]] = None
+        # Matches fetched/in flight during the running update cycle, None outside of a cycle
+        self.match_registry: Optional[RiotAPIOperations.MatchFetchRegistry] = None
+
+    async def cog_load(self):
+        """Open the shared HTTP session as soon as the cog is loaded."""
+        self.get_session()
+
+    def cog_unload(self):
+        """Close the shared HTTP session when the cog is unloaded or reloaded."""
+        if self.session and not self.session.closed:
+            self.bot.loop.create_task(self.session.close())
+        self.session = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """Return the cog's pooled session, creating it if it is missing or was closed.
+
+        Every Riot, Data Dragon and CommunityDragon call goes through this session so
+        TCP/TLS connections are kept alive and reused instead of re-negotiated per request.
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_SIZE,
+                limit_per_host=HTTP_POOL_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+                ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+                enable_cleanup_closed=True
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=60, connect=10)
+            )
+        return self.session
 
     class RateLimiter:
+        """Riot rate limiter driven by the rate-limit headers on each response.
+
+        Riot enforces an application limit per routing value (europe, euw1, ...) and a
+        separate limit per API method, and reports both on every response through
+        X-App-Rate-Limit / X-Method-Rate-Limit and their -Count counterparts. We start
+        from the dev-key budget and switch to the advertised limits as soon as Riot
+        reports them, so a production key is not throttled to dev-key speed.
+
+        Buckets are keyed by (region, endpoint family), e.g. ("europe", "match-v5").
+        Requests for the same bucket wait on a FIFO lock so they are released in
+        arrival order instead of every caller sleeping and racing on its own.
+        """
+        DEFAULT_APP_LIMITS = [(20, 1), (100, 120)]  # Dev key budget until Riot tells us otherwise
+        SAFETY_MARGIN = 1  # Requests kept in reserve in every window
+        BUFFER_TIME = 0.05  # 50ms buffer after a window frees up
+
         def __init__(self):
-            self.short_window = deque(maxlen=20)  # 20 requests per 1s
-            self.long_window = deque(maxlen=100)  # 100 requests per 2min
-            self.method_cooldowns = {}  # Track per-method rate limits
-            
+            self.app_limits: Dict[str, List[Tuple[int, int]]] = {}  # region -> [(limit, window_seconds)]
+            self.method_limits: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}  # (region, family) -> [(limit, window_seconds)]
+            self.windows: Dict[Tuple[Any, ...], deque] = {}  # (scope, ..., window_seconds) -> request timestamps
+            self.app_cooldowns: Dict[str, float] = {}  # region -> blocked until (application 429)
+            self.method_cooldowns: Dict[Tuple[str, str], float] = {}  # (region, family) -> blocked until (method/service 429)
+            self.queues: Dict[Tuple[str, str], asyncio.Lock] = {}  # (region, family) -> FIFO of waiting requests
+
+        @staticmethod
+        def get_bucket(url: str) -> Optional[Tuple[str, str]]:
+            """Return (region, endpoint family) for a Riot API url, or None for other hosts.
+
+            /lol/match/v5/... -> match-v5, /lol/spectator/v5/... -> spectator-v5,
+            /riot/account/v1/... -> account-v1
+            """
+            parsed = urlparse(url)
+            host = parsed.hostname or ""
+            if not host.endswith(".api.riotgames.com"):
+                return None
+            region = host.split(".")[0]
+            parts = [part for part in parsed.path.split("/") if part]
+            family = f"{parts[1]}-{parts[2]}" if len(parts) >= 3 else parsed.path
+            return region, family
+
+        @staticmethod
+        def parse_limits(header_value: Optional[str]) -> List[Tuple[int, int]]:
+            """Parse a Riot limit header such as '20:1,100:120' into [(20, 1), (100, 120)]."""
+            limits = []
+            if not header_value:
+                return limits
+            for pair in header_value.split(","):
+                try:
+                    amount, seconds = pair.split(":")
+                    limits.append((int(amount), int(seconds)))
+                except ValueError:
+                    continue
+            return limits
+
+        def _window(self, key: Tuple[Any, ...], seconds: int, now: float) -> deque:
+            """Return the timestamp window for a bucket, dropping requests older than the window."""
+            window = self.windows.setdefault(key + (seconds,), deque())
+            while window and now - window[0] >= seconds:
+                window.popleft()
+            return window
+
+        def _wait_time(self, key: Tuple[Any, ...], limits: List[Tuple[int, int]], now: float) -> float:
+            """Seconds until one more request fits in every window of a bucket."""
+            wait = 0.0
+            for limit, seconds in limits:
+                window = self._window(key, seconds, now)
+                allowed = max(1, limit - self.SAFETY_MARGIN)
+                if len(window) >= allowed:
+                    # The request at this index has to leave the window before we fit
+                    oldest_blocking = window[len(window) - allowed]
+                    wait = max(wait, seconds - (now - oldest_blocking) + self.BUFFER_TIME)
+            return wait
+
+        def _sync_counts(self, key: Tuple[Any, ...], counts: List[Tuple[int, int]], now: float) -> None:
+            """Raise our local window counts to what Riot reports (e.g. after a restart or from another process)."""
+            for count, seconds in counts:
+                window = self._window(key, seconds, now)
+                missing = count - len(window)
+                if missing > 0:
+                    window.extend([now] * missing)
+
         async def wait_if_needed(self, url = None, params = None):
-            current_time = time.time()
-            
-            # Add additional buffer to prevent hitting limits
-            buffer_time = 0.05  # 50ms buffer
-            
-            # Clean up old requests from windows
-            while self.short_window and current_time - self.short_window[0] > 1:
-                self.short_window.popleft()
-            while self.long_window and current_time - self.long_window[0] > 120:
-                self.long_window.popleft()
-            
-            # Wait if necessary
-            if len(self.short_window) >= 19:  # Leave room for buffer
-                sleep_time = 1 - (current_time - self.short_window[0]) + buffer_time
-                if sleep_time > 0:
-                    await asyncio.sleep(sleep_time)
-                    
-            if len(self.long_window) >= 99:  # Leave room for buffer
-                sleep_time = 120 - (current_time - self.long_window[0]) + buffer_time
-                if sleep_time > 0:
-                    print(f"Sleeping long for {sleep_time} seconds for {url} {params}")
+            bucket = self.get_bucket(url) if url else None
+            if bucket is None:
+                return
+            region, family = bucket
+            app_key = ("app", region)
+            method_key = ("method", region, family)
+
+            async with self.queues.setdefault(bucket, asyncio.Lock()):
+                while True:
+                    now = time.time()
+                    app_limits = self.app_limits.get(region, self.DEFAULT_APP_LIMITS)
+                    method_limits = self.method_limits.get(bucket, [])
+                    sleep_time = max(
+                        self.app_cooldowns.get(region, 0) - now,
+                        self.method_cooldowns.get(bucket, 0) - now,
+                        self._wait_time(app_key, app_limits, now),
+                        self._wait_time(method_key, method_limits, now)
+                    )
+                    if sleep_time <= 0:
+                        break
+                    if sleep_time > 10:
+                        print(f"Sleeping long for {sleep_time:.1f} seconds for {url} {params}")
                     await asyncio.sleep(sleep_time)
-            
-            # Add current request timestamp
-            current_time = time.time()
-            self.short_window.append(current_time)
-            self.long_window.append(current_time)
+
+                # Record the request in every window it counts against
+                now = time.time()
+                for _, seconds in app_limits:
+                    self._window(app_key, seconds, now).append(now)
+                for _, seconds in method_limits:
+                    self._window(method_key, seconds, now).append(now)
+
+        def update_from_headers(self, url: str, headers) -> None:
+            """Learn app/method limits and current usage from a Riot response."""
+            bucket = self.get_bucket(url)
+            if bucket is None:
+                return
+            region, family = bucket
+            now = time.time()
+
+            app_limits = self.parse_limits(headers.get("X-App-Rate-Limit"))
+            if app_limits:
+                if app_limits != self.app_limits.get(region):
+                    print(f"Learned app rate limits for {region}: {app_limits}")
+                self.app_limits[region] = app_limits
+                self._sync_counts(("app", region), self.parse_limits(headers.get("X-App-Rate-Limit-Count")), now)
+
+            method_limits = self.parse_limits(headers.get("X-Method-Rate-Limit"))
+            if method_limits:
+                if method_limits != self.method_limits.get(bucket):
+                    print(f"Learned method rate limits for {region} {family}: {method_limits}")
+                self.method_limits[bucket] = method_limits
+                self._sync_counts(("method", region, family), self.parse_limits(headers.get("X-Method-Rate-Limit-Count")), now)
+
+        async def on_rate_limited(self, url: str, headers) -> float:
+            """Handle a 429: block the offending bucket until Retry-After has passed.
+
+            Riot buckets are blocked so every queued request waits in wait_if_needed;
+            for any other host we simply sleep here.
+            """
+            try:
+                retry_after = float(headers.get("Retry-After", 5))
+            except (TypeError, ValueError):
+                retry_after = 5.0
+            bucket = self.get_bucket(url)
+            if bucket is None:
+                await asyncio.sleep(retry_after)
+                return retry_after
+
+            region, _ = bucket
+            blocked_until = time.time() + retry_after
+            if headers.get("X-Rate-Limit-Type") == "application":
+                self.app_cooldowns[region] = blocked_until
+            else:
+                # method and service limits only affect this endpoint family
+                self.method_cooldowns[bucket] = blocked_until
+            return retry_after
+
+    class MatchFetchRegistry:
+        """Matches fetched or in flight during one update_database cycle.
+
+        A game played by five tracked friends shows up in five match id lists; the
+        registry makes sure it is downloaded and written once. The first caller claims
+        the match and fetches it, later callers either wait for that fetch or skip it
+        if it is already stored.
+        """
+        def __init__(self):
+            self.in_flight: Dict[str, asyncio.Future] = {}  # match_id -> resolves to the payload (None on failure)
+            self.completed: set = set()  # match ids stored during this cycle
+            self.duplicates_saved = 0
+
+        def claim(self, match_id: str) -> Tuple[bool, Optional[asyncio.Future]]:
+            """Returns (True, None) if the caller should fetch the match, otherwise (False, future to await or None if already stored)."""
+            if match_id in self.completed:
+                self.duplicates_saved += 1
+                return False, None
+            future = self.in_flight.get(match_id)
+            if future is not None:
+                self.duplicates_saved += 1
+                return False, future
+            self.in_flight[match_id] = asyncio.get_running_loop().create_future()
+            return True, None
+
+        def resolve(self, match_id: str, stored: bool, match_data: Optional[Dict[str, Any]] = None) -> None:
+            """Mark a claimed match as done and wake up anyone waiting on it. Failed matches can be claimed again."""
+            if stored:
+                self.completed.add(match_id)
+            future = self.in_flight.pop(match_id, None)
+            if future is not None and not future.done():
+                future.set_result(match_data if stored else None)
 
     async def make_request(self, url: str, params: Optional[Dict[str, Any]] = None, max_retries: int = 3) -> Optional[Dict[str, Any]]:
         """Helper function to make rate-limited requests with retry logic"""
         headers = {"X-Riot-Token": self.API_KEY}
-        
-        async with aiohttp.ClientSession() as session:
-            for attempt in range(max_retries):
-                try:
-                    await self.rate_limiter.wait_if_needed(url, params)
-                    
-                    async with session.get(url, headers=headers, params=params) as response:
-                        if response.status == 200:
-                            return await response.json()
-                        elif response.status == 429:
-                            # Get retry-after header, default to 5 seconds if not present
-                            retry_after = int(response.headers.get('Retry-After', 5))
-                            print(f"Rate limited. Waiting {retry_after} seconds before retry...")
-                            await asyncio.sleep(retry_after)
-                            continue
-                        elif response.status == 403:
-                            print(f"Service unavailable. Attempt {attempt + 1}/{max_retries}")
-                            #print url and params
-                            print(f"URL: {url}")
-                            print(f"Params: {params}")
-                            await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                            continue
-                        elif response.status == 404:
-                            return None
-                        elif response.status == 0:
-                            print(f"Connection error. Attempt {attempt + 1}/{max_retries}")
-                            await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                            continue
-                        elif response.status == 502:
-                            print(f"Bad Gateway. Attempt {attempt + 1}/{max_retries}")
-                            #print url and params
-                            print(f"URL: {url}")
-                            print(f"Params: {params}")
-                            await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                            continue
-                        elif response.status == 503:
-                            print(f"Service unavailable. Attempt {attempt + 1}/{max_retries}")
-                            await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                            continue
-                        elif response.status == 504:
-                            print(f"Timeout. Attempt {attempt + 1}/{max_retries}")
-                            await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                            continue
-                        elif response.status == 500:
-                            print(f"Internal server error. Attempt {attempt + 1}/{max_retries}")
-                            await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                            continue
-                        else:
-                            response.raise_for_status()
-                except aiohttp.ClientConnectorError as e:
-                    print(f"Connection error on attempt {attempt + 1}/{max_retries}: {str(e)}")
-                    if attempt < max_retries - 1:
+        session = self.get_session()
+
+        for attempt in range(max_retries):
+            try:
+                await self.rate_limiter.wait_if_needed(url, params)
+                
+                async with session.get(url, headers=headers, params=params) as response:
+                    self.rate_limiter.update_from_headers(url, response.headers)
+                    if response.status == 200:
+                        return await response.json()
+                    elif response.status == 429:
+                        # Retry-After (default 5s) is enforced by the rate limiter on the next attempt
+                        retry_after = await self.rate_limiter.on_rate_limited(url, response.headers)
+                        print(f"Rate limited ({response.headers.get('X-Rate-Limit-Type', 'unknown')}). Waiting {retry_after} seconds before retry...")
+                        continue
+                    elif response.status == 403:
+                        print(f"Service unavailable. Attempt {attempt + 1}/{max_retries}")
+                        #print url and params
+                        print(f"URL: {url}")
+                        print(f"Params: {params}")
                         await asyncio.sleep(2 ** attempt)  # Exponential backoff
                         continue
-                    return None
-                except Exception as e:
-                    print(f"Unexpected error on attempt {attempt + 1}/{max_retries}: {str(e)}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(2 ** attempt)
+                    elif response.status == 404:
+                        return None
+                    elif response.status == 0:
+                        print(f"Connection error. Attempt {attempt + 1}/{max_retries}")
+                        await asyncio.sleep(2 ** attempt)  # Exponential backoff
                         continue
-                    raise
-            
-            return None
+                    elif response.status == 502:
+                        print(f"Bad Gateway. Attempt {attempt + 1}/{max_retries}")
+                        #print url and params
+                        print(f"URL: {url}")
+                        print(f"Params: {params}")
+                        await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                        continue
+                    elif response.status == 503:
+                        print(f"Service unavailable. Attempt {attempt + 1}/{max_retries}")
+                        await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                        continue
+                    elif response.status == 504:
+                        print(f"Timeout. Attempt {attempt + 1}/{max_retries}")
+                        await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                        continue
+                    elif response.status == 500:
+                        print(f"Internal server error. Attempt {attempt + 1}/{max_retries}")
+                        await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                        continue
+                    else:
+                        response.raise_for_status()
+            except aiohttp.ClientConnectorError as e:
+                print(f"Connection error on attempt {attempt + 1}/{max_retries}: {str(e)}")
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                    continue
+                return None
+            except Exception as e:
+                print(f"Unexpected error on attempt {attempt + 1}/{max_retries}: {str(e)}")
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                raise
+        
+        return None
 
     async def ensure_arena_augments_map(self) -> None:
         """Ensure CommunityDragon Arena augment mapping is loaded into memory.
@@ -140,12 +352,11 @@ class RiotAPIOperations(commands.Cog):
         url = "https://raw.communitydragon.org/latest/cdragon/arena/en_us.json"
         mapping: Dict[int, str] = {}
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=10) as resp:
-                    if resp.status != 200:
-                        self.arena_augments_map = {}
-                        return
-                    data = await resp.json()
+            async with self.get_session().get(url, timeout=10) as resp:
+                if resp.status != 200:
+                    self.arena_augments_map = {}
+                    return
+                data = await resp.json()
         except Exception as e:
             print(f"Failed to fetch Arena augments mapping from CDragon: {e}")
             self.arena_augments_map = {}
@@ -192,12 +403,11 @@ class RiotAPIOperations(commands.Cog):
         url = "https://raw.communitydragon.org/latest/plugins/rcp-be-lol-game-data/global/default/v1/queues.json"
         mapping: Dict[int, Dict[str, Any]] = {}
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=10) as resp:
-                    if resp.status != 200:
-                        self.queues_map = {}
-                        return
-                    data = await resp.json()
+            async with self.get_session().get(url, timeout=10) as resp:
+                if resp.status != 200:
+                    self.queues_map = {}
+                    return
+                data = await resp.json()
         except Exception as e:
             print(f"Failed to fetch queues mapping from CDragon: {e}")
             self.queues_map = {}
@@ -243,45 +453,79 @@ class RiotAPIOperations(commands.Cog):
     
     async def get_match_ids(self, puuid: str, deep_fetch: bool = False, exclude_match_id: str = None) -> List[str]:
         """
-        Get match IDs for a player.
+        Get match IDs for a player that are not stored yet.
         Args:
             puuid: Player's PUUID
-            deep_fetch: Parameter kept for backwards compatibility but no longer used
+            deep_fetch: Deep resync, page through the last 1000 matches instead of starting at the
+                user's watermark. Use it to repair gaps (e.g. matches that failed to fetch).
+            exclude_match_id: Match ID to leave out of the result
         """
-        stored_matches = await self.bot.get_cog("DatabaseOperations").get_stored_match_ids(puuid)
-        all_match_ids = []
+        db_ops = self.bot.get_cog("DatabaseOperations")
+        url = f"https://{self.MATCH_REGION}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids"
+        watermark = None if deep_fetch else await db_ops.get_user_watermark(puuid)
         new_match_ids = []
         start = 0
         chunk_size = 100  # Maximum allowed by the API
         max_matches = 1000  # Maximum number of matches to fetch
-        
+
         while start < max_matches:
-            url = f"https://{self.MATCH_REGION}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids"
             params = {
                 "start": start,
                 "count": chunk_size
             }
-            
-            match_ids = await self.make_request(url, params=params)            
+            if watermark:
+                # Only matches since the last stored one, with a small overlap so a match
+                # that finished while an older one was still being stored isn't skipped
+                params["startTime"] = max(0, watermark // 1000 - MATCH_WATERMARK_OVERLAP_SECONDS)
+
+            match_ids = await self.make_request(url, params=params)
             # If no more matches are returned, break the loop
             if not match_ids:
                 break
-                
-            all_match_ids.extend(match_ids)
+
+            stored_matches = await db_ops.get_existing_match_ids(match_ids)
             # Track new matches that aren't in the database and aren't the excluded match
             new_matches = [m_id for m_id in match_ids if m_id not in stored_matches and (exclude_match_id is None or m_id != exclude_match_id)]
             new_match_ids.extend(new_matches)
-                        
-            if len(new_match_ids) == 0:
-                return new_match_ids
-            
+
+            # Without a watermark stop at the first page that is fully stored, unless resyncing
+            if not watermark and not deep_fetch and len(new_matches) == 0:
+                break
+            if len(match_ids) < chunk_size:
+                break
+
             start += chunk_size
-        
+
         return new_match_ids
 
-    async def get_match_data(self, match_id: str) -> Optional[Dict[str, Any]]:
+    async def fetch_match_data(self, match_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a match payload from the Riot API without storing it."""
         url = f"https://{self.MATCH_REGION}.api.riotgames.com/lol/match/v5/matches/{match_id}"
-        match_data = await self.make_request(url)
+        return await self.make_request(url)
+
+    async def get_match_data(self, match_id: str) -> Optional[Dict[str, Any]]:
+        registry = self.match_registry
+        if registry is not None:
+            # An update cycle is running, don't download a match it already has
+            owner, future = registry.claim(match_id)
+            if not owner:
+                if future is not None:
+                    return await asyncio.shield(future)
+                # Already stored during this update cycle, return the payload archived with it
+                print(f"Match {match_id} was already stored during this update cycle")
+                return await self.bot.get_cog("DatabaseOperations").get_match_payload(match_id)
+            stored = False
+            match_data = None
+            try:
+                match_data = await self.fetch_match_data(match_id)
+                if match_data:
+                    await self.bot.get_cog("DatabaseOperations").insert_match(match_data)
+                    stored = True
+            finally:
+                registry.resolve(match_id, stored, match_data)
+            return match_data if stored else None
+
+        match_data = await self.fetch_match_data(match_id)
         if match_data:
             # Convert match data to Match model
             match = Match(
@@ -299,16 +543,62 @@ class RiotAPIOperations(commands.Cog):
             return match_data
         return None
     
-    async def update_database(self, inter: disnake.ApplicationCommandInteraction = None, announce: bool = False, exclude_match_id: str = None) -> int:
+    async def ingest_finished_match(self, match_id: str) -> bool:
+        """
+        Fetch and store one match that just ended, retrying with backoff until match-v5 has it.
+        Returns False if it still isn't available after FINISHED_MATCH_MAX_WAIT_SECONDS.
+        """
+        if match_id in await self.bot.get_cog("DatabaseOperations").get_existing_match_ids([match_id]):
+            return True
+        delay = FINISHED_MATCH_RETRY_SECONDS
+        waited = 0
+        while True:
+            if await self.get_match_data(match_id):
+                return True
+            if waited + delay > FINISHED_MATCH_MAX_WAIT_SECONDS:
+                return False
+            print(f"Match {match_id} not available yet, retrying in {delay}s")
+            await asyncio.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, FINISHED_MATCH_MAX_RETRY_SECONDS)
+
+    async def update_database(self, inter: disnake.ApplicationCommandInteraction = None, announce: bool = False, exclude_match_id: str = None, deep_resync: bool = False) -> int:
+        """
+        Fetch and store new matches for every active user.
+
+        Runs as a pipeline: match ids are discovered for all users concurrently, ids shared
+        by several tracked users (premades) are fetched once, payloads are fetched with
+        MATCH_FETCH_CONCURRENCY requests in flight under the rate limiter, and a single
+        writer stores them so SQLite only ever sees one writer.
+
+        With deep_resync the last 1000 matches of every user are checked instead of only
+        the ones since their watermark.
+
+        Every fetch goes through the cycle's MatchFetchRegistry, which is shared with
+        get_match_data and with an update_database call that overlaps this one.
+        """
         users: List[User] = await self.bot.get_cog("DatabaseOperations").get_users(active="TRUE")
+        # Join the running cycle's registry if another update is already in progress
+        owns_registry = self.match_registry is None
+        if owns_registry:
+            self.match_registry = self.MatchFetchRegistry()
+        registry = self.match_registry
+        try:
+            return await self._run_update_cycle(users, registry, inter, announce, deep_resync)
+        finally:
+            if owns_registry:
+                print(f"Update cycle finished, {registry.duplicates_saved} duplicate match fetches saved")
+                self.match_registry = None
+
+    async def _run_update_cycle(self, users: List[User], registry: "RiotAPIOperations.MatchFetchRegistry", inter: disnake.ApplicationCommandInteraction = None, announce: bool = False, deep_resync: bool = False) -> int:
         total_matches_updated = 0
         total_users = len(users)
 
-        def create_progress_bar(current: int, total: int, width: int = 20) -> str:
-            filled = int(width * current / total)
+        def create_progress_bar(current: int, total: int, unit: str = "users", width: int = 20) -> str:
+            filled = int(width * current / total) if total else width
             bar = "█" * filled + "░" * (width - filled)
-            percent = int(100 * current / total)
-            return f"\nProgress: [{bar}] {percent}% ({current}/{total} users)"
+            percent = int(100 * current / total) if total else 100
+            return f"\nProgress: [{bar}] {percent}% ({current}/{total} {unit})"
 
         # Get formatted message for scanning announcement
         formatted_message = await self.bot.get_cog("DataFormatter").format_update_database_scan_message(users)
@@ -329,62 +619,145 @@ class RiotAPIOperations(commands.Cog):
                         description=original_description + create_progress_bar(0, total_users),
                         color=disnake.Color.blue()
                     ))
-        
-        for i, user in enumerate(users, 1):
+
+        async def update_status(title: str, description: str, color: disnake.Color = disnake.Color.blue()):
+            if not announce:
+                return
+            try:
+                if inter:
+                    await inter.edit_original_message(embed=disnake.Embed(title=title, description=description, color=color))
+                elif status_message:
+                    await status_message.edit(embed=disnake.Embed(title=title, description=description, color=color))
+            except Exception as e:
+                print(f"Failed to update database update status: {e}")
+
+        # Phase 1: discover new match ids for all users concurrently
+        discovery_semaphore = asyncio.Semaphore(MATCH_DISCOVERY_CONCURRENCY)
+
+        async def discover(user: User) -> Tuple[User, List[str]]:
             riot_id = f"{user.riot_id_game_name}#{user.riot_id_tagline}"
-            
-            # Update the description to bold the current user
+            async with discovery_semaphore:
+                try:
+                    return user, await self.get_match_ids(user.puuid, deep_fetch=deep_resync)
+                except Exception as e:
+                    print(f"Error 2 processing {riot_id}: {str(e)}")
+                    await self.bot.get_channel(self.bot.botlol_channel_id).send(f"Error processing {riot_id}: {str(e)}")
+                    return user, []
+
+        # match id -> None, keeps discovery order while deduping matches shared by premades
+        pending_match_ids: Dict[str, None] = {}
+        # puuid -> the new match ids found for that user, for advancing watermarks afterwards
+        user_match_ids: Dict[str, List[str]] = {}
+        for i, discovery in enumerate(asyncio.as_completed([discover(user) for user in users]), 1):
+            user, match_ids = await discovery
+            user_match_ids[user.puuid] = match_ids
+            riot_id = f"{user.riot_id_game_name}#{user.riot_id_tagline}"
+            new_ids = [m_id for m_id in match_ids if m_id not in pending_match_ids]
+            pending_match_ids.update(dict.fromkeys(new_ids))
+            registry.duplicates_saved += len(match_ids) - len(new_ids)
+
+            # Update the description to point at the user that just finished
             current_description = original_description.replace(f"• {user.riot_id_game_name}", f"-->{riot_id}")
             current_description += create_progress_bar(i, total_users)
-                
+            if not match_ids:
+                await update_status(f"{riot_id} - No new matches", current_description)
+            else:
+                shared = len(match_ids) - len(new_ids)
+                shared_note = f" ({shared} already queued)" if shared else ""
+                await update_status(f"{riot_id} - Found {len(match_ids)} matches{shared_note}", current_description)
+
+        # Phase 2: fetch payloads concurrently and hand them to a single writer
+        total_matches = len(pending_match_ids)
+        fetch_queue: asyncio.Queue = asyncio.Queue()
+        for m_id in pending_match_ids:
+            fetch_queue.put_nowait(m_id)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=MATCH_WRITE_QUEUE_SIZE)
+        processed = 0
+        last_status_update = 0.0
+
+        async def fetch_worker():
+            while True:
+                try:
+                    m_id = fetch_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                owner, future = registry.claim(m_id)
+                if not owner:
+                    # Stored earlier this cycle or being fetched by another caller
+                    if future is not None:
+                        await asyncio.shield(future)
+                    await write_queue.put((m_id, None, False))
+                    continue
+                try:
+                    match_data = await self.fetch_match_data(m_id)
+                except Exception as e:
+                    print(f"Error fetching match {m_id}: {str(e)}")
+                    match_data = None
+                # Failed fetches still go through the writer so progress counts every match
+                await write_queue.put((m_id, match_data, True))
+
+        async def writer():
+            nonlocal total_matches_updated, processed, last_status_update
+            db_ops = self.bot.get_cog("DatabaseOperations")
+            finished = False
+            while not finished:
+                # Take whatever has queued up (at least one item) and store it as one batch
+                items = [await write_queue.get()]
+                while len(items) < MATCH_WRITE_BATCH_SIZE and not write_queue.empty():
+                    items.append(write_queue.get_nowait())
+                if None in items:
+                    finished = True
+                    items = [item for item in items if item is not None]
+
+                to_store = [match_data for _, match_data, _ in items if match_data]
+                errors: Dict[str, Optional[str]] = {}
+                if to_store:
+                    try:
+                        errors = await db_ops.insert_matches(to_store)
+                    except Exception as e:
+                        errors = {match_data['metadata']['matchId']: str(e) for match_data in to_store}
+
+                for m_id, match_data, owner in items:
+                    stored = bool(match_data) and errors.get(m_id, "not stored") is None
+                    if stored:
+                        total_matches_updated += 1
+                    elif match_data:
+                        print(f"Error storing match {m_id}: {errors.get(m_id)}")
+                        try:
+                            await self.bot.get_channel(self.bot.botlol_channel_id).send(f"Error storing match {m_id}: {errors.get(m_id)}")
+                        except Exception:
+                            pass
+                    if owner:
+                        registry.resolve(m_id, stored, match_data)
+                    processed += 1
+
+                # Throttle embed edits, Discord rate limits message edits too
+                if items and (time.time() - last_status_update >= 2 or processed == total_matches):
+                    last_status_update = time.time()
+                    await update_status(
+                        f"Processing {total_matches} new matches",
+                        final_description + create_progress_bar(processed, total_matches, unit="matches")
+                    )
+
+        if total_matches:
+            writer_task = asyncio.create_task(writer())
+            workers = [asyncio.create_task(fetch_worker()) for _ in range(min(MATCH_FETCH_CONCURRENCY, total_matches))]
             try:
-                match_ids = await self.get_match_ids(user.puuid)
-                
-                if not match_ids:
-                    if announce:
-                        if inter:
-                            await inter.edit_original_message(embed=disnake.Embed(
-                                title=f"{riot_id} - No new matches",
-                                description=current_description,
-                                color=disnake.Color.blue()
-                            ))
-                        elif status_message:
-                            await status_message.edit(embed=disnake.Embed(
-                                title=f"{riot_id} - No new matches",
-                                description=current_description,
-                                color=disnake.Color.blue()
-                            ))
-                else:
-                    # Get formatted message for progress update
-                    progress_message = await self.bot.get_cog("DataFormatter").format_update_database_progress_message(user.riot_id_game_name, len(match_ids))
-                    progress_description = progress_message["description"] + create_progress_bar(i, total_users)
-                    
-                    if announce:
-                        if inter:
-                            await inter.edit_original_message(embed=disnake.Embed(
-                                title=f"{riot_id} - Processing {len(match_ids)} matches",
-                                description=current_description,
-                                color=disnake.Color.blue()
-                            ))
-                        elif status_message:
-                            await status_message.edit(embed=disnake.Embed(
-                                title=f"{riot_id} - Processing {len(match_ids)} matches",
-                                description=current_description,
-                                color=disnake.Color.blue()
-                            ))
-
-                    for m_id in match_ids:
-                        match_data = await self.get_match_data(m_id)
-                        if match_data:
-                            total_matches_updated += 1
-                        
-            except Exception as e:
-                print(f"Error 2 processing {riot_id}: {str(e)}")
-                await self.bot.get_channel(self.bot.botlol_channel_id).send(f"Error processing {riot_id}: {str(e)}")
-                continue
+                await asyncio.gather(*workers)
+                await write_queue.put(None)
+                await writer_task
+            except BaseException:
+                for task in workers + [writer_task]:
+                    task.cancel()
+                raise
+
+        # Phase 3: move the watermarks of users whose matches are stored
+        await self._advance_watermarks(user_match_ids, registry)
         
         # Send final update
         final_description = final_description + create_progress_bar(total_users, total_users)
+        if registry.duplicates_saved:
+            final_description += f"\nShared matches fetched once: {registry.duplicates_saved} duplicate fetches saved"
         final_color = disnake.Color.green() if total_matches_updated > 0 else disnake.Color.red()
         if announce:
             if inter:
@@ -404,6 +777,40 @@ class RiotAPIOperations(commands.Cog):
         
         return total_matches_updated
     
+    @staticmethod
+    def _match_sequence(match_id: str) -> int:
+        """Numeric part of a match id ("EUW1_7012345678"), match ids of a region grow over time."""
+        try:
+            return int(match_id.rsplit("_", 1)[-1])
+        except ValueError:
+            return 0
+
+    async def _advance_watermarks(self, user_match_ids: Dict[str, List[str]], registry: "RiotAPIOperations.MatchFetchRegistry") -> None:
+        """
+        Move each user's watermark up to the end of their newest match stored this cycle.
+        If some of their matches failed to fetch or store, stop at the newest stored match
+        older than the oldest failed one: a player's games don't overlap, so that game ended
+        before the failed one started and the next discovery window still includes it.
+        """
+        db_ops = self.bot.get_cog("DatabaseOperations")
+        stored_ids = {m_id for match_ids in user_match_ids.values() for m_id in match_ids if m_id in registry.completed}
+        game_ends = await db_ops.get_match_end_timestamps(list(stored_ids))
+        watermarks = {}
+        for puuid, match_ids in user_match_ids.items():
+            failed = [m_id for m_id in match_ids if m_id not in registry.completed]
+            if failed:
+                oldest_failed = min(self._match_sequence(m_id) for m_id in failed)
+                candidates = [game_ends[m_id] for m_id in match_ids if m_id in game_ends and self._match_sequence(m_id) < oldest_failed]
+                print(f"{len(failed)} matches of {puuid} were not stored, its watermark stays before them")
+            else:
+                candidates = [game_ends[m_id] for m_id in match_ids if m_id in game_ends]
+            if candidates:
+                watermarks[puuid] = max(candidates)
+        try:
+            await db_ops.advance_user_watermarks(watermarks)
+        except Exception as e:
+            print(f"Error advancing user watermarks: {e}")
+
     async def _clean_gamedata_directory(self) -> Tuple[bool, Optional[str]]:
         """Cleans the gamedata directory. Returns (success, error_msg)."""
         import shutil
@@ -424,21 +831,22 @@ class RiotAPIOperations(commands.Cog):
     async def _download_gamedata_archive(self, version: str) -> Tuple[bool, Optional[str]]:
         """Downloads the game data archive. Returns (success, error_msg)."""
         import aiofiles
-        import aiohttp
         gamedata_path = Path(__file__).parent.parent / 'assets' / 'gamedata'
         url = f"https://ddragon.leagueoflegends.com/cdn/dragontail-{version}.tgz"
         tgz_path = gamedata_path / f"dragontail-{version}.tgz"
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        async with aiofiles.open(tgz_path, 'wb') as f:
-                            await f.write(await response.read())
-                    else:
-                        error_msg = f"Failed to download game data archive. Status: {response.status}"
-                        print(error_msg)
-                        return False, error_msg
+            # The archive is large, so lift the session's default total timeout for this call
+            download_timeout = aiohttp.ClientTimeout(total=None, connect=10, sock_read=60)
+            async with self.get_session().get(url, timeout=download_timeout) as response:
+                if response.status == 200:
+                    async with aiofiles.open(tgz_path, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(1024 * 1024):
+                            await f.write(chunk)
+                else:
+                    error_msg = f"Failed to download game data archive. Status: {response.status}"
+                    print(error_msg)
+                    return False, error_msg
         except aiohttp.ClientConnectorError as e:
             error_msg = f"Network error during download: {str(e)}"
             print(f"Network error downloading archive: {e}")
@@ -463,6 +871,24 @@ class RiotAPIOperations(commands.Cog):
              return False, error_msg
         return True, None
         
+    async def _write_gamedata_manifest(self, version: str) -> Tuple[bool, Optional[str]]:
+        """Index the extracted images into the asset manifest CardGenerator loads. Returns (success, error_msg)."""
+        import json
+        gamedata_path = Path(__file__).parent.parent / 'assets' / 'gamedata'
+
+        def write():
+            manifest = build_asset_manifest(str(gamedata_path), version)
+            with open(gamedata_path / ASSET_MANIFEST_FILE, 'w') as f:
+                json.dump(manifest, f, separators=(',', ':'))
+
+        try:
+            await asyncio.to_thread(write)
+        except Exception as e:
+             error_msg = f"Error writing game data manifest: {str(e)}"
+             print(error_msg)
+             return False, error_msg
+        return True, None
+
     async def _cleanup_gamedata_archive(self, version: str) -> Tuple[bool, Optional[str]]:
         """Deletes the downloaded tgz file. Returns (success, error_msg)."""
         gamedata_path = Path(__file__).parent.parent / 'assets' / 'gamedata'
@@ -563,6 +989,16 @@ class RiotAPIOperations(commands.Cog):
             status_embed.color = disnake.Color.red()
             await inter.edit_original_message(embed=status_embed)
             return 0
+        success, error_msg = await self._write_gamedata_manifest(latest_version)
+        if not success:
+            # CardGenerator indexes the files itself when the manifest is missing
+            status_embed.description = await data_formatter.format_apply_update_steps(step_index, error=error_msg + " (Continuing anyway)")
+            await inter.edit_original_message(embed=status_embed)
+
+        # Cached card images and the game data manifest belong to the old game data
+        card_generator = self.bot.get_cog("CardGenerator")
+        if card_generator:
+            card_generator.invalidate_assets()
             
         # --- Step 4: Cleanup Archive --- 
         step_index = 4
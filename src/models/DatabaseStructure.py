@@ -59,7 +59,8 @@ CREATE TABLE matches (
         map_id INTEGER,
         platform_id TEXT,
         queue_id INTEGER,
-        tournament_code TEXT
+        tournament_code TEXT,
+        game_mode_norm TEXT  -- normalize_key(game_mode), compared instead of LOWER(game_mode)
     )
 
 CREATE TABLE participants (
@@ -244,6 +245,8 @@ CREATE TABLE participants (
         player_score9 INTEGER,
         player_score10 INTEGER,
         player_score11 INTEGER,
+        riot_id_game_name_norm TEXT,  -- normalize_key(riot_id_game_name)
+        champion_name_norm TEXT,  -- normalize_key(champion_name)
         
         FOREIGN KEY (match_id) REFERENCES matches (match_id),
         UNIQUE(match_id, puuid)
@@ -464,12 +467,103 @@ CREATE TABLE perk_selections (
         FOREIGN KEY (perk_style_id) REFERENCES perk_styles (id)
     );
 
-CREATE TABLE pending_matches (
-    match_id TEXT PRIMARY KEY,
-    game_mode TEXT NOT NULL,
-    channel_id INTEGER NOT NULL,
-    message_id INTEGER NOT NULL,
-    attempts INTEGER DEFAULT 0,
+-- Durable job queue (DatabaseOperations.enqueue_job / claim_jobs), e.g. pending_match jobs
+CREATE TABLE jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_type TEXT NOT NULL,
+    job_key TEXT NOT NULL,
+    payload TEXT NOT NULL,  -- JSON
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_run_at REAL NOT NULL,  -- Epoch seconds, end of the lease while claimed
+    lease_token TEXT,  -- Set while a worker holds the job
+    last_error TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-); """
+    last_attempt_at TIMESTAMP,
+    UNIQUE (job_type, job_key)
+);
+
+CREATE TABLE user_watermarks (
+    puuid TEXT PRIMARY KEY,
+    last_game_end_timestamp INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE match_payloads (
+    match_id TEXT PRIMARY KEY,
+    compression TEXT NOT NULL DEFAULT 'zlib',  -- raw match-v5 JSON, compressed
+    payload BLOB NOT NULL,
+    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Applied versions of DatabaseOperations.MIGRATIONS
+CREATE TABLE schema_migrations (
+    version INTEGER PRIMARY KEY,
+    description TEXT,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per (name, mode, year, champion, puuid) running totals behind get_player_stats,
+-- updated with every match write. *_sum / *_n pairs are the numerator and non-NULL count of an AVG()
+CREATE TABLE player_champion_mode_agg (
+    riot_name TEXT NOT NULL,  -- participants.riot_id_game_name_norm
+    game_mode TEXT NOT NULL,  -- matches.game_mode_norm
+    year TEXT NOT NULL,  -- strftime('%Y', game_creation)
+    champion_name TEXT NOT NULL,
+    champion_name_norm TEXT NOT NULL,  -- participants.champion_name_norm
+    puuid TEXT NOT NULL,
+    games INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    duration_sum INTEGER NOT NULL DEFAULT 0,
+    triples INTEGER NOT NULL DEFAULT 0,
+    quadras INTEGER NOT NULL DEFAULT 0,
+    pentas INTEGER NOT NULL DEFAULT 0,
+    first_bloods INTEGER NOT NULL DEFAULT 0,
+    objectives INTEGER NOT NULL DEFAULT 0,
+    first_places INTEGER NOT NULL DEFAULT 0,
+    dpm_sum REAL NOT NULL DEFAULT 0,
+    dpm_n INTEGER NOT NULL DEFAULT 0,
+    kda_sum REAL NOT NULL DEFAULT 0,
+    kda_n INTEGER NOT NULL DEFAULT 0,
+    time_dead_pct_sum REAL NOT NULL DEFAULT 0,
+    time_dead_pct_n INTEGER NOT NULL DEFAULT 0,
+    vision_sum REAL NOT NULL DEFAULT 0,
+    vision_n INTEGER NOT NULL DEFAULT 0,
+    kp_sum REAL NOT NULL DEFAULT 0,
+    kp_n INTEGER NOT NULL DEFAULT 0,
+    damage_taken_pm_sum REAL NOT NULL DEFAULT 0,
+    damage_taken_pm_n INTEGER NOT NULL DEFAULT 0,
+    gold_pm_sum REAL NOT NULL DEFAULT 0,
+    gold_pm_n INTEGER NOT NULL DEFAULT 0,
+    cs_pm_sum REAL NOT NULL DEFAULT 0,
+    cs_pm_n INTEGER NOT NULL DEFAULT 0,
+    placement_sum REAL NOT NULL DEFAULT 0,
+    placement_n INTEGER NOT NULL DEFAULT 0,
+    oldest_game,
+    max_killing_spree INTEGER,
+    max_killing_spree_match TEXT,  -- earliest match_id reaching the maximum
+    max_kda,
+    max_kda_match TEXT,
+    latest_game,  -- game_creation, summoner_level and profile_icon of the most recent game
+    latest_summoner_level INTEGER,
+    latest_profile_icon INTEGER,
+    PRIMARY KEY (riot_name, game_mode, year, champion_name, champion_name_norm, puuid)
+);
+
+-- Indexes (migrations 4, 5, 6 and 7)
+CREATE INDEX idx_participants_name_norm ON participants (riot_id_game_name_norm, match_id);
+CREATE INDEX idx_participants_puuid_match ON participants (puuid, match_id);
+CREATE INDEX idx_participants_champion_norm ON participants (champion_name_norm, match_id);
+CREATE INDEX idx_matches_mode_norm_end ON matches (game_mode_norm, game_end);
+CREATE INDEX idx_matches_game_creation ON matches (game_creation);
+CREATE INDEX idx_matches_remakes ON matches (game_duration) WHERE game_duration = 0;
+CREATE INDEX idx_bans_match ON bans (match_id);
+CREATE INDEX idx_objectives_match ON objectives (match_id);
+CREATE INDEX idx_challenges_match ON challenges (match_id);
+CREATE INDEX idx_perks_match ON perks (match_id);
+CREATE INDEX idx_perk_styles_perk ON perk_styles (perk_id);
+CREATE INDEX idx_perk_selections_style ON perk_selections (perk_style_id);
+CREATE INDEX idx_users_puuid ON users (puuid);
+CREATE INDEX idx_users_guild ON users (guild_id);
+CREATE INDEX idx_jobs_next_run ON jobs (next_run_at);
+CREATE INDEX idx_player_agg_puuid ON player_champion_mode_agg (puuid, game_mode); """
@@ -433,6 +433,13 @@ class Champion:
     stats_attackspeedperlevel: float
     stats_attackspeed: float
 
+@dataclass
+class ChampionRef:
+    id: int  # Numeric key, as in spectator and match data
+    key: str  # Data Dragon id, e.g. "MonkeyKing"
+    name: str  # Display name, e.g. "Wukong"
+    image: str  # e.g. "MonkeyKing.png"
+
 @dataclass
 class PlayerStats:
     def __init__(self, champion_name: str, champion_games: int, winrate: float, avg_damage_per_minute: float,
@@ -502,4 +509,14 @@ class PendingMatch:
     message_id: int
     attempts: int
     created_at: str
-    last_attempt: str 
\ No newline at end of file
+    last_attempt: str 
+
+@dataclass
+class Job:
+    id: int
+    job_type: str
+    job_key: str
+    payload: dict
+    attempts: int  # Including the current run
+    max_attempts: int
+    lease_token: str
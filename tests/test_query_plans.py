@@ -0,0 +1,161 @@
+"""
+EXPLAIN QUERY PLAN regression test: every query DatabaseOperations runs against a migrated
+database searches participants, matches and the other per-match tables through an index
+instead of scanning them.
+
+The writer and the read pool each open their own connection, so the database is a temp
+file rather than :memory:. Run from the repository root:
+    python -m unittest tests.test_query_plans
+"""
+import asyncio
+import os
+import re
+import sqlite3
+import tempfile
+import unittest
+from types import SimpleNamespace
+from src.cogs.DatabaseOperations import DatabaseOperations
+from src.models import DatabaseStructure
+
+PLAYER_NAME = "Plan Player"
+PLAYER_PUUID = "plan-player"
+
+# Small tables a full scan is fine for
+SMALL_TABLES = {"users", "champions"}
+# Reports over every row on purpose, by call name
+WHOLE_TABLE_READS = {
+    "get_all_players_stats": {"participants"},  # Ranks every player
+    "get_match_count": {"matches"},
+    "get_most_played_champions": {"player_champion_mode_agg"},  # Ranks every champion
+}
+PLANNED_STATEMENTS = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+TABLE_ALIAS = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+
+def make_match(number: int, puuids: list, game_mode: str = "ARAM") -> dict:
+    game_creation = 1700000000000 + number * 3600000
+    return {
+        "metadata": {"matchId": f"EUW1_{number}", "dataVersion": "2", "participants": puuids},
+        "info": {
+            "gameMode": game_mode, "gameDuration": 1200, "queueId": 450,
+            "gameCreation": game_creation, "gameStartTimestamp": game_creation,
+            "gameEndTimestamp": game_creation + 1200000,
+            "participants": [{
+                "puuid": puuid, "participantId": i + 1, "teamId": 100 if i < 5 else 200, "win": i < 5,
+                "riotIdGameName": PLAYER_NAME if puuid == PLAYER_PUUID else puuid, "riotIdTagline": "EUW",
+                "championName": ["Ahri", "Lux", "Jinx"][(number + i) % 3], "championId": 1,
+                "kills": i, "deaths": number % 4, "assists": 3, "totalDamageDealtToChampions": 20000,
+                "placement": i + 1 if game_mode == "CHERRY" else 0,
+                "challenges": {"killParticipation": 0.5},
+            } for i, puuid in enumerate(puuids)],
+        },
+    }
+
+class QueryPlanTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "plans.db")
+        conn = sqlite3.connect(self.db_path)
+        for statement in re.split(r"(?=CREATE (?:TABLE|INDEX))", DatabaseStructure.__doc__):
+            if statement.strip():
+                conn.execute(statement.strip().rstrip(";"))
+        conn.execute(
+            "INSERT INTO users (username, puuid, riot_id_game_name, riot_id_tagline, guild_id, active) VALUES (?, ?, ?, ?, ?, ?)",
+            ("plan", PLAYER_PUUID, PLAYER_NAME, "EUW", "1", "TRUE")
+        )
+        conn.commit()
+        conn.close()
+
+        self.db = DatabaseOperations(SimpleNamespace())
+        self.db.db_path = self.db.writer.db_path = self.db.readers.db_path = self.db_path
+        # Record every statement with its parameters inlined, both open their connection on first use
+        self.statements = []
+        def traced(connect):
+            def wrapper():
+                conn = connect()
+                conn.set_trace_callback(self.statements.append)
+                return conn
+            return wrapper
+        self.db.readers._connection = traced(self.db.readers._connection)
+        self.db.writer._connect = traced(self.db.writer._connect)
+
+        await self.db.cog_load()
+        await self.db.insert_matches([
+            make_match(number, [PLAYER_PUUID] + [f"player-{(number + i) % 30}" for i in range(9)],
+                       "CHERRY" if number % 5 == 0 else "ARAM")
+            for number in range(60)
+        ])
+
+    async def asyncTearDown(self):
+        self.db.cog_unload()
+        await asyncio.sleep(0.1)  # Let the writer thread close its connection
+        self.tmp.cleanup()
+
+    def full_scans(self, statement: str, allowed: set) -> list:
+        """Plan lines that scan a per-match table, with or without an index, instead of searching it."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            aliases = {}
+            for table, alias in TABLE_ALIAS.findall(statement):
+                aliases[table] = table
+                if alias:
+                    aliases[alias] = table
+            scans = []
+            for row in conn.execute("EXPLAIN QUERY PLAN " + statement):
+                detail = row[3]
+                match = re.match(r"SCAN (\w+)", detail)
+                if not match:
+                    continue
+                table = aliases.get(match.group(1), match.group(1))
+                if table in tables and table not in SMALL_TABLES | allowed:
+                    scans.append(detail)
+            return scans
+        finally:
+            conn.close()
+
+    async def test_queries_use_indexes(self):
+        db = self.db
+        calls = [
+            ("get_player_stats", lambda: db.get_player_stats(PLAYER_NAME, "ARAM")),
+            ("get_player_stats champion year", lambda: db.get_player_stats(PLAYER_NAME, "aram", champion="AHRI", year=2023)),
+            ("get_player_stats untracked", lambda: db.get_player_stats("player-3", "ARAM")),
+            ("get_all_players_stats", lambda: db.get_all_players_stats()),
+            ("get_player_friend_stats", lambda: db.get_player_friend_stats(PLAYER_NAME)),
+            ("get_stored_match_ids", lambda: db.get_stored_match_ids(PLAYER_PUUID)),
+            ("get_existing_match_ids", lambda: db.get_existing_match_ids(["EUW1_1", "EUW1_2"])),
+            ("get_user_watermark", lambda: db.get_user_watermark(PLAYER_PUUID)),
+            ("advance_user_watermarks", lambda: db.advance_user_watermarks({PLAYER_PUUID: 1700000000000})),
+            ("get_match_end_timestamps", lambda: db.get_match_end_timestamps(["EUW1_1"])),
+            ("get_player_match_ids", lambda: db.get_player_match_ids(PLAYER_NAME, "ARAM", 10, "2023-01-01", "2030-01-01")),
+            ("get_player_match_ids all modes", lambda: db.get_player_match_ids(PLAYER_NAME)),
+            ("get_match_count", lambda: db.get_match_count()),
+            ("get_users", lambda: db.get_users("1", True)),
+            ("get_match_payload", lambda: db.get_match_payload("EUW1_1")),
+            ("get_play_time_profiles", lambda: db.get_play_time_profiles([PLAYER_PUUID], 90)),
+            ("get_most_played_champions", lambda: db.get_most_played_champions(10)),
+            ("get_match_info", lambda: db.get_match_info("EUW1_1")),
+            ("get_match_participants", lambda: db.get_match_participants("EUW1_1")),
+            ("get_champion_global_stats", lambda: db.get_champion_global_stats("Ahri", "ARAM")),
+            ("get_leaderboard_kda", lambda: db.get_leaderboard_kda("ARAM", 1)),
+            ("get_leaderboard_winrate", lambda: db.get_leaderboard_winrate("ARAM", 1, "Monthly")),
+            ("get_leaderboard_dpm", lambda: db.get_leaderboard_dpm("ARAM", 1, "Yearly")),
+            ("insert_matches", lambda: db.insert_matches([make_match(100, [PLAYER_PUUID] + [f"player-{i}" for i in range(9)])])),
+            ("update_user", lambda: db.update_user("plan", last_game_played="2024-01-01")),
+            ("add_pending_match", lambda: db.add_pending_match("EUW1_200", "CHERRY", 1, 2)),
+            ("retry_pending_match_now", lambda: db.retry_pending_match_now("EUW1_200")),
+            ("get_pending_matches", lambda: db.get_pending_matches()),
+            ("get_next_job_time", lambda: db.get_next_job_time()),
+            ("remove_pending_match", lambda: db.remove_pending_match("EUW1_200")),
+        ]
+        for name, call in calls:
+            self.statements.clear()
+            await call()
+            statements = [s for s in self.statements if s.lstrip().upper().startswith(PLANNED_STATEMENTS)]
+            self.assertTrue(statements, f"{name} ran no query")
+            allowed = WHOLE_TABLE_READS.get(name.split()[0], set())
+            for statement in statements:
+                with self.subTest(call=name, query=" ".join(statement.split())[:120]):
+                    self.assertEqual(self.full_scans(statement, allowed), [])
+
+if __name__ == "__main__":
+    unittest.main()